@@ -0,0 +1,117 @@
+import argparse
+import sys
+
+from app.core.config import settings
+from app.db import log_partitions
+from app.db.migrations import VERSAO, migrar, pendentes
+from app.db.seed import criar_admin
+from app.db.session import SessionLocal, WriterSessionLocal, engine
+from app.models import models  # noqa: F401 (register models)
+from app.models.models import now_br
+from app.services.estoque_service import rebuild_saldos, verificar_saldos
+from app.services.log_service import purgar_logs
+from app.services.vendas_service import rebuild_vendas_dia
+
+def cmd_migrate(args) -> int:
+    if args.check:
+        faltando = pendentes(engine)
+        for versao, descricao in faltando:
+            print(f"pendente {versao}: {descricao}")
+        if faltando:
+            return 1
+        print(f"esquema na versao {VERSAO}")
+        return 0
+    aplicadas = migrar(engine)
+    for m in aplicadas:
+        print(f"aplicada {m['versao']}: {m['descricao']} ({m['ms']} ms)")
+    print(f"esquema na versao {VERSAO}" + ("" if aplicadas else " (nada a aplicar)"))
+    return 0
+
+def cmd_seed_admin(args) -> int:
+    db = WriterSessionLocal()
+    try:
+        if criar_admin(db):
+            print(f"admin '{settings.SEED_ADMIN_USERNAME}' criado")
+        else:
+            print(f"admin '{settings.SEED_ADMIN_USERNAME}' ja existe")
+        return 0
+    finally:
+        db.close()
+
+def cmd_saldos_rebuild(args) -> int:
+    db = WriterSessionLocal()
+    try:
+        n = rebuild_saldos(db)
+        db.commit()
+        print(f"saldos recalculados: {n} produtos")
+        return 0
+    finally:
+        db.close()
+
+def cmd_saldos_verify(args) -> int:
+    db = SessionLocal()
+    try:
+        divergencias = verificar_saldos(db)
+        for d in divergencias:
+            print(
+                f"produto={d['id_produto']} ledger={d['saldo_ledger']} ({d['qtd_movs_ledger']} movs) "
+                f"materializado={d['saldo_materializado']} ({d['qtd_movs_materializado']} movs)"
+            )
+        if divergencias:
+            print(f"{len(divergencias)} divergencias encontradas (rode saldos-rebuild)")
+            return 1
+        print("saldos ok")
+        return 0
+    finally:
+        db.close()
+
+def cmd_vendas_rebuild(args) -> int:
+    db = WriterSessionLocal()
+    try:
+        n = rebuild_vendas_dia(db)
+        db.commit()
+        print(f"rollups de vendas recalculados: {n} comandas")
+        return 0
+    finally:
+        db.close()
+
+def cmd_logs_purge(args) -> int:
+    r = purgar_logs(dias=args.dias, lote=args.lote)
+    print(f"logs anteriores a {r['limite']:%Y-%m-%d %H:%M}: {r['removidos']} removidos")
+    for nome in r["particoes_removidas"]:
+        print(f"particao removida: {nome}")
+    return 0
+
+def cmd_logs_particionar(args) -> int:
+    if not log_partitions.suportado(engine):
+        print("particionamento de logs so e suportado no Postgres")
+        return 1
+    if log_partitions.particionar_logs(engine, now_br().date()):
+        print("tabela logs convertida para particionada por mes")
+    else:
+        print("tabela logs ja e particionada")
+    return 0
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Comandos de manutencao do Bar Control.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("migrate", help="Aplica as migracoes pendentes do esquema.")
+    p.add_argument("--check", action="store_true", help="so lista as pendentes (exit 1 se houver)")
+    p.set_defaults(func=cmd_migrate)
+    sub.add_parser("seed-admin", help="Cria o admin do seed (SEED_ADMIN_*) se nao existir.").set_defaults(func=cmd_seed_admin)
+    sub.add_parser("saldos-rebuild", help="Recalcula a tabela saldos_estoque a partir do ledger.").set_defaults(func=cmd_saldos_rebuild)
+    sub.add_parser("saldos-verify", help="Compara saldos_estoque com o ledger (exit 1 se divergir).").set_defaults(func=cmd_saldos_verify)
+    sub.add_parser("vendas-rebuild", help="Recalcula os rollups diarios de vendas das comandas.").set_defaults(func=cmd_vendas_rebuild)
+
+    p = sub.add_parser("logs-purge", help="Aplica a retencao de logs (LOG_RETENTION_DAYS) agora.")
+    p.add_argument("--dias", type=int, default=None)
+    p.add_argument("--lote", type=int, default=None)
+    p.set_defaults(func=cmd_logs_purge)
+    sub.add_parser("logs-particionar", help="Converte a tabela logs em particionada por mes (Postgres).").set_defaults(func=cmd_logs_particionar)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,12 +5,69 @@ class Settings(BaseSettings):
 
     # Default to sqlite for local dev; override via .env for Postgres.
     DATABASE_URL: str = "sqlite:///./bar_control.db"
+    # Pool de conexoes. DB_PRE_PING: always (ping a cada checkout) | idle (so conexoes
+    # paradas ha mais de DB_PRE_PING_IDLE_S) | never.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE_S: int = 1800
+    DB_POOL_TIMEOUT_S: float = 30
+    DB_PRE_PING: str = "idle"
+    DB_PRE_PING_IDLE_S: float = 30
+    # /health/ready responde 503 acima desta fracao do pool em uso.
+    DB_READY_MAX_SATURACAO: float = 0.9
+    # Conexoes abertas no boot, antes do primeiro request (limitado a DB_POOL_SIZE).
+    DB_POOL_PREFILL: int = 2
+    # Esquema: em producao `python -m app.cli migrate` roda antes dos workers e o boot so confere
+    # a versao. AUTO_MIGRATE=true (dev) migra e cria o admin do seed ao subir.
+    AUTO_MIGRATE: bool = False
+    # Perfil SQLite (ignorado no Postgres).
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_MB: int = 256
+    SQLITE_SINGLE_WRITER: bool = True
     JWT_SECRET: str = "CHANGE_ME"
     JWT_ALG: str = "HS256"
     JWT_EXPIRES_MIN: int = 720  # 12h
     LOG_RETENTION_DAYS: int = 180
+    # Retencao aplicada por uma thread a cada LOG_PURGE_INTERVAL_MIN (0 desliga), em lotes.
+    LOG_PURGE_INTERVAL_MIN: int = 1440
+    LOG_PURGE_BATCH: int = 5000
+    # Log de auditoria em buffer: gravado em lote por uma thread, fora da transacao do request.
+    LOG_BUFFERED: bool = False
+    LOG_BUFFER_MAX: int = 10000
+    LOG_FLUSH_MS: int = 500
+    LOG_FLUSH_BATCH: int = 200
+    # bcrypt num pool dedicado (thread|process) com fila limitada; custo configuravel
+    # (hashes com outro custo sao refeitos no proximo login).
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_POOL: str = "thread"
+    BCRYPT_WORKERS: int = 2
+    BCRYPT_MAX_FILA: int = 32
+    # Throttling de login por usuario e por IP (0 desliga).
+    LOGIN_MAX_FALHAS: int = 5
+    LOGIN_MAX_FALHAS_IP: int = 30
+    LOGIN_JANELA_S: int = 300
+    # Cache de usuarios do get_current_user (0 desliga).
+    USER_CACHE_MAX: int = 1000
+    USER_CACHE_TTL_S: int = 60
+    # /metrics (Prometheus); vazio = sem autenticacao.
+    METRICS_TOKEN: str = ""
+    # Orcamento de queries por request (dev/testes): off | log | raise. QUERY_REPETIDAS_MAX
+    # e o limite de repeticoes da mesma statement num request (detector de N+1; 0 desliga).
+    QUERY_BUDGET_MODE: str = "off"
+    QUERY_REPETIDAS_MAX: int = 5
+    # Hora (0-23) em que vira o dia de negocio dos rollups de vendas: com 6, o que se vende
+    # ate as 05:59 conta no dia anterior (bar que fecha de madrugada).
+    DIA_NEGOCIO_CORTE_H: int = 0
     CORS_ORIGINS: str = "http://localhost:5173"
 
+    # Feed de mudancas (/eventos/ws): intervalo de leitura da outbox e retencao.
+    EVENTOS_POLL_MS: int = 500
+    # Postgres: NOTIFY no commit acorda o feed dos outros workers sem esperar o poll.
+    EVENTOS_NOTIFY: bool = True
+    EVENTOS_RETENCAO_MIN: int = 60
+
     SEED_ADMIN_USERNAME: str = "admin"
     SEED_ADMIN_PASSWORD: str = "admin123"
     SEED_ADMIN_NAME: str = "Administrador"
@@ -0,0 +1,242 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Contagem
+from contextvars import ContextVar
+
+from app.core import query_budget
+
+# Registro minimo de metricas no formato texto do Prometheus, sem dependencia externa.
+# Valores por processo: com varios workers, cada um expoe os seus.
+
+def _escapar(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(nomes: tuple[str, ...], valores: tuple, le: str | None = None) -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if le is not None:
+        partes.append(f'le="{le}"')
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple[str, ...] = (), coletar=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._valores: dict[tuple, object] = {}
+        self._coletar = coletar  # callable -> {tupla de labels: valor}, lido na hora do scrape
+
+    def _itens(self) -> list[tuple]:
+        if self._coletar:
+            return list(self._coletar().items())
+        with self._lock:
+            return list(self._valores.items())
+
+    def _chave(self, labels: dict | None) -> tuple:
+        labels = labels or {}
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def cabecalho(self) -> list[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def render(self) -> list[str]:
+        return self.cabecalho() + [f"{self.nome}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in self._itens()]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def set(self, valor: float, **labels):
+        with self._lock:
+            self._valores[self._chave(labels)] = valor
+
+    def inc(self, valor: float = 1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **labels):
+        self.inc(-valor, **labels)
+
+    def render(self) -> list[str]:
+        return self.cabecalho() + [f"{self.nome}{_fmt_labels(self.labels, k)} {_fmt_num(v)}" for k, v in self._itens()]
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple[str, ...] = (), buckets=None):
+        super().__init__(nome, ajuda, labels)
+        self.buckets = tuple(buckets or self.BUCKETS)
+
+    def observe(self, valor: float, **labels):
+        chave = self._chave(labels)
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            dados = self._valores.get(chave)
+            if dados is None:
+                dados = self._valores[chave] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                dados[0][i] += 1
+            dados[1] += valor
+            dados[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            itens = [(k, (list(d[0]), d[1], d[2])) for k, d in self._valores.items()]
+        linhas = self.cabecalho()
+        for chave, (contagens, soma, total) in itens:
+            acumulado = 0
+            for limite, n in zip(self.buckets, contagens):
+                acumulado += n
+                linhas.append(f"{self.nome}_bucket{_fmt_labels(self.labels, chave, _fmt_num(float(limite)))} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_fmt_labels(self.labels, chave, '+Inf')} {total}")
+            linhas.append(f"{self.nome}_sum{_fmt_labels(self.labels, chave)} {_fmt_num(soma)}")
+            linhas.append(f"{self.nome}_count{_fmt_labels(self.labels, chave)} {total}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas: list[_Metrica] = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.registrar(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.registrar(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.registrar(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        linhas = []
+        for m in self._metricas:
+            linhas.extend(m.render())
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+# HTTP
+http_requests = registro.counter("http_requests_total", "Requests HTTP por rota e status.", ("method", "route", "status"))
+http_duracao = registro.histogram("http_request_duration_seconds", "Latencia dos requests HTTP.", ("method", "route"))
+http_em_andamento = registro.gauge("http_requests_in_flight", "Requests HTTP em andamento.")
+
+# Banco, por request
+db_queries = registro.counter("db_queries_total", "Queries SQL executadas.")
+db_queries_por_request = registro.histogram(
+    "db_queries_per_request", "Queries SQL por request.", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+db_tempo_por_request = registro.histogram("db_time_per_request_seconds", "Tempo em SQL por request.", ("route",))
+db_espera_lock = registro.histogram("db_lock_wait_seconds", "Espera por locks da aplicacao (escritor unico do SQLite).", ("lock",))
+
+# Processo
+startup_duracao = registro.gauge("app_startup_seconds", "Duracao de cada etapa do startup do worker.", ("etapa",))
+
+# Negocio (so transacoes confirmadas)
+itens_vendidos = registro.counter("bar_itens_vendidos_total", "Quantidade de itens vendidos.", ("canal",))
+valor_vendido = registro.counter("bar_valor_vendido_total", "Valor vendido (R$).", ("canal",))
+vendas_balcao = registro.counter("bar_vendas_balcao_total", "Vendas de balcao concluidas.")
+comandas_finalizadas = registro.counter("bar_comandas_finalizadas_total", "Comandas finalizadas.")
+
+
+class EstatisticasRequest:
+    __slots__ = ("queries", "tempo_db", "formas", "produtos")
+
+    def __init__(self, formas: bool = False):
+        self.queries = 0
+        self.tempo_db = 0.0
+        # Maior lote de produtos do request (query_budget.produtos_no_request).
+        self.produtos = 0
+        # Contagem por forma de statement, so com o orcamento de queries ligado.
+        self.formas: _Contagem | None = _Contagem() if formas else None
+
+# Preenchida pelo middleware; os hooks do SQLAlchemy somam nela (o contexto e copiado para
+# o threadpool, mas o objeto e o mesmo).
+request_stats: ContextVar[EstatisticasRequest | None] = ContextVar("request_stats", default=None)
+
+def registrar_query(segundos: float, statement: str | None = None):
+    db_queries.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.tempo_db += segundos
+        if stats.formas is not None and statement is not None:
+            stats.formas[query_budget.forma(statement)] += 1
+
+def instrumentar_sql(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_inicio"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info.pop("query_inicio", None)
+        if inicio is not None:
+            registrar_query(time.perf_counter() - inicio, statement)
+
+
+class MetricsMiddleware:
+    # Middleware ASGI puro (funciona com StreamingResponse). A rota e o template
+    # (/comandas/{id_comanda}/itens), nunca o path cru, para nao explodir a cardinalidade.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        stats = EstatisticasRequest(formas=query_budget.modo() != "off")
+        token = request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_em_andamento.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duracao = time.perf_counter() - inicio
+            http_em_andamento.dec()
+            request_stats.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "__sem_rota__"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=template, status=status["code"])
+            http_duracao.observe(duracao, method=method, route=template)
+            db_queries_por_request.observe(stats.queries, route=template)
+            db_tempo_por_request.observe(stats.tempo_db, route=template)
+            # Em modo raise a resposta ja foi enviada; o erro chega ao TestClient/log do servidor.
+            query_budget.verificar(route, template, stats.queries, stats.formas, stats.produtos)
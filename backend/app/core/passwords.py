@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+# bcrypt fora das threads que atendem requests: um pool dedicado e limitado (threads, ja
+# que o bcrypt libera o GIL, ou processos com BCRYPT_POOL=process) com fila maxima.
+# min/max_rounds iguais ao custo configurado fazem needs_update() acusar hashes antigos.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+class PoolSaturado(Exception):
+    pass
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+class PoolSenhas:
+    def __init__(self, workers: int, max_fila: int, tipo: str):
+        self.workers = workers
+        self.max_fila = max_fila
+        self.tipo = tipo
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self.rejeitados = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.tipo == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pendentes >= self.max_fila:
+                self.rejeitados += 1
+                raise PoolSaturado()
+            self._pendentes += 1
+        try:
+            fut = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._liberar(None)
+            raise
+        fut.add_done_callback(self._liberar)
+        return fut
+
+    def _liberar(self, _fut):
+        with self._lock:
+            self._pendentes -= 1
+
+    def executar(self, fn, *args):
+        return self._submit(fn, *args).result()
+
+    async def executar_async(self, fn, *args):
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tipo": self.tipo,
+                "workers": self.workers,
+                "pendentes": self._pendentes,
+                "max_fila": self.max_fila,
+                "rejeitados": self.rejeitados,
+            }
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool_senhas = PoolSenhas(settings.BCRYPT_WORKERS, settings.BCRYPT_MAX_FILA, settings.BCRYPT_POOL)
+
+def hash_password(password: str) -> str:
+    return pool_senhas.executar(_hash, password)
+
+def verify_password(password: str, hashed: str) -> bool:
+    return pool_senhas.executar(_verify, password, hashed)
+
+async def hash_password_async(password: str) -> str:
+    return await pool_senhas.executar_async(_hash, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await pool_senhas.executar_async(_verify, password, hashed)
+
+def precisa_rehash(hashed: str) -> bool:
+    return pwd_context.needs_update(hashed)
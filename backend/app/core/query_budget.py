@@ -0,0 +1,123 @@
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Orcamento de queries por rota. Com QUERY_BUDGET_MODE=log|raise cada request guarda
+# as formas das statements executadas; ao final, compara com o orcamento declarado na
+# rota (@orcamento_queries) e com QUERY_REPETIDAS_MAX, o detector de N+1: a mesma
+# statement repetida muitas vezes num request quase sempre e um loop de db.get/select.
+
+MODOS = ("off", "log", "raise")
+
+_IN_LISTA = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)")
+_NUMERO = re.compile(r"\b\d+\b")
+_ESPACOS = re.compile(r"\s+")
+
+
+class OrcamentoExcedido(AssertionError):
+    pass
+
+
+def modo() -> str:
+    m = settings.QUERY_BUDGET_MODE.lower()
+    return m if m in MODOS else "off"
+
+def forma(statement: str) -> str:
+    # Normaliza a statement para agrupar execucoes equivalentes: listas de IN de qualquer
+    # tamanho, literais numericos e espacos viram a mesma forma.
+    s = _ESPACOS.sub(" ", statement).strip()
+    s = _IN_LISTA.sub("(?)", s)
+    return _NUMERO.sub("N", s)
+
+def orcamento_queries(maximo: int | None = None, repetidas: int | None = None, por_produto: int = 0):
+    # Declara quantas queries a rota pode fazer por request (dependencias incluidas) e,
+    # opcionalmente, quantas vezes a mesma statement pode se repetir (0 desliga o detector
+    # na rota). Rotas em lote, que fazem statements por produto de proposito, declaram
+    # por_produto: o maximo cresce por_produto queries a cada produto do request e cada
+    # forma pode se repetir uma vez por produto (ver produtos_no_request). Nao embrulha a
+    # funcao: so anota, entao a assinatura que o FastAPI le continua a mesma.
+    def decorar(fn):
+        fn.orcamento_queries = (maximo, repetidas, por_produto)
+        return fn
+    return decorar
+
+def produtos_no_request(n: int):
+    # Chamado pelos servicos que fazem uma statement por produto: o orcamento das rotas
+    # com por_produto escala com o maior lote informado no request.
+    from app.core.metrics import request_stats
+
+    stats = request_stats.get()
+    if stats is not None and n > stats.produtos:
+        stats.produtos = n
+
+def _orcamento_da_rota(route) -> tuple[int | None, int | None, int]:
+    endpoint = getattr(route, "endpoint", None)
+    return getattr(endpoint, "orcamento_queries", (None, None, 0))
+
+def violacoes(route, queries: int, formas: Counter, produtos: int = 0) -> list[str]:
+    maximo, repetidas, por_produto = _orcamento_da_rota(route)
+    if por_produto:
+        if maximo is not None:
+            maximo += por_produto * produtos
+        repetidas = max(repetidas or 1, produtos)
+    elif repetidas is None:
+        repetidas = settings.QUERY_REPETIDAS_MAX or None
+    out = []
+    if maximo is not None and queries > maximo:
+        out.append(f"{queries} queries (orcamento {maximo})")
+    if repetidas:
+        for sql, n in formas.most_common():
+            if n <= repetidas:
+                break
+            out.append(f"{n}x {sql[:200]}")
+    return out
+
+def verificar(route, template: str, queries: int, formas: Counter | None, produtos: int = 0):
+    if formas is None:
+        return
+    problemas = violacoes(route, queries, formas, produtos)
+    if not problemas:
+        return
+    msg = f"orcamento de queries excedido em {template}: " + "; ".join(problemas)
+    if modo() == "raise":
+        raise OrcamentoExcedido(msg)
+    logger.warning(msg)
+
+
+class Medicao:
+    def __init__(self, stats):
+        self._stats = stats
+
+    @property
+    def queries(self) -> int:
+        return self._stats.queries
+
+    @property
+    def formas(self) -> Counter:
+        return self._stats.formas or Counter()
+
+    def repetidas(self, minimo: int = 2) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.formas.most_common() if n >= minimo]
+
+
+@contextmanager
+def medir_queries(maximo: int | None = None):
+    # Para scripts e benchmarks fora de um request HTTP:
+    #   with medir_queries(5) as m: ...
+    # conta as queries feitas na thread atual e, com maximo, levanta OrcamentoExcedido.
+    from app.core.metrics import EstatisticasRequest, request_stats
+
+    stats = EstatisticasRequest(formas=True)
+    token = request_stats.set(stats)
+    m = Medicao(stats)
+    try:
+        yield m
+    finally:
+        request_stats.reset(token)
+    if maximo is not None and m.queries > maximo:
+        raise OrcamentoExcedido(f"{m.queries} queries (orcamento {maximo})")
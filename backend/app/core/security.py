@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
@@ -8,52 +7,59 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.db.session import get_db
 from app.models.models import User
+from app.core.user_cache import UsuarioAtual, user_cache
+from app.core.passwords import hash_password, verify_password  # noqa: F401 (reexport)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(password: str, hashed: str) -> bool:
-    return pwd_context.verify(password, hashed)
-
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.JWT_EXPIRES_MIN)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    cred_exc = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Token inválido ou expirado",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def usuario_do_token(db: Session, token: str) -> UsuarioAtual | None:
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
         user_id = payload.get("sub")
         if user_id is None:
-            raise cred_exc
+            return None
     except JWTError:
-        raise cred_exc
+        return None
+
+    user_id = int(user_id)
+    user = user_cache.obter(user_id)
+    if user is None:
+        row = db.get(User, user_id)
+        if not row:
+            return None
+        user = UsuarioAtual.de(row)
+        user_cache.guardar(user)
+    if not user.ativo:
+        return None
+    return user
 
-    user = db.get(User, int(user_id))
-    if not user or not user.ativo:
-        raise cred_exc
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UsuarioAtual:
+    user = usuario_do_token(db, token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
+def require_admin(user: UsuarioAtual = Depends(get_current_user)) -> UsuarioAtual:
     if user.role != "ADMIN":
         raise HTTPException(status_code=403, detail="Acesso restrito ao ADMIN.")
     return user
 
-def require_vendedor(user: User = Depends(get_current_user)) -> User:
+def require_vendedor(user: UsuarioAtual = Depends(get_current_user)) -> UsuarioAtual:
     if user.role not in ("VENDEDOR", "ADMIN"):
         raise HTTPException(status_code=403, detail="Acesso restrito ao VENDEDOR.")
     return user
 
-def require_caixa(user: User = Depends(get_current_user)) -> User:
+def require_caixa(user: UsuarioAtual = Depends(get_current_user)) -> UsuarioAtual:
     if user.role not in ("CAIXA", "VENDEDOR", "ADMIN"):
         raise HTTPException(status_code=403, detail="Acesso restrito ao CAIXA.")
     return user
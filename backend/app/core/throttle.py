@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+
+class LoginThrottle:
+    # Falhas de login por chave (usuario ou IP) numa janela deslizante. Estourado o limite,
+    # a chave fica bloqueada ate a falha mais antiga sair da janela. Estado por worker.
+    def __init__(self, max_falhas: int, janela_s: float):
+        self.max_falhas = max_falhas
+        self.janela_s = janela_s
+        self._falhas: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.bloqueios = 0
+
+    def _limpar(self, chave: str, agora: float) -> deque | None:
+        falhas = self._falhas.get(chave)
+        if falhas is None:
+            return None
+        while falhas and agora - falhas[0] >= self.janela_s:
+            falhas.popleft()
+        if not falhas:
+            del self._falhas[chave]
+            return None
+        return falhas
+
+    def retry_after(self, chave: str) -> int:
+        # Segundos ate liberar (0 = liberado).
+        if self.max_falhas <= 0:
+            return 0
+        agora = time.monotonic()
+        with self._lock:
+            falhas = self._limpar(chave, agora)
+            if not falhas or len(falhas) < self.max_falhas:
+                return 0
+            self.bloqueios += 1
+            return int(self.janela_s - (agora - falhas[0])) + 1
+
+    def falha(self, chave: str):
+        if self.max_falhas <= 0:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            self._falhas.setdefault(chave, deque(maxlen=self.max_falhas)).append(agora)
+            if len(self._falhas) > 10000:
+                for k in list(self._falhas):
+                    self._limpar(k, agora)
+
+    def sucesso(self, chave: str):
+        with self._lock:
+            self._falhas.pop(chave, None)
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import on_commit
+from app.models.models import Role, User
+from app.services.eventos import hub, publicar, PERM_INTERNO
+
+@dataclass(frozen=True)
+class UsuarioAtual:
+    # O que as rotas usam do usuario autenticado; nao e um objeto da sessao.
+    id: int
+    nome: str
+    username: str
+    role: Role
+    ativo: bool
+
+    @classmethod
+    def de(cls, user: User) -> "UsuarioAtual":
+        return cls(id=user.id, nome=user.nome, username=user.username, role=Role(user.role), ativo=user.ativo)
+
+
+class UserCache:
+    # LRU com TTL de id -> UsuarioAtual. Alteracoes via /admin/vendedores invalidam a
+    # entrada no commit (neste worker) e pelo feed de eventos (nos demais); o TTL limita
+    # o tempo de qualquer entrada que escape disso.
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._dados: OrderedDict[int, tuple[float, UsuarioAtual]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def obter(self, user_id: int) -> UsuarioAtual | None:
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(user_id)
+            if item and agora - item[0] < self.ttl_s:
+                self._dados.move_to_end(user_id)
+                self.hits += 1
+                return item[1]
+            if item:
+                del self._dados[user_id]
+            self.misses += 1
+            return None
+
+    def guardar(self, usuario: UsuarioAtual):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._dados[usuario.id] = (time.monotonic(), usuario)
+            self._dados.move_to_end(usuario.id)
+            while len(self._dados) > self.maxsize:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, user_id: int):
+        with self._lock:
+            self._dados.pop(user_id, None)
+            self.invalidacoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "tamanho": len(self._dados),
+                "max": self.maxsize,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidacoes": self.invalidacoes,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+user_cache = UserCache(settings.USER_CACHE_MAX, settings.USER_CACHE_TTL_S)
+
+def invalidar_usuario(db: Session, user_id: int):
+    # Chamar na transacao que altera o usuario.
+    on_commit(db, lambda: user_cache.invalidar(user_id))
+    publicar(db, "usuario.alterado", {"id": user_id}, perm=PERM_INTERNO, chave=("usuario", user_id))
+
+hub.assinar("usuario.", lambda ev: user_cache.invalidar(ev["dados"]["id"]))
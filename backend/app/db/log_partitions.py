@@ -0,0 +1,92 @@
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+# Particionamento mensal da tabela logs (so Postgres). Com a tabela particionada a
+# retencao vira DROP TABLE da particao do mes, sem DELETE linha a linha.
+
+def _mes(d: date, delta: int = 0) -> date:
+    m = d.month - 1 + delta
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def _nome(inicio: date) -> str:
+    return f"logs_{inicio:%Y%m}"
+
+def suportado(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+def logs_particionado(conn: Connection) -> bool:
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'logs'")).scalar() == "p"
+
+def particoes(conn: Connection) -> list[str]:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'logs' ORDER BY c.relname"
+    )).scalars())
+
+def _criar_particao(conn: Connection, inicio: date):
+    fim = _mes(inicio, 1)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_nome(inicio)} PARTITION OF logs "
+        f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+    ))
+
+def garantir_particoes(conn: Connection, hoje: date, meses_a_frente: int = 2):
+    for i in range(meses_a_frente + 1):
+        _criar_particao(conn, _mes(hoje, i))
+
+def remover_particoes_antigas(conn: Connection, limite: datetime) -> list[str]:
+    # Remove so particoes inteiramente anteriores ao limite; o mes do limite fica para o
+    # DELETE em lotes da retencao.
+    removidas = []
+    for nome in particoes(conn):
+        sufixo = nome.removeprefix("logs_")
+        if not (len(sufixo) == 6 and sufixo.isdigit()):
+            continue  # logs_default
+        fim = _mes(date(int(sufixo[:4]), int(sufixo[4:]), 1), 1)
+        if fim <= limite.date():
+            conn.execute(text(f"DROP TABLE {nome}"))
+            removidas.append(nome)
+    return removidas
+
+def particionar_logs(engine: Engine, hoje: date) -> bool:
+    # Conversao unica da tabela logs em tabela particionada por mes, preservando ids e a
+    # sequence. Roda numa transacao so; com muitos logs, prefira purgar antes.
+    with engine.begin() as conn:
+        if logs_particionado(conn):
+            return False
+        primeiro = conn.execute(text("SELECT min(data_hora) FROM logs")).scalar()
+        inicio = _mes(primeiro.date() if primeiro else hoje)
+
+        conn.execute(text("ALTER TABLE logs RENAME TO logs_legacy"))
+        conn.execute(text("ALTER SEQUENCE logs_id_seq OWNED BY NONE"))
+        conn.execute(text(
+            "CREATE TABLE logs ("
+            " id INTEGER NOT NULL DEFAULT nextval('logs_id_seq'),"
+            " usuario VARCHAR(120) NOT NULL,"
+            " acao VARCHAR(120) NOT NULL,"
+            " detalhe VARCHAR(500),"
+            " ip VARCHAR(64),"
+            " data_hora TIMESTAMP WITHOUT TIME ZONE NOT NULL,"
+            " CONSTRAINT logs_part_pkey PRIMARY KEY (id, data_hora)"
+            ") PARTITION BY RANGE (data_hora)"
+        ))
+        conn.execute(text("CREATE TABLE logs_default PARTITION OF logs DEFAULT"))
+        mes = inicio
+        while mes <= _mes(hoje, 2):
+            _criar_particao(conn, mes)
+            mes = _mes(mes, 1)
+
+        conn.execute(text(
+            "INSERT INTO logs (id, usuario, acao, detalhe, ip, data_hora) "
+            "SELECT id, usuario, acao, detalhe, ip, COALESCE(data_hora, now()) FROM logs_legacy"
+        ))
+        conn.execute(text("DROP TABLE logs_legacy"))
+        conn.execute(text("ALTER SEQUENCE logs_id_seq OWNED BY logs.id"))
+        conn.execute(text("CREATE INDEX ix_logs_data_hora_id ON logs (data_hora, id)"))
+        conn.execute(text("CREATE INDEX ix_logs_usuario_data_hora_id ON logs (usuario, data_hora, id)"))
+        conn.execute(text("CREATE INDEX ix_logs_acao_data_hora_id ON logs (acao, data_hora, id)"))
+    return True
@@ -0,0 +1,116 @@
+import logging
+import time
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.db.schema import criar_indices_faltantes
+from app.db.session import Base
+from app.models import models  # noqa: F401 (register models)
+from app.models.models import now_br
+from app.services.caixa_service import garantir_caixa_totais
+from app.services.estoque_service import garantir_saldos
+from app.services.vendas_service import garantir_vendas_dia
+
+# Migracoes versionadas. Rodam uma vez por banco (`python -m app.cli migrate`, ou no boot com
+# AUTO_MIGRATE); os workers so conferem o carimbo em schema_version. Migracao nova entra no fim
+# da lista e nao muda depois de publicada.
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+
+schema_version = Table(
+    "schema_version", _meta,
+    Column("versao", Integer, primary_key=True),
+    Column("descricao", String(200), nullable=False),
+    Column("aplicada_em", DateTime, nullable=False),
+)
+
+# Chave do advisory lock do Postgres que serializa dois `migrate` concorrentes.
+_CHAVE_LOCK = 0x6261725F6D6967
+
+
+class EsquemaDesatualizado(RuntimeError):
+    pass
+
+
+def _esquema_inicial(conn: Connection):
+    # Bancos anteriores ao versionamento ja tem as tabelas; create_all so cria o que falta.
+    Base.metadata.create_all(bind=conn)
+    criar_indices_faltantes(conn)
+
+def _com_sessao(fn):
+    # Backfills escritos para Session: a sessao entra na transacao da migracao e o commit
+    # dela nao confirma nada antes do carimbo.
+    def migracao(conn: Connection):
+        with Session(bind=conn, join_transaction_mode="rollback_only") as db:
+            fn(db)
+            db.flush()
+    return migracao
+
+def _indice_itens_criado_em(conn: Connection):
+    # DDL literal (nao o Index do modelo) para a migracao nao mudar se o modelo mudar.
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_itens_comanda_criado_em ON itens_comanda (criado_em)"))
+
+MIGRACOES = [
+    (1, "esquema inicial (tabelas e indices)", _esquema_inicial),
+    (2, "backfill de saldos_estoque a partir do ledger", _com_sessao(garantir_saldos)),
+    (3, "backfill dos rollups diarios de vendas", _com_sessao(garantir_vendas_dia)),
+    (4, "backfill de caixa_totais", _com_sessao(garantir_caixa_totais)),
+    (5, "indice de itens_comanda.criado_em (exportacao por periodo)", _indice_itens_criado_em),
+]
+
+VERSAO = MIGRACOES[-1][0]
+
+
+def versao_do_banco(conn: Connection) -> int | None:
+    # None: banco sem schema_version (vazio ou anterior ao versionamento).
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.execute(select(func.max(schema_version.c.versao))).scalar() or 0
+
+def _travar(conn: Connection):
+    # No SQLite o BEGIN IMMEDIATE da conexao de escrita ja serializa os processos.
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _CHAVE_LOCK})
+
+def migrar(engine: Engine) -> list[dict]:
+    # Cada migracao roda na sua transacao, junto com o carimbo; quem perder a corrida para
+    # outro processo so encontra a versao ja aplicada.
+    escrita = engine.execution_options(escrita=True)
+    with escrita.begin() as conn:
+        _travar(conn)
+        schema_version.create(conn, checkfirst=True)
+    aplicadas = []
+    for versao, descricao, fn in MIGRACOES:
+        with escrita.begin() as conn:
+            _travar(conn)
+            if versao <= versao_do_banco(conn):
+                continue
+            inicio = time.perf_counter()
+            fn(conn)
+            conn.execute(schema_version.insert().values(versao=versao, descricao=descricao, aplicada_em=now_br()))
+        ms = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info("migracao %s aplicada: %s (%.1f ms)", versao, descricao, ms)
+        aplicadas.append({"versao": versao, "descricao": descricao, "ms": ms})
+    return aplicadas
+
+def verificar_versao(engine: Engine) -> int:
+    # Checagem do boot: uma leitura do carimbo, sem reflexao das tabelas.
+    with engine.connect() as conn:
+        atual = versao_do_banco(conn)
+    if atual is None or atual < VERSAO:
+        raise EsquemaDesatualizado(
+            f"banco na versao {atual or 0}, o codigo espera {VERSAO}: rode `python -m app.cli migrate`"
+        )
+    if atual > VERSAO:
+        # Deploy em andamento: o banco ja foi migrado para uma versao mais nova.
+        logger.warning("banco na versao %s, mais nova que a do codigo (%s)", atual, VERSAO)
+    return atual
+
+def pendentes(engine: Engine) -> list[tuple[int, str]]:
+    with engine.connect() as conn:
+        atual = versao_do_banco(conn) or 0
+    return [(v, d) for v, d, _ in MIGRACOES if v > atual]
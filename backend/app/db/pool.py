@@ -0,0 +1,115 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total_s = 0.0
+        self.espera_max_s = 0.0
+        self.timeouts = 0
+        self.conexoes_abertas = 0
+        self.invalidacoes = 0
+        self.pings = 0
+        self.pings_falhos = 0
+
+    def registrar_espera(self, segundos: float):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total_s += segundos
+            self.espera_max_s = max(self.espera_max_s, segundos)
+
+    def incrementar(self, campo: str):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def stats(self, pool) -> dict:
+        with self._lock:
+            dados = {
+                "checkouts": self.checkouts,
+                "espera_media_ms": round(self.espera_total_s / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "espera_max_ms": round(self.espera_max_s * 1000, 3),
+                "timeouts": self.timeouts,
+                "conexoes_abertas": self.conexoes_abertas,
+                "invalidacoes": self.invalidacoes,
+                "pings": self.pings,
+                "pings_falhos": self.pings_falhos,
+            }
+        if isinstance(pool, QueuePool):
+            capacidade = pool.size() + max(pool._max_overflow, 0)
+            dados.update({
+                "tamanho": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "em_uso": pool.checkedout(),
+                "livres": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "saturacao": round(pool.checkedout() / capacidade, 4) if capacidade else None,
+            })
+        else:
+            dados["pool"] = type(pool).__name__
+        return dados
+
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool que mede o tempo de cada checkout (espera por conexao livre + conexao nova).
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.incrementar("timeouts")
+            raise
+        finally:
+            pool_metrics.registrar_espera(time.perf_counter() - inicio)
+
+def instrumentar(engine, pre_ping: str, pre_ping_idle_s: float):
+    # pre_ping: "always" usa o pool_pre_ping do SQLAlchemy (passado no create_engine);
+    # "idle" so pinga conexoes paradas ha mais de pre_ping_idle_s; "never" nao pinga.
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        pool_metrics.incrementar("conexoes_abertas")
+        connection_record.info["devolvida_em"] = time.monotonic()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        if connection_record is not None:
+            connection_record.info["devolvida_em"] = time.monotonic()
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.incrementar("invalidacoes")
+
+    if pre_ping == "idle":
+        @event.listens_for(engine, "checkout")
+        def _ping_idle(dbapi_connection, connection_record, connection_proxy):
+            devolvida = connection_record.info.get("devolvida_em")
+            if devolvida is None or time.monotonic() - devolvida < pre_ping_idle_s:
+                return
+            pool_metrics.incrementar("pings")
+            try:
+                # do_ping do dialeto: no psycopg2 um SELECT cru deixaria a conexao dentro de
+                # uma transacao (e quebraria quem liga autocommit depois, como o LISTEN).
+                engine.dialect.do_ping(dbapi_connection)
+            except Exception:
+                pool_metrics.incrementar("pings_falhos")
+                # O pool descarta esta conexao e tenta outra.
+                raise exc.DisconnectionError()
+
+def preencher_pool(engine, n: int) -> int:
+    # Abre n conexoes de uma vez no boot (connect, pragmas/handshake) para os primeiros
+    # requests nao pagarem por elas; voltam todas livres para o pool.
+    conexoes = []
+    try:
+        for _ in range(n):
+            conn = engine.connect()
+            conexoes.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conexoes:
+            conn.close()
+    return len(conexoes)
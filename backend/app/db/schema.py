@@ -0,0 +1,9 @@
+from sqlalchemy.engine import Connection, Engine
+
+from app.db.session import Base
+
+def criar_indices_faltantes(bind: Engine | Connection) -> None:
+    # create_all nao cria indices novos em tabelas que ja existem.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
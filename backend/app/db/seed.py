@@ -0,0 +1,21 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.security import hash_password
+from app.models.models import Role, User
+
+def criar_admin(db: Session) -> bool:
+    # Seed unico (python -m app.cli seed-admin): so cria se o username ainda nao existe.
+    existe = db.execute(select(User.id).where(User.username == settings.SEED_ADMIN_USERNAME)).first()
+    if existe:
+        return False
+    db.add(User(
+        nome=settings.SEED_ADMIN_NAME,
+        username=settings.SEED_ADMIN_USERNAME,
+        password_hash=hash_password(settings.SEED_ADMIN_PASSWORD),
+        role=Role.ADMIN,
+        ativo=True
+    ))
+    db.commit()
+    return True
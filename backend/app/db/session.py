@@ -1,26 +1,193 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import Request
+from sqlalchemy import create_engine, event, select, text, update, insert
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 from app.core.config import settings
+from app.core.metrics import db_espera_lock
+from app.db.pool import InstrumentedQueuePool, instrumentar
+
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
 
 connect_args = {}
-if settings.DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     # Needed for SQLite in a multithreaded app server.
     connect_args = {"check_same_thread": False}
 
+pool_args = {}
+if ":memory:" not in settings.DATABASE_URL:
+    pool_args = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE_S,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_S,
+    }
+
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args=connect_args
+    pool_pre_ping=settings.DB_PRE_PING == "always",
+    connect_args=connect_args,
+    **pool_args
 )
+instrumentar(engine, settings.DB_PRE_PING, settings.DB_PRE_PING_IDLE_S)
+
+# Sessoes de escrita: no SQLite abrem a transacao com BEGIN IMMEDIATE e passam pelo
+# escritor unico; no Postgres sao sessoes comuns.
+writer_engine = engine.execution_options(escrita=True)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+WriterSessionLocal = sessionmaker(bind=writer_engine, autoflush=False, autocommit=False)
+
+logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
     pass
 
-def get_db():
-    db = SessionLocal()
+METODOS_ESCRITA = ("POST", "PUT", "PATCH", "DELETE")
+
+def get_db(request: Request):
+    db = WriterSessionLocal() if request.method in METODOS_ESCRITA else SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+if IS_SQLITE:
+    # Perfil SQLite: o pysqlite fica em autocommit e o BEGIN e nosso (recipe do SQLAlchemy),
+    # para poder usar BEGIN IMMEDIATE nas escritas. Um lock de processo faz as transacoes de
+    # escrita esperarem a vez sem cair no busy handler do SQLite; entre processos, o
+    # BEGIN IMMEDIATE + busy_timeout serializam. O lock e solto quando a conexao volta ao pool.
+    _writer_lock = threading.Lock()
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cur = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cur.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_MB) * 1024 * 1024}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+
+    @event.listens_for(engine, "begin")
+    def _sqlite_begin(conn):
+        if not conn.get_execution_options().get("escrita"):
+            conn.exec_driver_sql("BEGIN")
+            return
+        info = conn.connection.info
+        if settings.SQLITE_SINGLE_WRITER and not info.get("writer_lock"):
+            inicio = time.perf_counter()
+            ok = _writer_lock.acquire(timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+            db_espera_lock.observe(time.perf_counter() - inicio, lock="sqlite_writer")
+            if not ok:
+                raise TimeoutError("timeout esperando o escritor unico do SQLite")
+            info["writer_lock"] = True
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        except Exception:
+            _soltar_writer(info)
+            raise
+
+    def _soltar_writer(info):
+        if info.pop("writer_lock", False):
+            _writer_lock.release()
+
+    @event.listens_for(engine, "checkin")
+    def _sqlite_checkin(dbapi_connection, connection_record):
+        _soltar_writer(connection_record.info)
+
+    @event.listens_for(engine, "invalidate")
+    def _sqlite_invalidate(dbapi_connection, connection_record, exception):
+        _soltar_writer(connection_record.info)
+
+def on_commit(db: Session, fn):
+    # Agenda fn para rodar apenas se a transacao atual da sessao for confirmada.
+    db.info.setdefault("on_commit", []).append(fn)
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit(session: Session):
+    callbacks = session.info.pop("on_commit", [])
+    for fn in callbacks:
+        try:
+            fn()
+        except Exception:
+            # O commit ja aconteceu; falhas aqui nao podem derrubar a requisicao.
+            logger.exception("falha em callback on_commit")
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_commit(session: Session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop("on_commit", None)
+
+def update_returning(db: Session, stmt, col, chave):
+    # UPDATE ... RETURNING col numa unica ida ao banco. SQLite sem RETURNING (< 3.35):
+    # UPDATE + SELECT pela chave na mesma transacao; como o SQLite serializa escritas,
+    # continua atomico.
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(col)).scalar_one_or_none()
+    res = db.execute(stmt)
+    if res.rowcount == 0:
+        return None
+    return db.execute(select(col).where(chave)).scalar_one_or_none()
+
+def upsert_somando(db: Session, table, chave: dict, incrementos: dict, valores: dict | None = None, retornar: str | None = None):
+    # INSERT ... ON CONFLICT (chave) DO UPDATE SET col = col + excluded.col: soma atomica
+    # sem corrida entre duas transacoes criando a mesma linha. `valores` sao gravados como
+    # vieram (ex.: atualizado_em); `retornar` devolve a coluna ja somada.
+    valores = valores or {}
+    bind = db.get_bind()
+    dialeto = bind.dialect.name
+    if dialeto in ("postgresql", "sqlite"):
+        if dialeto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(**chave, **incrementos, **valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(chave),
+            set_={
+                **{c: table.c[c] + stmt.excluded[c] for c in incrementos},
+                **{c: stmt.excluded[c] for c in valores},
+            }
+        )
+        if retornar is not None and bind.dialect.insert_returning:
+            return db.execute(stmt.returning(table.c[retornar])).scalar_one()
+        db.execute(stmt)
+    else:
+        res = db.execute(
+            update(table)
+            .where(*[table.c[k] == v for k, v in chave.items()])
+            .values({c: table.c[c] + v for c, v in incrementos.items()}, **valores)
+        )
+        if res.rowcount == 0:
+            db.execute(insert(table).values(**chave, **incrementos, **valores))
+    if retornar is None:
+        return None
+    return db.execute(
+        select(table.c[retornar]).where(*[table.c[k] == v for k, v in chave.items()])
+    ).scalar_one()
+
+@contextmanager
+def tarefa_exclusiva(chave: int):
+    # Tarefas periodicas que todo worker agenda (retencao de logs, limpeza da outbox): no
+    # Postgres so quem pega o pg_try_advisory_lock roda, os demais pulam a rodada sem
+    # esperar. A trava e de sessao, numa conexao segurada ate o fim da tarefa. No SQLite o
+    # banco e de um host so e o escritor unico ja serializa; sempre roda.
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        pegou = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": chave}).scalar()
+        conn.commit()
+        try:
+            yield bool(pegou)
+        finally:
+            if pegou:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": chave})
+                conn.commit()
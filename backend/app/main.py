@@ -1,11 +1,19 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.db.session import engine, SessionLocal, Base
+from app.db.session import engine, SessionLocal, WriterSessionLocal
+from app.db.migrations import migrar, verificar_versao
+from app.db.pool import pool_metrics, preencher_pool
+from app.db.seed import criar_admin
 from app.models import models  # noqa: F401 (register models)
-from app.models.models import User, Role
-from app.core.security import hash_password
+from app.core.passwords import pool_senhas
+from app.services import bom_cache
 
 from app.routes.auth import router as auth_router
 from app.routes.admin import router as admin_router
@@ -14,8 +22,66 @@ from app.routes.comandas import router as comandas_router
 from app.routes.logs import router as logs_router
 from app.routes.mesas import router as mesas_router
 from app.routes.caixa import router as caixa_router
+from app.routes.eventos import router as eventos_router
+from app.routes.exportar import router as exportar_router
+from app.routes.metricas import router as metricas_router
+from app.core.metrics import MetricsMiddleware, instrumentar_sql, startup_duracao
+from app.services.eventos import hub
+from app.services.log_service import log_buffer, retencao_logs
+
+logger = logging.getLogger(__name__)
+
+def _etapa(etapas: dict, nome: str, fn):
+    inicio = time.perf_counter()
+    r = fn()
+    segundos = time.perf_counter() - inicio
+    etapas[nome] = round(segundos * 1000, 1)
+    startup_duracao.set(segundos, etapa=nome)
+    return r
+
+def _esquema() -> int:
+    # Sem AUTO_MIGRATE o boot so le o carimbo de versao; migrar e semear sao passos unicos
+    # do deploy (python -m app.cli migrate / seed-admin), fora dos workers.
+    if settings.AUTO_MIGRATE:
+        migrar(engine)
+        db = WriterSessionLocal()
+        try:
+            criar_admin(db)
+        finally:
+            db.close()
+    return verificar_versao(engine)
+
+def _aquecer_caches() -> int:
+    db = SessionLocal()
+    try:
+        return bom_cache.aquecer(db)
+    finally:
+        db.close()
 
-app = FastAPI(title="Bar Control API", version="0.1.0")
+def _iniciar_tarefas():
+    hub.iniciar()
+    if settings.LOG_BUFFERED:
+        log_buffer.iniciar()
+    retencao_logs.iniciar()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    inicio = time.perf_counter()
+    etapas = {}
+    versao = _etapa(etapas, "esquema", _esquema)
+    _etapa(etapas, "caches", _aquecer_caches)
+    _etapa(etapas, "pool", lambda: preencher_pool(engine, min(settings.DB_POOL_PREFILL, settings.DB_POOL_SIZE)))
+    _etapa(etapas, "tarefas", _iniciar_tarefas)
+    total_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    app.state.startup = {"versao_esquema": versao, "total_ms": total_ms, "etapas_ms": etapas}
+    logger.info("startup em %.1f ms (esquema v%s): %s", total_ms, versao, etapas)
+    yield
+    hub.parar()
+    retencao_logs.parar()
+    log_buffer.parar()
+    pool_senhas.encerrar()
+
+app = FastAPI(title="Bar Control API", version="0.1.0", lifespan=lifespan)
 
 origins = [o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()]
 app.add_middleware(
@@ -24,7 +90,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
+instrumentar_sql(engine)
 
 app.include_router(auth_router)
 app.include_router(admin_router)
@@ -33,27 +102,34 @@ app.include_router(comandas_router)
 app.include_router(logs_router)
 app.include_router(mesas_router)
 app.include_router(caixa_router)
-
-@app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
-    db: Session = SessionLocal()
-    try:
-        # seed admin if not exists
-        admin = db.query(User).filter(User.username == settings.SEED_ADMIN_USERNAME).first()
-        if not admin:
-            admin = User(
-                nome=settings.SEED_ADMIN_NAME,
-                username=settings.SEED_ADMIN_USERNAME,
-                password_hash=hash_password(settings.SEED_ADMIN_PASSWORD),
-                role=Role.ADMIN,
-                ativo=True
-            )
-            db.add(admin)
-            db.commit()
-    finally:
-        db.close()
+app.include_router(eventos_router)
+app.include_router(exportar_router)
+app.include_router(metricas_router)
 
 @app.get("/health")
 def health():
     return {"ok": True}
+
+@app.get("/health/ready")
+def health_ready():
+    # Readiness para o balanceador: latencia de um SELECT 1 e saturacao do pool.
+    inicio = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        db_ok = True
+    except Exception:
+        logger.exception("readiness: banco indisponivel")
+        db_ok = False
+    latencia_ms = round((time.perf_counter() - inicio) * 1000, 3)
+    pool = pool_metrics.stats(engine.pool)
+    saturado = (pool.get("saturacao") or 0) >= settings.DB_READY_MAX_SATURACAO
+    pronto = db_ok and not saturado
+    return JSONResponse(status_code=200 if pronto else 503, content={
+        "ok": pronto,
+        "db": db_ok,
+        "db_latencia_ms": latencia_ms,
+        "pool_saturado": saturado,
+        "pool": pool,
+        "startup": getattr(app.state, "startup", None),
+    })
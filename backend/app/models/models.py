@@ -1,7 +1,7 @@
 import enum
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Numeric, Boolean, Index
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, ForeignKey, Numeric, Boolean, Index, Text
 from sqlalchemy.orm import relationship
 from app.db.session import Base
 
@@ -117,6 +117,21 @@ class CaixaMov(Base):
     troco = Column(Numeric(12, 2), nullable=True)
     criado_em = Column(DateTime, default=now_br, index=True)
 
+class CaixaTotais(Base):
+    # Totais correntes do caixa, somados atomicamente junto com cada CaixaMov
+    # (ver caixa_service.registrar_caixa_mov).
+    __tablename__ = "caixa_totais"
+    id_caixa = Column(Integer, ForeignKey("caixas.id"), primary_key=True)
+    saldo_inicial = Column(Numeric(12, 2), nullable=False, default=0)
+    vendas = Column(Numeric(14, 2), nullable=False, default=0)
+    vendas_dinheiro = Column(Numeric(14, 2), nullable=False, default=0)
+    vendas_cartao = Column(Numeric(14, 2), nullable=False, default=0)
+    qtd_vendas = Column(Integer, nullable=False, default=0)
+    reforcos = Column(Numeric(14, 2), nullable=False, default=0)
+    sangrias = Column(Numeric(14, 2), nullable=False, default=0)
+    ajustes = Column(Numeric(14, 2), nullable=False, default=0)
+    qtd_movs = Column(Integer, nullable=False, default=0)
+
 class Comanda(Base):
     __tablename__ = "comandas"
     id = Column(Integer, primary_key=True)  # número sequencial
@@ -128,6 +143,11 @@ class Comanda(Base):
     criada_em = Column(DateTime, default=now_br)
     atualizada_em = Column(DateTime, default=now_br, onupdate=now_br)
 
+    # Lista de comandas finalizadas do dia (/comandas/resumo-dia).
+    __table_args__ = (
+        Index("ix_comandas_status_atualizada_em", "status", "atualizada_em"),
+    )
+
 class ItemComanda(Base):
     __tablename__ = "itens_comanda"
     id = Column(Integer, primary_key=True)
@@ -136,26 +156,83 @@ class ItemComanda(Base):
     quantidade = Column(Numeric(12, 3), nullable=False, default=1)
     preco_unitario = Column(Numeric(10, 2), nullable=False, default=0)
     total_item = Column(Numeric(12, 2), nullable=False, default=0)
-    criado_em = Column(DateTime, default=now_br)
+    # Indexado para o filtro de periodo de /exportar/itens-comanda (migracao 5).
+    criado_em = Column(DateTime, default=now_br, index=True)
 
 class MovEstoque(Base):
     __tablename__ = "mov_estoque"
     id = Column(Integer, primary_key=True)
-    id_comanda = Column(Integer, ForeignKey("comandas.id"), nullable=True, index=True)
+    id_comanda = Column(Integer, ForeignKey("comandas.id"), nullable=True)
     id_item_comanda = Column(Integer, ForeignKey("itens_comanda.id"), nullable=True, index=True)
-    id_produto = Column(Integer, ForeignKey("produtos.id"), nullable=False, index=True)
+    id_produto = Column(Integer, ForeignKey("produtos.id"), nullable=False)
     tipo = Column(Enum(TipoMov), nullable=False)
     quantidade = Column(Numeric(12, 3), nullable=False)
-    data_hora = Column(DateTime, default=now_br, index=True)
+    data_hora = Column(DateTime, nullable=False, default=now_br)
     detalhe = Column(String(255), nullable=True)
 
+    # Um indice por filtro de /produtos/movimentos, todos terminando em (data_hora, id)
+    # para a paginacao por cursor.
+    __table_args__ = (
+        Index("ix_mov_estoque_data_hora_id", "data_hora", "id"),
+        Index("ix_mov_estoque_produto_data_hora_id", "id_produto", "data_hora", "id"),
+        Index("ix_mov_estoque_tipo_data_hora_id", "tipo", "data_hora", "id"),
+        Index("ix_mov_estoque_comanda_data_hora_id", "id_comanda", "data_hora", "id"),
+    )
+
 class LogAcao(Base):
     __tablename__ = "logs"
     id = Column(Integer, primary_key=True)
-    usuario = Column(String(120), nullable=False, index=True)
-    acao = Column(String(120), nullable=False, index=True)
+    usuario = Column(String(120), nullable=False)
+    acao = Column(String(120), nullable=False)
     detalhe = Column(String(500), nullable=True)
     ip = Column(String(64), nullable=True)
-    data_hora = Column(DateTime, default=now_br, index=True)
+    data_hora = Column(DateTime, nullable=False, default=now_br)
 
+    # Servem a paginacao por cursor (data_hora desc, id desc) com e sem filtro.
+    __table_args__ = (
+        Index("ix_logs_data_hora_id", "data_hora", "id"),
+        Index("ix_logs_usuario_data_hora_id", "usuario", "data_hora", "id"),
+        Index("ix_logs_acao_data_hora_id", "acao", "data_hora", "id"),
+    )
 
+class SaldoEstoque(Base):
+    # Saldo materializado do ledger (mov_estoque), mantido na mesma transacao de cada MovEstoque.
+    __tablename__ = "saldos_estoque"
+    id_produto = Column(Integer, ForeignKey("produtos.id"), primary_key=True)
+    saldo = Column(Numeric(14, 3), nullable=False, default=0)
+    qtd_movs = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=now_br, onupdate=now_br)
+
+class Evento(Base):
+    # Outbox do feed de mudancas: uma linha por transacao confirmada, lida por todos os workers.
+    __tablename__ = "eventos"
+    id = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False)  # lista JSON de eventos
+    criado_em = Column(DateTime, default=now_br, index=True)
+
+class VendaDiaProduto(Base):
+    # Rollup de vendas por dia x produto (x vendedor x canal), somado na transacao da venda.
+    __tablename__ = "vendas_dia_produto"
+    dia = Column(Date, primary_key=True)
+    id_produto = Column(Integer, ForeignKey("produtos.id"), primary_key=True)
+    id_vendedor = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    canal = Column(String(10), primary_key=True)  # COMANDA | BALCAO
+    quantidade = Column(Numeric(14, 3), nullable=False, default=0)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_vendas_dia_produto_vendedor_dia", "id_vendedor", "dia"),
+    )
+
+class VendaDiaVendedor(Base):
+    # Rollup de vendas por dia x vendedor (x canal).
+    __tablename__ = "vendas_dia_vendedor"
+    dia = Column(Date, primary_key=True)
+    id_vendedor = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    canal = Column(String(10), primary_key=True)
+    qtd_vendas = Column(Integer, nullable=False, default=0)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_vendas_dia_vendedor_vendedor_dia", "id_vendedor", "dia"),
+    )
@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select
 from app.db.session import get_db
 from app.core.security import require_admin, hash_password
+from app.core.passwords import PoolSaturado
+from app.core.user_cache import user_cache, invalidar_usuario
 from app.models.models import User, Role, Mesa
 from app.schemas.users import UserCreate, UserOut, UserUpdate
 from app.schemas.mesas import MesaCreate, MesaOut
@@ -10,8 +12,19 @@ from app.services.log_service import log_action
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+def _hash_senha(db: Session, password: str) -> str:
+    # O bcrypt nao pode rodar com a transacao (e, no SQLite, o escritor unico) aberta:
+    # chamar antes das queries da rota, soltando a que a autenticacao possa ter aberto.
+    # Fila do pool cheia vira 503, como no login.
+    db.rollback()
+    try:
+        return hash_password(password)
+    except PoolSaturado:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente.", headers={"Retry-After": "1"})
+
 @router.post("/vendedores", response_model=UserOut)
 def criar_vendedor(payload: UserCreate, request: Request, db: Session = Depends(get_db), admin=Depends(require_admin)):
+    password_hash = _hash_senha(db, payload.password)
     exists = db.query(User).filter(User.username == payload.username).first()
     if exists:
         raise HTTPException(status_code=400, detail="username já existe.")
@@ -20,12 +33,12 @@ def criar_vendedor(payload: UserCreate, request: Request, db: Session = Depends(
     u = User(
         nome=payload.nome,
         username=payload.username,
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
         role=Role(role),
         ativo=True
     )
     db.add(u)
-    log_action(db, admin.nome, "CRIAR_USUARIO", f"username={payload.username} role={role}", request.client.host if request.client else None)
+    log_action(db, admin.nome, "CRIAR_USUARIO", f"username={payload.username} role={role}", request.client.host if request.client else None, sync=True)
     db.commit()
     db.refresh(u)
     return u
@@ -36,24 +49,29 @@ def listar_vendedores(db: Session = Depends(get_db), admin=Depends(require_admin
 
 @router.put("/vendedores/{id_user}", response_model=UserOut)
 def atualizar_vendedor(id_user: int, payload: UserUpdate, request: Request, db: Session = Depends(get_db), admin=Depends(require_admin)):
+    data = payload.model_dump(exclude_unset=True)
+    if "password" in data:
+        password = data.pop("password")
+        if password:
+            data["password_hash"] = _hash_senha(db, password)
     u = db.get(User, id_user)
     if not u:
         raise HTTPException(status_code=404, detail="usuario nao encontrado.")
-    data = payload.model_dump(exclude_unset=True)
     if "role" in data and data["role"] is not None:
         role = data["role"] if data["role"] in ("ADMIN", "VENDEDOR", "CAIXA") else "VENDEDOR"
         data["role"] = Role(role)
-    if "password" in data:
-        password = data.pop("password")
-        if password:
-            data["password_hash"] = hash_password(password)
     for k, v in data.items():
         setattr(u, k, v)
-    log_action(db, admin.nome, "ATUALIZAR_USUARIO", f"id={id_user}", request.client.host if request.client else None)
+    invalidar_usuario(db, id_user)
+    log_action(db, admin.nome, "ATUALIZAR_USUARIO", f"id={id_user}", request.client.host if request.client else None, sync=True)
     db.commit()
     db.refresh(u)
     return u
 
+@router.get("/cache-usuarios")
+def cache_usuarios_stats(admin=Depends(require_admin)):
+    return user_cache.stats()
+
 @router.post("/mesas", response_model=MesaOut)
 def criar_mesa(payload: MesaCreate, request: Request, db: Session = Depends(get_db), admin=Depends(require_admin)):
     exists = db.query(Mesa).filter(Mesa.numero == payload.numero).first()
@@ -1,20 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
 from app.db.session import get_db
 from app.schemas.auth import LoginIn, TokenOut
 from app.models.models import User
-from app.core.security import verify_password, create_access_token
+from app.core.security import create_access_token, require_admin
+from app.core.passwords import verify_password_async, hash_password_async, precisa_rehash, PoolSaturado, pool_senhas
+from app.core.throttle import LoginThrottle
+from app.core.user_cache import invalidar_usuario
 from app.services.log_service import log_action
 
 router = APIRouter(prefix="/auth", tags=["auth"])
+# IP com limite maior: a equipe costuma logar toda do mesmo IP (rede do bar).
+# throttle_usuario conta por (usuario, IP).
+throttle_usuario = LoginThrottle(settings.LOGIN_MAX_FALHAS, settings.LOGIN_JANELA_S)
+throttle_ip = LoginThrottle(settings.LOGIN_MAX_FALHAS_IP, settings.LOGIN_JANELA_S)
 
-@router.post("/login", response_model=TokenOut)
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == payload.username).first()
-    if not user or not user.ativo or not verify_password(payload.password, user.password_hash):
-        raise HTTPException(status_code=401, detail="Usuário ou senha inválidos.")
+def _buscar(db: Session, username: str):
+    user = db.query(User).filter(User.username == username).first()
+    dados = (user.id, user.ativo, user.password_hash) if user else None
+    # Encerra a transacao (e a vez no escritor do SQLite) antes do bcrypt.
+    db.rollback()
+    return dados
 
+def _concluir(db: Session, user_id: int, novo_hash: str | None) -> TokenOut:
+    user = db.get(User, user_id)
+    if novo_hash:
+        user.password_hash = novo_hash
+        invalidar_usuario(db, user.id)
     token = create_access_token({"sub": str(user.id), "role": user.role, "nome": user.nome})
     log_action(db, user.nome, "LOGIN", "Login realizado", None)
     db.commit()
     return TokenOut(access_token=token, role=user.role, nome=user.nome, user_id=user.id)
+
+@router.post("/login", response_model=TokenOut)
+async def login(payload: LoginIn, request: Request, db: Session = Depends(get_db)):
+    # async para o bcrypt rodar no pool de senhas sem ocupar uma thread do servidor
+    # esperando; o acesso ao banco continua no threadpool.
+    # request.client ja e o cliente real atras do proxy (forwarded_allow_ips no
+    # gunicorn.conf.py). O bloqueio por usuario vale por (usuario, IP): falhas vindas de
+    # outro lugar nao trancam o dono da conta fora.
+    chave_ip = request.client.host if request.client else "-"
+    chave_usuario = f"{payload.username.lower()}|{chave_ip}"
+    espera = max(throttle_usuario.retry_after(chave_usuario), throttle_ip.retry_after(chave_ip))
+    if espera:
+        raise HTTPException(status_code=429, detail="Muitas tentativas de login. Tente novamente mais tarde.", headers={"Retry-After": str(espera)})
+
+    dados = await run_in_threadpool(_buscar, db, payload.username)
+    try:
+        ok = bool(dados) and dados[1] and await verify_password_async(payload.password, dados[2])
+        novo_hash = await hash_password_async(payload.password) if ok and precisa_rehash(dados[2]) else None
+    except PoolSaturado:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente.", headers={"Retry-After": "1"})
+    if not ok:
+        throttle_usuario.falha(chave_usuario)
+        throttle_ip.falha(chave_ip)
+        raise HTTPException(status_code=401, detail="Usuário ou senha inválidos.")
+
+    throttle_usuario.sucesso(chave_usuario)
+    return await run_in_threadpool(_concluir, db, dados[0], novo_hash)
+
+@router.get("/pool-senhas")
+def pool_senhas_stats(admin=Depends(require_admin)):
+    return {
+        **pool_senhas.stats(),
+        "bloqueios_usuario": throttle_usuario.bloqueios,
+        "bloqueios_ip": throttle_ip.bloqueios,
+    }
@@ -1,17 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from datetime import timezone
 from app.db.session import get_db
 from app.core.security import require_vendedor, require_caixa
+from app.core.query_budget import orcamento_queries
 from app.models.models import Caixa, CaixaMov, CaixaStatus, CaixaMovTipo
 from app.schemas.caixa import (
     CaixaOpenIn, CaixaCloseIn, CaixaMovIn, CaixaOut, CaixaMovOut,
-    CaixaVendaIn, CaixaVendaLoteIn
+    CaixaVendaIn, CaixaVendaLoteIn, CaixaVendaLoteOut, CaixaResumoOut
 )
-from app.services.comanda_service import vender_balcao
+from app.services.comanda_service import vender_balcao, vender_balcao_lote
+from app.services.caixa_service import registrar_caixa_mov, totais_caixa, resumo_caixa
 
 router = APIRouter(prefix="/caixa", tags=["caixa"])
 try:
@@ -33,6 +35,19 @@ def _get_caixa_ultimo(db: Session) -> Caixa | None:
 def caixa_atual(db: Session = Depends(get_db), user=Depends(require_caixa)):
     return _get_caixa_aberto(db)
 
+@router.get("/resumo", response_model=CaixaResumoOut | None)
+def resumo_atual(db: Session = Depends(get_db), user=Depends(require_caixa)):
+    # Gaveta ao vivo do caixa aberto (ou relatorio Z do ultimo caixa).
+    atual = _get_caixa_aberto(db) or _get_caixa_ultimo(db)
+    return resumo_caixa(db, atual) if atual else None
+
+@router.get("/{id_caixa}/resumo", response_model=CaixaResumoOut)
+def resumo_por_caixa(id_caixa: int, db: Session = Depends(get_db), user=Depends(require_vendedor)):
+    caixa = db.get(Caixa, id_caixa)
+    if not caixa:
+        raise HTTPException(status_code=404, detail="Caixa nao encontrado.")
+    return resumo_caixa(db, caixa)
+
 @router.post("/abrir", response_model=CaixaOut)
 def abrir_caixa(payload: CaixaOpenIn, db: Session = Depends(get_db), user=Depends(require_vendedor)):
     atual = _get_caixa_aberto(db)
@@ -47,13 +62,11 @@ def abrir_caixa(payload: CaixaOpenIn, db: Session = Depends(get_db), user=Depend
     )
     db.add(c)
     db.flush()
-    db.add(CaixaMov(
-        id_caixa=c.id,
-        tipo=CaixaMovTipo.ABERTURA,
-        valor=payload.saldo_inicial,
+    registrar_caixa_mov(
+        db, c.id, CaixaMovTipo.ABERTURA, payload.saldo_inicial,
         descricao=payload.observacao or "Abertura de caixa",
         criado_em=now
-    ))
+    )
     db.commit()
     db.refresh(c)
     return c
@@ -64,28 +77,18 @@ def fechar_caixa(payload: CaixaCloseIn, db: Session = Depends(get_db), user=Depe
     if not atual:
         raise HTTPException(status_code=400, detail="Nao ha caixa aberto.")
     now = datetime.now(BR_TZ)
-    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = start + timedelta(days=1)
-    total_vendido = db.execute(
-        select(func.coalesce(func.sum(CaixaMov.valor), 0)).where(
-            CaixaMov.id_caixa == atual.id,
-            CaixaMov.tipo == CaixaMovTipo.VENDA,
-            CaixaMov.criado_em >= start,
-            CaixaMov.criado_em < end
-        )
-    ).scalar_one()
+    # Total vendido da sessao inteira (inclusive apos a meia-noite), pelos totais correntes.
+    total_vendido = totais_caixa(db, atual.id)["vendas"]
 
     atual.status = CaixaStatus.FECHADO
     atual.saldo_final = payload.saldo_final
     atual.observacao = payload.observacao or atual.observacao
     atual.fechado_em = now
-    db.add(CaixaMov(
-        id_caixa=atual.id,
-        tipo=CaixaMovTipo.FECHAMENTO,
-        valor=total_vendido,
+    registrar_caixa_mov(
+        db, atual.id, CaixaMovTipo.FECHAMENTO, total_vendido,
         descricao=payload.observacao or "Fechamento de caixa",
         criado_em=now
-    ))
+    )
     db.commit()
     db.refresh(atual)
     return atual
@@ -100,42 +103,38 @@ def registrar_movimento(payload: CaixaMovIn, db: Session = Depends(get_db), user
     if payload.tipo not in ("VENDA", "REFORCO", "SANGRIA", "AJUSTE"):
         raise HTTPException(status_code=400, detail="Tipo invalido.")
 
-    mov = CaixaMov(
-        id_caixa=atual.id,
-        tipo=CaixaMovTipo(payload.tipo),
-        valor=payload.valor,
+    mov = registrar_caixa_mov(
+        db, atual.id, CaixaMovTipo(payload.tipo), payload.valor,
         descricao=payload.descricao,
         criado_em=datetime.now(BR_TZ)
     )
-    db.add(mov)
     db.commit()
     db.refresh(mov)
     return mov
 
 @router.post("/venda-balcao", response_model=CaixaMovOut)
+@orcamento_queries(15)
 def venda_balcao(payload: CaixaVendaIn, db: Session = Depends(get_db), user=Depends(require_caixa)):
     atual = _get_caixa_aberto(db)
     if not atual:
         raise HTTPException(status_code=400, detail="Nao ha caixa aberto.")
 
     try:
-        total, nome = vender_balcao(db, payload.id_produto, payload.quantidade)
+        total, nome = vender_balcao(db, payload.id_produto, payload.quantidade, user.id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    mov = CaixaMov(
-        id_caixa=atual.id,
-        tipo=CaixaMovTipo.VENDA,
-        valor=total,
+    mov = registrar_caixa_mov(
+        db, atual.id, CaixaMovTipo.VENDA, total,
         descricao=payload.descricao or f"Venda balcao {nome} x{payload.quantidade}",
         criado_em=datetime.now(BR_TZ)
     )
-    db.add(mov)
     db.commit()
     db.refresh(mov)
     return mov
 
-@router.post("/venda-balcao-lote", response_model=CaixaMovOut)
+@router.post("/venda-balcao-lote", response_model=CaixaVendaLoteOut)
+@orcamento_queries(10, repetidas=2, por_produto=3)  # por produto: baixa, estoque_atual e rollup
 def venda_balcao_lote(payload: CaixaVendaLoteIn, db: Session = Depends(get_db), user=Depends(require_caixa)):
     atual = _get_caixa_aberto(db)
     if not atual:
@@ -143,18 +142,13 @@ def venda_balcao_lote(payload: CaixaVendaLoteIn, db: Session = Depends(get_db),
     if not payload.itens:
         raise HTTPException(status_code=400, detail="Informe ao menos um item.")
 
-    total = 0
-    desc_parts = []
     try:
-        for it in payload.itens:
-            subtotal, nome = vender_balcao(db, it.id_produto, it.quantidade)
-            total += subtotal
-            desc_parts.append(f"{nome} x{it.quantidade}")
+        total, linhas = vender_balcao_lote(db, [(it.id_produto, it.quantidade) for it in payload.itens], user.id)
     except ValueError as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
-    descricao = payload.descricao or "Venda balcao: " + ", ".join(desc_parts)
+    descricao = payload.descricao or "Venda balcao: " + ", ".join(f"{l['nome']} x{l['quantidade']}" for l in linhas)
     troco = None
     if payload.pagamento_tipo == "DINHEIRO":
         if payload.valor_recebido is None:
@@ -163,20 +157,17 @@ def venda_balcao_lote(payload: CaixaVendaLoteIn, db: Session = Depends(get_db),
             raise HTTPException(status_code=400, detail="Valor recebido menor que o total.")
         troco = payload.valor_recebido - total
 
-    mov = CaixaMov(
-        id_caixa=atual.id,
-        tipo=CaixaMovTipo.VENDA,
-        valor=total,
+    mov = registrar_caixa_mov(
+        db, atual.id, CaixaMovTipo.VENDA, total,
         descricao=descricao,
         pagamento_tipo=payload.pagamento_tipo,
         valor_recebido=payload.valor_recebido,
         troco=troco,
         criado_em=datetime.now(BR_TZ)
     )
-    db.add(mov)
     db.commit()
     db.refresh(mov)
-    return mov
+    return CaixaVendaLoteOut(**CaixaMovOut.model_validate(mov).model_dump(), itens=linhas)
 
 @router.get("/movimentos", response_model=list[CaixaMovOut])
 def listar_movimentos(db: Session = Depends(get_db), user=Depends(require_vendedor)):
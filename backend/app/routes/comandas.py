@@ -1,18 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
-from datetime import datetime, timedelta
+from sqlalchemy import select
+from datetime import date, datetime, timedelta
+from typing import Optional
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from datetime import timezone
 from app.db.session import get_db
 from app.core.security import require_vendedor
+from app.core.query_budget import orcamento_queries
 from app.models.models import (
-    Comanda, ComandaStatus, ItemComanda, Role, User, Produto,
-    Caixa, CaixaMov, CaixaMovTipo, CaixaStatus
+    Comanda, ComandaStatus, ItemComanda, Role, User,
+    Caixa, CaixaMovTipo, CaixaStatus
 )
-from app.schemas.comandas import ComandaCreate, ComandaOut, AddItemIn, ItemOut
-from app.services.comanda_service import add_item_comanda, remove_item_comanda, cancel_comanda, finalizar_comanda
+from app.schemas.comandas import ComandaCreate, ComandaOut, AddItemIn, AddItensLoteIn, ItemOut
+from app.services.comanda_service import add_item_comanda, add_itens_comanda, remove_item_comanda, cancel_comanda, finalizar_comanda
 from app.services.log_service import log_action
+from app.services.eventos import publicar
+from app.services.caixa_service import registrar_caixa_mov
+from app.services.vendas_service import (
+    resumo_periodo, periodo_anterior, dia_negocio, inicio_dia_negocio, CANAL_COMANDA, CANAL_BALCAO
+)
 
 router = APIRouter(prefix="/comandas", tags=["comandas"])
 try:
@@ -20,11 +27,7 @@ try:
 except ZoneInfoNotFoundError:
     BR_TZ = timezone(timedelta(hours=-3))
 
-def _comanda_to_out(db: Session, c: Comanda) -> dict:
-    vendedor_nome = None
-    vendedor = db.get(User, c.id_vendedor)
-    if vendedor:
-        vendedor_nome = vendedor.nome
+def _comanda_to_out(c: Comanda, vendedor_nome: str | None) -> dict:
     return {
         "id": c.id,
         "id_vendedor": c.id_vendedor,
@@ -35,6 +38,15 @@ def _comanda_to_out(db: Session, c: Comanda) -> dict:
         "vendedor_nome": vendedor_nome,
     }
 
+def _comanda_evento(c: Comanda) -> dict:
+    return {
+        "id": c.id,
+        "id_vendedor": c.id_vendedor,
+        "mesa": c.mesa,
+        "status": c.status,
+        "valor_total": c.valor_total,
+    }
+
 def _ensure_comanda_access(db: Session, id_comanda: int, user):
     comanda = db.get(Comanda, id_comanda)
     if not comanda:
@@ -45,6 +57,7 @@ def _ensure_comanda_access(db: Session, id_comanda: int, user):
 
 
 @router.post("/", response_model=ComandaOut)
+@orcamento_queries(8)
 def criar_comanda(
     request: Request,
     payload: ComandaCreate | None = None,
@@ -59,29 +72,43 @@ def criar_comanda(
     observacao = payload.observacao if payload else None
     c = Comanda(id_vendedor=vendedor_id, mesa=mesa, observacao=observacao, status=ComandaStatus.ABERTA, valor_total=0)
     db.add(c)
+    publicar(db, "comanda.aberta", lambda: _comanda_evento(c), id_vendedor=vendedor_id)
     log_action(db, user.nome, "CRIAR_COMANDA", f"vendedor_id={vendedor_id}", request.client.host if request.client else None)
     db.commit()
     db.refresh(c)
-    return _comanda_to_out(db, c)
+    vendedor_nome = user.nome if vendedor_id == user.id else db.execute(
+        select(User.nome).where(User.id == vendedor_id)
+    ).scalar()
+    return _comanda_to_out(c, vendedor_nome)
 
 @router.get("/abertas", response_model=list[ComandaOut])
+@orcamento_queries(3)
 def listar_abertas(db: Session = Depends(get_db), user=Depends(require_vendedor)):
-    stmt = select(Comanda).where(Comanda.status == ComandaStatus.ABERTA)
+    stmt = select(Comanda, User.nome).outerjoin(User, User.id == Comanda.id_vendedor).where(
+        Comanda.status == ComandaStatus.ABERTA
+    )
     if user.role != Role.ADMIN:
         stmt = stmt.where(Comanda.id_vendedor == user.id)
-    comandas = db.execute(stmt).scalars().all()
-    return [_comanda_to_out(db, c) for c in comandas]
+    return [_comanda_to_out(c, vendedor_nome) for c, vendedor_nome in db.execute(stmt).all()]
 
 @router.get("/{id_comanda}/itens", response_model=list[ItemOut])
+@orcamento_queries(4)
 def listar_itens(id_comanda: int, db: Session = Depends(get_db), user=Depends(require_vendedor)):
     _ensure_comanda_access(db, id_comanda, user)
     return db.execute(select(ItemComanda).where(ItemComanda.id_comanda == id_comanda)).scalars().all()
 
 @router.post("/{id_comanda}/itens")
+@orcamento_queries(25, repetidas=6)  # combo: 3 statements por componente (ate 6 componentes)
 def adicionar_item(id_comanda: int, payload: AddItemIn, request: Request, db: Session = Depends(get_db), user=Depends(require_vendedor)):
-    _ensure_comanda_access(db, id_comanda, user)
+    comanda = _ensure_comanda_access(db, id_comanda, user)
     try:
         res = add_item_comanda(db, id_comanda, payload.id_produto, payload.quantidade)
+        publicar(db, "comanda.item_adicionado", lambda: {
+            "id_comanda": id_comanda,
+            "id_produto": payload.id_produto,
+            "quantidade": payload.quantidade,
+            "valor_total": comanda.valor_total,
+        }, id_vendedor=comanda.id_vendedor)
         log_action(db, user.nome, "ADD_ITEM_COMANDA", f"comanda={id_comanda} produto={payload.id_produto} qtd={payload.quantidade}", request.client.host if request.client else None)
         db.commit()
         return res
@@ -89,14 +116,40 @@ def adicionar_item(id_comanda: int, payload: AddItemIn, request: Request, db: Se
         db.rollback()
         raise HTTPException(400, str(e))
 
+@router.post("/{id_comanda}/itens/lote")
+@orcamento_queries(7, por_produto=3)  # por produto: baixa, estoque_atual e item
+def adicionar_itens_lote(id_comanda: int, payload: AddItensLoteIn, request: Request, db: Session = Depends(get_db), user=Depends(require_vendedor)):
+    comanda = _ensure_comanda_access(db, id_comanda, user)
+    try:
+        novos = add_itens_comanda(db, id_comanda, [(it.id_produto, it.quantidade) for it in payload.itens])
+        publicar(db, "comanda.itens_adicionados", lambda: {
+            "id_comanda": id_comanda,
+            "itens": [{"id_produto": i.id_produto, "quantidade": i.quantidade} for i in novos],
+            "valor_total": comanda.valor_total,
+        }, id_vendedor=comanda.id_vendedor)
+        resumo = " ".join(f"{i.id_produto}x{i.quantidade}" for i in novos)
+        log_action(db, user.nome, "ADD_ITENS_COMANDA", f"comanda={id_comanda} itens={resumo}"[:500], request.client.host if request.client else None)
+        ids = [i.id for i in novos]
+        db.commit()
+        return {"ok": True, "id_comanda": id_comanda, "itens": ids}
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(400, str(e))
+
 @router.delete("/itens/{item_id}")
+@orcamento_queries(26, repetidas=6)  # estorno de combo: 3 statements por componente
 def remover_item(item_id: int, request: Request, db: Session = Depends(get_db), user=Depends(require_vendedor)):
     try:
         item = db.get(ItemComanda, item_id)
         if not item:
             raise HTTPException(status_code=404, detail="Item nao encontrado.")
-        _ensure_comanda_access(db, item.id_comanda, user)
+        comanda = _ensure_comanda_access(db, item.id_comanda, user)
         remove_item_comanda(db, item_id)
+        publicar(db, "comanda.item_removido", lambda: {
+            "id_comanda": comanda.id,
+            "id_item": item_id,
+            "valor_total": comanda.valor_total,
+        }, id_vendedor=comanda.id_vendedor)
         log_action(db, user.nome, "REMOVER_ITEM_COMANDA", f"item_id={item_id}", request.client.host if request.client else None)
         db.commit()
         return {"ok": True}
@@ -106,9 +159,10 @@ def remover_item(item_id: int, request: Request, db: Session = Depends(get_db),
 
 @router.post("/{id_comanda}/cancelar")
 def cancelar(id_comanda: int, request: Request, db: Session = Depends(get_db), user=Depends(require_vendedor)):
-    _ensure_comanda_access(db, id_comanda, user)
+    comanda = _ensure_comanda_access(db, id_comanda, user)
     try:
         cancel_comanda(db, id_comanda)
+        publicar(db, "comanda.cancelada", lambda: _comanda_evento(comanda), id_vendedor=comanda.id_vendedor)
         log_action(db, user.nome, "CANCELAR_COMANDA", f"comanda={id_comanda}", request.client.host if request.client else None)
         db.commit()
         return {"ok": True}
@@ -117,22 +171,21 @@ def cancelar(id_comanda: int, request: Request, db: Session = Depends(get_db), u
         raise HTTPException(400, str(e))
 
 @router.post("/{id_comanda}/finalizar")
+@orcamento_queries(10, por_produto=1)  # um upsert de rollup por produto da comanda
 def finalizar(id_comanda: int, request: Request, db: Session = Depends(get_db), user=Depends(require_vendedor)):
-    _ensure_comanda_access(db, id_comanda, user)
+    comanda = _ensure_comanda_access(db, id_comanda, user)
     try:
-        finalizar_comanda(db, id_comanda)
+        # O total vem do proprio UPDATE que fechou a comanda, nao do objeto ja carregado.
+        total = finalizar_comanda(db, id_comanda)
         log_action(db, user.nome, "FINALIZAR_COMANDA", f"comanda={id_comanda}", request.client.host if request.client else None)
+        publicar(db, "comanda.finalizada", lambda: _comanda_evento(comanda), id_vendedor=comanda.id_vendedor)
         caixa = db.execute(select(Caixa).where(Caixa.status == CaixaStatus.ABERTO)).scalars().first()
         if caixa:
-            comanda = db.get(Comanda, id_comanda)
-            if comanda:
-                db.add(CaixaMov(
-                    id_caixa=caixa.id,
-                    tipo=CaixaMovTipo.VENDA,
-                    valor=comanda.valor_total,
-                    descricao=f"Comanda #{comanda.id}",
-                    criado_em=datetime.now(BR_TZ)
-                ))
+            registrar_caixa_mov(
+                db, caixa.id, CaixaMovTipo.VENDA, total,
+                descricao=f"Comanda #{comanda.id}",
+                criado_em=datetime.now(BR_TZ)
+            )
         db.commit()
         return {"ok": True}
     except ValueError as e:
@@ -140,84 +193,75 @@ def finalizar(id_comanda: int, request: Request, db: Session = Depends(get_db),
         raise HTTPException(400, str(e))
 
 @router.get("/resumo-dia")
+@orcamento_queries(6)
 def resumo_dia(db: Session = Depends(get_db), user=Depends(require_vendedor)):
-    today = datetime.now(BR_TZ)
-    start = today.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Totais vem dos rollups de vendas (canal COMANDA); so a lista de comandas le a tabela.
+    dia = dia_negocio()
+    start = inicio_dia_negocio(dia)
     end = start + timedelta(days=1)
+    id_vendedor = None if user.role == Role.ADMIN else user.id
 
-    base = select(Comanda).where(
-        Comanda.status == ComandaStatus.FINALIZADA,
-        Comanda.atualizada_em >= start,
-        Comanda.atualizada_em < end
-    )
-    if user.role != Role.ADMIN:
-        base = base.where(Comanda.id_vendedor == user.id)
-
-    total_stmt = select(func.coalesce(func.sum(Comanda.valor_total), 0)).where(
-        Comanda.status == ComandaStatus.FINALIZADA,
-        Comanda.atualizada_em >= start,
-        Comanda.atualizada_em < end
-    )
-    if user.role != Role.ADMIN:
-        total_stmt = total_stmt.where(Comanda.id_vendedor == user.id)
-    total_vendas = db.execute(total_stmt).scalar_one()
-
-    comandas = db.execute(base.order_by(Comanda.atualizada_em.desc())).scalars().all()
-
-    prod_stmt = select(
-        Produto.id,
-        Produto.nome,
-        func.sum(ItemComanda.quantidade).label("qtd"),
-        func.sum(ItemComanda.total_item).label("total")
-    ).join(ItemComanda, ItemComanda.id_produto == Produto.id).join(
-        Comanda, Comanda.id == ItemComanda.id_comanda
-    ).where(
-        Comanda.status == ComandaStatus.FINALIZADA,
-        ItemComanda.criado_em >= start,
-        ItemComanda.criado_em < end
-    )
-    if user.role != Role.ADMIN:
-        prod_stmt = prod_stmt.where(Comanda.id_vendedor == user.id)
-    prod_stmt = prod_stmt.group_by(Produto.id, Produto.nome).order_by(func.sum(ItemComanda.total_item).desc())
-
-    produtos = [
-        {"id": pid, "nome": nome, "quantidade": qtd, "total": total}
-        for pid, nome, qtd, total in db.execute(prod_stmt).all()
-    ]
+    resumo = resumo_periodo(db, dia, dia, id_vendedor=id_vendedor, canal=CANAL_COMANDA)
 
-    vend_stmt = select(
-        User.id,
-        User.nome,
-        func.coalesce(func.sum(Comanda.valor_total), 0).label("total")
-    ).join(Comanda, Comanda.id_vendedor == User.id).where(
+    stmt = select(Comanda, User.nome).outerjoin(User, User.id == Comanda.id_vendedor).where(
         Comanda.status == ComandaStatus.FINALIZADA,
         Comanda.atualizada_em >= start,
         Comanda.atualizada_em < end
     )
-    if user.role != Role.ADMIN:
-        vend_stmt = vend_stmt.where(Comanda.id_vendedor == user.id)
-    vend_stmt = vend_stmt.group_by(User.id, User.nome).order_by(func.coalesce(func.sum(Comanda.valor_total), 0).desc())
-
-    vendedores = [
-        {"id": vid, "nome": nome, "total": total}
-        for vid, nome, total in db.execute(vend_stmt).all()
-    ]
-
-    comandas_out = []
-    for c in comandas:
-        vendedor = db.get(User, c.id_vendedor)
-        comandas_out.append({
+    if id_vendedor is not None:
+        stmt = stmt.where(Comanda.id_vendedor == id_vendedor)
+    comandas_out = [
+        {
             "id": c.id,
             "mesa": c.mesa,
             "observacao": c.observacao,
-            "vendedor_nome": vendedor.nome if vendedor else None,
+            "vendedor_nome": vendedor_nome,
             "valor_total": c.valor_total,
             "finalizada_em": c.atualizada_em,
-        })
+        }
+        for c, vendedor_nome in db.execute(stmt.order_by(Comanda.atualizada_em.desc())).all()
+    ]
 
     return {
-        "total_vendas": total_vendas,
-        "produtos": produtos,
-        "vendedores": vendedores,
+        "total_vendas": resumo["total_vendas"],
+        "produtos": resumo["produtos"],
+        "vendedores": resumo["vendedores"],
         "comandas_finalizadas": comandas_out,
     }
+
+@router.get("/resumo-periodo")
+def resumo_por_periodo(
+    inicio: date,
+    fim: Optional[date] = None,
+    canal: Optional[str] = None,
+    comparar: bool = False,
+    comparar_inicio: Optional[date] = None,
+    comparar_fim: Optional[date] = None,
+    db: Session = Depends(get_db),
+    user=Depends(require_vendedor)
+):
+    # Periodo [inicio, fim] (padrao: so inicio) e, opcionalmente, um periodo de comparacao:
+    # o informado em comparar_inicio/comparar_fim ou, com comparar=true, o anterior de mesmo tamanho.
+    fim = fim or inicio
+    if fim < inicio:
+        raise HTTPException(400, "Periodo invalido.")
+    if canal and canal not in (CANAL_COMANDA, CANAL_BALCAO):
+        raise HTTPException(400, "Canal invalido.")
+    id_vendedor = None if user.role == Role.ADMIN else user.id
+
+    out = {"periodo": resumo_periodo(db, inicio, fim, id_vendedor=id_vendedor, canal=canal), "comparacao": None}
+    if comparar_inicio:
+        comparar_fim = comparar_fim or comparar_inicio + (fim - inicio)
+        if comparar_fim < comparar_inicio:
+            raise HTTPException(400, "Periodo de comparacao invalido.")
+    elif comparar:
+        comparar_inicio, comparar_fim = periodo_anterior(inicio, fim)
+    if comparar_inicio:
+        comp = resumo_periodo(db, comparar_inicio, comparar_fim, id_vendedor=id_vendedor, canal=canal)
+        atual, anterior = out["periodo"]["total_vendas"], comp["total_vendas"]
+        out["comparacao"] = comp
+        out["variacao"] = {
+            "total_vendas": atual - anterior,
+            "percentual": round((atual - anterior) / anterior * 100, 2) if anterior else None,
+        }
+    return out
@@ -0,0 +1,69 @@
+import asyncio
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from starlette.concurrency import run_in_threadpool
+
+from app.db.session import SessionLocal
+from app.core.security import usuario_do_token
+from app.services.eventos import hub, Assinatura, ROLES_POR_PERM, PERM_CAIXA
+
+router = APIRouter(prefix="/eventos", tags=["eventos"])
+
+def _autenticar(token: str) -> tuple[int, str] | None:
+    db = SessionLocal()
+    try:
+        user = usuario_do_token(db, token)
+        if not user:
+            return None
+        role = user.role.value if hasattr(user.role, "value") else user.role
+        return user.id, role
+    finally:
+        db.close()
+
+@router.websocket("/ws")
+async def eventos_ws(websocket: WebSocket, token: str = Query(...), desde: int | None = None):
+    # Navegadores nao enviam Authorization em websocket: o JWT vem na query string.
+    auth = await run_in_threadpool(_autenticar, token)
+    if not auth or auth[1] not in ROLES_POR_PERM[PERM_CAIXA]:
+        await websocket.close(code=1008)
+        return
+    user_id, role = auth
+
+    await websocket.accept()
+    sub = Assinatura(asyncio.get_running_loop(), role, user_id)
+    hub.conectar(sub)
+    try:
+        ultimo = hub.ultimo_id
+        reenviados: set[int] = set()
+        if desde is not None and desde < ultimo:
+            # Reconexao: reenvia o que o cliente perdeu (dentro da retencao da outbox).
+            for id_evento, eventos in await run_in_threadpool(hub.replay, desde, ultimo):
+                reenviados.add(id_evento)
+                msg = sub.filtrar(id_evento, eventos)
+                if msg is not None:
+                    await websocket.send_json(msg)
+        await websocket.send_json({"id": ultimo, "eventos": [{"tipo": "conectado", "dados": None}]})
+
+        async def enviar():
+            while True:
+                msg = await sub.queue.get()
+                if msg["id"] in reenviados:
+                    continue
+                await websocket.send_json(msg)
+
+        async def receber():
+            while True:
+                await websocket.receive_text()
+
+        tasks = [asyncio.create_task(enviar()), asyncio.create_task(receber())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in pending:
+            t.cancel()
+        for t in done:
+            exc = t.exception()
+            if exc and not isinstance(exc, WebSocketDisconnect):
+                raise exc
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.desconectar(sub)
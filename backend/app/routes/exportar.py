@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.core.security import require_admin
+from app.models.models import CaixaMov, Comanda, ItemComanda, MovEstoque, Produto
+from app.services.exportacao import linhas_do_banco, csv_stream, ndjson_stream, gzip_stream
+
+router = APIRouter(prefix="/exportar", tags=["exportar"])
+
+Formato = Literal["csv", "ndjson"]
+
+def _periodo(stmt, col, desde: datetime | None, ate: datetime | None):
+    if desde:
+        stmt = stmt.where(col >= desde)
+    if ate:
+        stmt = stmt.where(col < ate)
+    return stmt
+
+def _resposta(nome: str, stmt, formato: str, gz: bool) -> StreamingResponse:
+    colunas = list(stmt.selected_columns.keys())
+    rows = linhas_do_banco(stmt)
+    corpo = csv_stream(colunas, rows) if formato == "csv" else ndjson_stream(colunas, rows)
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    arquivo = f"{nome}.{formato}"
+    if gz:
+        corpo = gzip_stream(corpo)
+        media_type = "application/gzip"
+        arquivo += ".gz"
+    return StreamingResponse(corpo, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{arquivo}"'
+    })
+
+@router.get("/itens-comanda")
+def exportar_itens_comanda(
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    formato: Formato = "csv",
+    gzip: bool = False,
+    admin=Depends(require_admin)
+):
+    stmt = select(
+        ItemComanda.id,
+        ItemComanda.id_comanda,
+        Comanda.status.label("status_comanda"),
+        Comanda.id_vendedor,
+        ItemComanda.id_produto,
+        Produto.nome.label("produto_nome"),
+        ItemComanda.quantidade,
+        ItemComanda.preco_unitario,
+        ItemComanda.total_item,
+        ItemComanda.criado_em,
+    ).join(Comanda, Comanda.id == ItemComanda.id_comanda).join(Produto, Produto.id == ItemComanda.id_produto)
+    stmt = _periodo(stmt, ItemComanda.criado_em, desde, ate).order_by(ItemComanda.id)
+    return _resposta("itens_comanda", stmt, formato, gzip)
+
+@router.get("/movimentos-estoque")
+def exportar_movimentos_estoque(
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    formato: Formato = "csv",
+    gzip: bool = False,
+    admin=Depends(require_admin)
+):
+    stmt = select(
+        MovEstoque.id,
+        MovEstoque.data_hora,
+        MovEstoque.id_produto,
+        Produto.nome.label("produto_nome"),
+        MovEstoque.tipo,
+        MovEstoque.quantidade,
+        MovEstoque.id_comanda,
+        MovEstoque.id_item_comanda,
+        MovEstoque.detalhe,
+    ).join(Produto, Produto.id == MovEstoque.id_produto)
+    stmt = _periodo(stmt, MovEstoque.data_hora, desde, ate).order_by(MovEstoque.data_hora, MovEstoque.id)
+    return _resposta("movimentos_estoque", stmt, formato, gzip)
+
+@router.get("/caixa-movimentos")
+def exportar_caixa_movimentos(
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    formato: Formato = "csv",
+    gzip: bool = False,
+    admin=Depends(require_admin)
+):
+    stmt = select(
+        CaixaMov.id,
+        CaixaMov.id_caixa,
+        CaixaMov.criado_em,
+        CaixaMov.tipo,
+        CaixaMov.valor,
+        CaixaMov.pagamento_tipo,
+        CaixaMov.valor_recebido,
+        CaixaMov.troco,
+        CaixaMov.descricao,
+    )
+    stmt = _periodo(stmt, CaixaMov.criado_em, desde, ate).order_by(CaixaMov.id)
+    return _resposta("caixa_movimentos", stmt, formato, gzip)
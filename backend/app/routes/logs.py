@@ -1,14 +1,53 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from app.db.session import get_db
 from app.core.security import require_admin
 from app.models.models import LogAcao
 from app.schemas.logs import LogOut
+from app.services.log_service import log_buffer
+from app.services.paginacao import apos_cursor, proximo_cursor
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 @router.get("/", response_model=list[LogOut])
-def listar_logs(limit: int = 200, db: Session = Depends(get_db), admin=Depends(require_admin)):
-    q = select(LogAcao).order_by(LogAcao.data_hora.desc()).limit(min(limit, 1000))
-    return db.execute(q).scalars().all()
+def listar_logs(
+    response: Response,
+    limit: int = Query(200, ge=1),
+    cursor: Optional[str] = None,
+    usuario: Optional[str] = None,
+    acao: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin)
+):
+    # Paginacao por cursor: a proxima pagina vem no header X-Next-Cursor (ausente na ultima).
+    limit = min(limit, 1000)
+    q = select(LogAcao)
+    if usuario:
+        q = q.where(LogAcao.usuario == usuario)
+    if acao:
+        q = q.where(LogAcao.acao == acao)
+    if desde:
+        q = q.where(LogAcao.data_hora >= desde)
+    if ate:
+        q = q.where(LogAcao.data_hora < ate)
+    if cursor:
+        try:
+            q = q.where(apos_cursor(LogAcao.data_hora, LogAcao.id, cursor))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    rows = db.execute(q.order_by(LogAcao.data_hora.desc(), LogAcao.id.desc()).limit(limit)).scalars().all()
+    prox = proximo_cursor(rows, limit, "data_hora")
+    if prox:
+        response.headers["X-Next-Cursor"] = prox
+    return rows
+
+@router.get("/buffer")
+def buffer_stats(admin=Depends(require_admin)):
+    return log_buffer.stats()
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.metrics import registro
+from app.core.user_cache import user_cache
+from app.db.pool import pool_metrics
+from app.db.session import engine
+from app.services.log_service import log_buffer
+
+router = APIRouter(tags=["metricas"])
+
+def _pool(campo: str):
+    return lambda: {(): pool_metrics.stats(engine.pool).get(campo) or 0}
+
+registro.gauge("db_pool_in_use", "Conexoes do pool em uso.", coletar=_pool("em_uso"))
+registro.gauge("db_pool_overflow", "Conexoes de overflow abertas.", coletar=_pool("overflow"))
+registro.gauge("db_pool_saturation", "Fracao do pool (tamanho + overflow) em uso.", coletar=_pool("saturacao"))
+# Acumulados desde o boot do worker: counters lidos no scrape (rate() no Prometheus).
+registro.counter("db_pool_checkout_timeouts_total", "Timeouts esperando conexao do pool.", coletar=_pool("timeouts"))
+registro.counter("db_pool_checkout_wait_seconds_total", "Tempo total esperando conexao do pool.", coletar=lambda: {(): pool_metrics.espera_total_s})
+registro.gauge("user_cache_hit_ratio", "Hit ratio do cache de usuarios.", coletar=lambda: {(): user_cache.stats()["hit_ratio"] or 0})
+registro.gauge("log_buffer_pending", "Registros de log aguardando gravacao.", coletar=lambda: {(): log_buffer.stats()["pendentes"]})
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics(authorization: str | None = Header(default=None)):
+    # Formato texto do Prometheus. Com METRICS_TOKEN, exige "Authorization: Bearer <token>".
+    if settings.METRICS_TOKEN and authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de metricas invalido.")
+    return PlainTextResponse(registro.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
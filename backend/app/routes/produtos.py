@@ -1,24 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from sqlalchemy import select, delete
 from app.db.session import get_db
 from app.core.security import require_admin, require_caixa
-from decimal import Decimal
+from app.core.query_budget import orcamento_queries
 from app.models.models import Produto, ProdutoTipo, ProdutoComponente, MovEstoque, TipoMov
 from app.schemas.produtos import (
     ProdutoCreate, ProdutoUpdate, ProdutoOut, ComponenteIn,
     EstoqueEntradaIn, EstoqueSaidaIn, MovEstoqueOut
 )
 from app.services.log_service import log_action
-from app.services.produto_service import produto_to_display
+from app.services.produto_service import produto_to_display, produtos_to_display
+from app.services.estoque_service import registrar_mov, inserir_movs, baixar_saldo, ajustar_estoque_atual
+from app.services.bom_cache import invalidar_bom
+from app.services.paginacao import apos_cursor, proximo_cursor
+from app.services.catalogo_cache import obter_catalogo, invalidar_catalogo
 
 router = APIRouter(prefix="/produtos", tags=["produtos"])
+_catalogo_adapter = TypeAdapter(list[ProdutoOut])
+
+def _etag_match(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 @router.get("", response_model=list[ProdutoOut])
 @router.get("/", response_model=list[ProdutoOut])
-def listar_produtos(db: Session = Depends(get_db), user=Depends(require_caixa)):
-    produtos = db.execute(select(Produto).where(Produto.ativo == True)).scalars().all()
-    return [produto_to_display(db, p) for p in produtos]
+@orcamento_queries(5)
+def listar_produtos(request: Request, db: Session = Depends(get_db), user=Depends(require_caixa)):
+    def build() -> bytes:
+        produtos = db.execute(select(Produto).where(Produto.ativo == True)).scalars().all()
+        return _catalogo_adapter.dump_json(_catalogo_adapter.validate_python(produtos_to_display(db, produtos)))
+
+    # Com o cache valido nem monta o catalogo; o ETag (hash do corpo) vale em qualquer worker.
+    corpo, etag = obter_catalogo(db, build)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
 
 @router.post("", response_model=ProdutoOut)
 @router.post("/", response_model=ProdutoOut)
@@ -33,6 +57,7 @@ def criar_produto(payload: ProdutoCreate, request: Request, db: Session = Depend
         ativo=payload.ativo
     )
     db.add(p)
+    invalidar_catalogo(db)
     log_action(db, admin.nome, "CRIAR_PRODUTO", f"{payload.nome} tipo={tipo}", request.client.host if request.client else None)
     db.commit()
     db.refresh(p)
@@ -43,13 +68,17 @@ def atualizar_produto(id_produto: int, payload: ProdutoUpdate, request: Request,
     p = db.get(Produto, id_produto)
     if not p:
         raise HTTPException(404, "Produto não encontrado.")
-    for k, v in payload.model_dump(exclude_unset=True).items():
+    dados = payload.model_dump(exclude_unset=True)
+    if ("ativo" in dados and dados["ativo"] != p.ativo) or ("tipo" in dados and dados["tipo"] != p.tipo):
+        invalidar_bom(db)
+    for k, v in dados.items():
         if k == "tipo" and v is not None:
             if v not in ("SIMPLES","COMBO"):
                 raise HTTPException(400, "tipo inválido.")
             setattr(p, k, ProdutoTipo(v))
         else:
             setattr(p, k, v)
+    invalidar_catalogo(db)
     log_action(db, admin.nome, "ATUALIZAR_PRODUTO", f"id={id_produto}", request.client.host if request.client else None)
     db.commit()
     db.refresh(p)
@@ -65,10 +94,12 @@ def definir_componentes_combo(id_combo: int, comps: list[ComponenteIn], request:
 
     # limpa existentes e recria
     db.execute(delete(ProdutoComponente).where(ProdutoComponente.id_produto_combo == id_combo))
+    ids = {c.id_produto_componente for c in comps}
+    produtos = {p.id: p for p in db.execute(select(Produto).where(Produto.id.in_(ids))).scalars()} if ids else {}
     for c in comps:
         if c.quantidade <= 0:
             raise HTTPException(400, "quantidade do componente inválida.")
-        comp_prod = db.get(Produto, c.id_produto_componente)
+        comp_prod = produtos.get(c.id_produto_componente)
         if not comp_prod:
             raise HTTPException(404, f"Componente id={c.id_produto_componente} não encontrado.")
         if comp_prod.tipo != ProdutoTipo.SIMPLES:
@@ -79,6 +110,8 @@ def definir_componentes_combo(id_combo: int, comps: list[ComponenteIn], request:
             quantidade=c.quantidade
         ))
 
+    invalidar_catalogo(db)
+    invalidar_bom(db)
     log_action(db, admin.nome, "DEFINIR_COMPONENTES_COMBO", f"combo_id={id_combo} comps={len(comps)}", request.client.host if request.client else None)
     db.commit()
     return {"ok": True}
@@ -88,23 +121,23 @@ def entrada_estoque(id_produto: int, payload: EstoqueEntradaIn, request: Request
     if payload.quantidade <= 0:
         raise HTTPException(400, "quantidade invalida.")
 
-    row = db.execute(
-        select(Produto).where(Produto.id == id_produto).with_for_update()
-    ).scalar_one_or_none()
+    row = db.get(Produto, id_produto)
     if not row:
         raise HTTPException(404, "Produto nao encontrado.")
     if row.tipo != ProdutoTipo.SIMPLES:
         raise HTTPException(400, "Entrada de estoque permitida apenas para produto SIMPLES.")
 
-    row.estoque_atual = Decimal(row.estoque_atual) + payload.quantidade
-    db.add(MovEstoque(
+    # Mesma ordem de travas das vendas: saldos_estoque primeiro, depois produtos.
+    registrar_mov(
+        db,
         id_comanda=None,
         id_item_comanda=None,
         id_produto=row.id,
         tipo=TipoMov.ENTRADA,
         quantidade=payload.quantidade,
         detalhe=f"Entrada estoque data={payload.data_entrada} validade={payload.validade}"
-    ))
+    )
+    ajustar_estoque_atual(db, row.id, payload.quantidade)
     log_action(db, admin.nome, "ENTRADA_ESTOQUE", f"id_produto={row.id} qtd={payload.quantidade}", request.client.host if request.client else None)
     db.commit()
     return {"ok": True}
@@ -114,44 +147,77 @@ def saida_estoque(id_produto: int, payload: EstoqueSaidaIn, request: Request, db
     if payload.quantidade <= 0:
         raise HTTPException(400, "quantidade invalida.")
 
-    row = db.execute(
-        select(Produto).where(Produto.id == id_produto).with_for_update()
-    ).scalar_one_or_none()
+    row = db.get(Produto, id_produto)
     if not row:
         raise HTTPException(404, "Produto nao encontrado.")
     if row.tipo != ProdutoTipo.SIMPLES:
         raise HTTPException(400, "Saida de estoque permitida apenas para produto SIMPLES.")
-    if Decimal(row.estoque_atual) < payload.quantidade:
+    # Baixa condicional no saldo (UPDATE ... WHERE saldo >= :q), como nas vendas: a checagem
+    # e a baixa sao o mesmo comando, e saldos_estoque trava antes de produtos.
+    ok, _ = baixar_saldo(db, row.id, payload.quantidade)
+    if not ok:
         raise HTTPException(400, "Estoque insuficiente para saida.")
-
-    row.estoque_atual = Decimal(row.estoque_atual) - payload.quantidade
-    db.add(MovEstoque(
-        id_comanda=None,
-        id_item_comanda=None,
-        id_produto=row.id,
-        tipo=TipoMov.BAIXA,
-        quantidade=payload.quantidade,
-        detalhe=payload.detalhe or f"Saida estoque data={payload.data_saida}"
-    ))
+    ajustar_estoque_atual(db, row.id, -payload.quantidade)
+    inserir_movs(db, [{
+        "id_comanda": None,
+        "id_item_comanda": None,
+        "id_produto": row.id,
+        "tipo": TipoMov.BAIXA,
+        "quantidade": payload.quantidade,
+        "detalhe": payload.detalhe or f"Saida estoque data={payload.data_saida}",
+    }])
     log_action(db, admin.nome, "SAIDA_ESTOQUE", f"id_produto={row.id} qtd={payload.quantidade}", request.client.host if request.client else None)
     db.commit()
     return {"ok": True}
 
 @router.get("/movimentos", response_model=list[MovEstoqueOut])
-def listar_movimentos(db: Session = Depends(get_db), admin=Depends(require_admin)):
-    rows = db.execute(
-        select(MovEstoque, Produto).join(Produto, Produto.id == MovEstoque.id_produto).order_by(MovEstoque.data_hora.desc())
-    ).all()
+def listar_movimentos(
+    response: Response,
+    limit: int = Query(200, ge=1),
+    cursor: Optional[str] = None,
+    id_produto: Optional[int] = None,
+    tipo: Optional[TipoMov] = None,
+    id_comanda: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin)
+):
+    # Uma pagina por vez (data_hora desc, id desc); a proxima vem no header X-Next-Cursor.
+    limit = min(limit, 1000)
+    q = select(MovEstoque, Produto.nome).join(Produto, Produto.id == MovEstoque.id_produto)
+    if id_produto is not None:
+        q = q.where(MovEstoque.id_produto == id_produto)
+    if tipo is not None:
+        q = q.where(MovEstoque.tipo == tipo)
+    if id_comanda is not None:
+        q = q.where(MovEstoque.id_comanda == id_comanda)
+    if desde:
+        q = q.where(MovEstoque.data_hora >= desde)
+    if ate:
+        q = q.where(MovEstoque.data_hora < ate)
+    if cursor:
+        try:
+            q = q.where(apos_cursor(MovEstoque.data_hora, MovEstoque.id, cursor))
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    rows = db.execute(q.order_by(MovEstoque.data_hora.desc(), MovEstoque.id.desc()).limit(limit)).all()
+    prox = proximo_cursor([mov for mov, _ in rows], limit, "data_hora")
+    if prox:
+        response.headers["X-Next-Cursor"] = prox
     return [
         MovEstoqueOut(
             id=mov.id,
             id_produto=mov.id_produto,
-            produto_nome=prod.nome,
+            produto_nome=nome,
             tipo=mov.tipo.value if hasattr(mov.tipo, "value") else mov.tipo,
             quantidade=mov.quantidade,
             data_hora=mov.data_hora,
-            detalhe=mov.detalhe
+            detalhe=mov.detalhe,
+            id_comanda=mov.id_comanda,
+            id_item_comanda=mov.id_item_comanda
         )
-        for mov, prod in rows
+        for mov, nome in rows
     ]
 
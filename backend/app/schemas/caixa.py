@@ -53,3 +53,33 @@ class CaixaMovOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class CaixaVendaLinhaOut(BaseModel):
+    id_produto: int
+    nome: str
+    quantidade: Decimal
+    preco_unitario: Decimal
+    subtotal: Decimal
+
+class CaixaVendaLoteOut(CaixaMovOut):
+    itens: list[CaixaVendaLinhaOut] = []
+
+class CaixaResumoOut(BaseModel):
+    id_caixa: int
+    status: str
+    aberto_em: datetime
+    fechado_em: Optional[datetime] = None
+    saldo_inicial: Decimal
+    vendas: Decimal
+    vendas_dinheiro: Decimal
+    vendas_cartao: Decimal
+    vendas_sem_pagamento: Decimal
+    qtd_vendas: int
+    reforcos: Decimal
+    sangrias: Decimal
+    ajustes: Decimal
+    qtd_movimentos: int
+    saldo_esperado: Decimal
+    dinheiro_esperado: Decimal
+    saldo_final: Optional[Decimal] = None
+    diferenca: Optional[Decimal] = None
@@ -23,6 +23,9 @@ class AddItemIn(BaseModel):
     id_produto: int
     quantidade: Decimal = 1
 
+class AddItensLoteIn(BaseModel):
+    itens: List[AddItemIn]
+
 class ItemOut(BaseModel):
     id: int
     id_comanda: int
@@ -59,3 +59,5 @@ class MovEstoqueOut(BaseModel):
     quantidade: Decimal
     data_hora: Optional[datetime]
     detalhe: Optional[str] = None
+    id_comanda: Optional[int] = None
+    id_item_comanda: Optional[int] = None
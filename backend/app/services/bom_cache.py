@@ -0,0 +1,69 @@
+import threading
+from decimal import Decimal
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.db.session import on_commit
+from app.models.models import ProdutoComponente
+from app.services.eventos import hub, publicar, PERM_INTERNO
+
+# Ficha tecnica dos combos (id do combo -> ((id do componente, quantidade), ...)) em
+# memoria. So muda em definir_componentes_combo e em mudancas de ativo/tipo de produto;
+# essas rotas chamam invalidar_bom, e os outros workers recebem o evento bom.alterado.
+
+Bom = tuple[tuple[int, Decimal], ...]
+
+_lock = threading.Lock()
+_versao = 1
+_cache: tuple[int, dict[int, Bom]] | None = None
+
+def versao_bom() -> int:
+    return _versao
+
+def _bump():
+    global _versao, _cache
+    with _lock:
+        _versao += 1
+        _cache = None
+
+def invalidar_bom(db: Session):
+    on_commit(db, _bump)
+    publicar(db, "bom.alterado", {}, perm=PERM_INTERNO, chave="bom")
+
+def _carregar(db: Session) -> dict[int, Bom]:
+    boms: dict[int, list[tuple[int, Decimal]]] = {}
+    for combo_id, comp_id, quantidade in db.execute(
+        select(ProdutoComponente.id_produto_combo, ProdutoComponente.id_produto_componente, ProdutoComponente.quantidade)
+        .order_by(ProdutoComponente.id)
+    ).all():
+        boms.setdefault(combo_id, []).append((comp_id, Decimal(quantidade)))
+    return {cid: tuple(comps) for cid, comps in boms.items()}
+
+@event.listens_for(Session, "after_begin")
+def _versao_da_transacao(session, transaction, connection):
+    # Mesma regra do catalogo_cache: a ficha lida numa transacao vale para a versao de
+    # quando ela abriu (o snapshot do SQLite e desse momento em diante).
+    session.info["versao_bom"] = _versao
+
+def boms(db: Session) -> dict[int, Bom]:
+    # Uma consulta por versao; todas as fichas sao pequenas, entao carrega tudo de uma vez.
+    global _cache
+    cached = _cache
+    if cached and cached[0] == _versao:
+        return cached[1]
+    dados = _carregar(db)
+    versao = db.info.get("versao_bom")
+    with _lock:
+        # So guarda se nada invalidou desde que a transacao abriu.
+        if _versao == versao:
+            _cache = (versao, dados)
+    return dados
+
+def componentes_combo(db: Session, combo_id: int) -> Bom:
+    return boms(db).get(combo_id, ())
+
+def aquecer(db: Session) -> int:
+    return len(boms(db))
+
+hub.assinar("bom.", lambda ev: _bump())
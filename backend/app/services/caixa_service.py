@@ -0,0 +1,129 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.db.session import upsert_somando
+from app.models.models import (
+    Caixa, CaixaMov, CaixaMovTipo, CaixaStatus, CaixaTotais, PagamentoTipo, now_br
+)
+from app.services.eventos import publicar_caixa_mov
+
+CAMPOS_TOTAIS = (
+    "saldo_inicial", "vendas", "vendas_dinheiro", "vendas_cartao", "qtd_vendas",
+    "reforcos", "sangrias", "ajustes", "qtd_movs",
+)
+
+def _incrementos(tipo: CaixaMovTipo, valor: Decimal, pagamento_tipo) -> dict:
+    inc = {"qtd_movs": 1}
+    valor = Decimal(valor)
+    if tipo == CaixaMovTipo.ABERTURA:
+        inc["saldo_inicial"] = valor
+    elif tipo == CaixaMovTipo.VENDA:
+        inc["vendas"] = valor
+        inc["qtd_vendas"] = 1
+        if pagamento_tipo == PagamentoTipo.DINHEIRO:
+            inc["vendas_dinheiro"] = valor
+        elif pagamento_tipo == PagamentoTipo.CARTAO:
+            inc["vendas_cartao"] = valor
+    elif tipo == CaixaMovTipo.REFORCO:
+        inc["reforcos"] = valor
+    elif tipo == CaixaMovTipo.SANGRIA:
+        inc["sangrias"] = valor
+    elif tipo == CaixaMovTipo.AJUSTE:
+        inc["ajustes"] = valor
+    # FECHAMENTO so registra o total; nao altera os contadores.
+    return inc
+
+def registrar_caixa_mov(
+    db: Session,
+    id_caixa: int,
+    tipo: CaixaMovTipo,
+    valor: Decimal,
+    descricao: str | None = None,
+    pagamento_tipo: str | None = None,
+    valor_recebido: Decimal | None = None,
+    troco: Decimal | None = None,
+    criado_em: datetime | None = None,
+) -> CaixaMov:
+    # Todo CaixaMov passa por aqui: grava o movimento e soma caixa_totais na mesma transacao.
+    pagamento_tipo = PagamentoTipo(pagamento_tipo) if pagamento_tipo else None
+    mov = CaixaMov(
+        id_caixa=id_caixa,
+        tipo=tipo,
+        valor=valor,
+        descricao=descricao,
+        pagamento_tipo=pagamento_tipo,
+        valor_recebido=valor_recebido,
+        troco=troco,
+        criado_em=criado_em or now_br()
+    )
+    db.add(mov)
+    upsert_somando(db, CaixaTotais.__table__, {"id_caixa": id_caixa}, _incrementos(tipo, valor, pagamento_tipo))
+    publicar_caixa_mov(db, mov)
+    return mov
+
+def totais_caixa(db: Session, id_caixa: int) -> dict:
+    # Core select, nao db.get: a linha muda por UPDATE direto e o objeto da sessao ficaria velho.
+    t = CaixaTotais.__table__
+    row = db.execute(select(*[t.c[c] for c in CAMPOS_TOTAIS]).where(t.c.id_caixa == id_caixa)).first()
+    return {c: (getattr(row, c) if row else 0) for c in CAMPOS_TOTAIS}
+
+def resumo_caixa(db: Session, caixa: Caixa) -> dict:
+    # Resumo ao vivo (caixa aberto) ou relatorio Z (fechado), sem ler caixa_movimentos.
+    t = {c: Decimal(v) for c, v in totais_caixa(db, caixa.id).items()}
+    vendas_sem_pagamento = t["vendas"] - t["vendas_dinheiro"] - t["vendas_cartao"]
+    saldo_esperado = t["saldo_inicial"] + t["vendas"] + t["reforcos"] - t["sangrias"] + t["ajustes"]
+    dinheiro_esperado = t["saldo_inicial"] + t["vendas_dinheiro"] + t["reforcos"] - t["sangrias"] + t["ajustes"]
+    fechado = caixa.status == CaixaStatus.FECHADO
+    return {
+        "id_caixa": caixa.id,
+        "status": caixa.status.value if hasattr(caixa.status, "value") else caixa.status,
+        "aberto_em": caixa.aberto_em,
+        "fechado_em": caixa.fechado_em,
+        "saldo_inicial": t["saldo_inicial"],
+        "vendas": t["vendas"],
+        "vendas_dinheiro": t["vendas_dinheiro"],
+        "vendas_cartao": t["vendas_cartao"],
+        "vendas_sem_pagamento": vendas_sem_pagamento,
+        "qtd_vendas": int(t["qtd_vendas"]),
+        "reforcos": t["reforcos"],
+        "sangrias": t["sangrias"],
+        "ajustes": t["ajustes"],
+        "qtd_movimentos": int(t["qtd_movs"]),
+        "saldo_esperado": saldo_esperado,
+        "dinheiro_esperado": dinheiro_esperado,
+        "saldo_final": caixa.saldo_final if fechado else None,
+        "diferenca": (Decimal(caixa.saldo_final) - saldo_esperado) if fechado and caixa.saldo_final is not None else None,
+    }
+
+def _totais_do_ledger(db: Session, id_caixa: int) -> dict:
+    totais = {c: Decimal(0) for c in CAMPOS_TOTAIS}
+    rows = db.execute(
+        select(CaixaMov.tipo, CaixaMov.pagamento_tipo, func.count(), func.coalesce(func.sum(CaixaMov.valor), 0))
+        .where(CaixaMov.id_caixa == id_caixa)
+        .group_by(CaixaMov.tipo, CaixaMov.pagamento_tipo)
+    ).all()
+    for tipo, pagamento_tipo, n, valor in rows:
+        inc = _incrementos(tipo, Decimal(valor), pagamento_tipo)
+        inc["qtd_movs"] = n
+        if "qtd_vendas" in inc:
+            inc["qtd_vendas"] = n
+        for c, v in inc.items():
+            totais[c] += v
+    return totais
+
+def garantir_caixa_totais(db: Session) -> int:
+    # Backfill unico dos caixas criados antes de caixa_totais.
+    faltando = db.execute(
+        select(Caixa.id)
+        .outerjoin(CaixaTotais, CaixaTotais.id_caixa == Caixa.id)
+        .where(CaixaTotais.id_caixa.is_(None))
+    ).scalars().all()
+    for id_caixa in faltando:
+        t = _totais_do_ledger(db, id_caixa)
+        db.add(CaixaTotais(id_caixa=id_caixa, **{c: int(v) if c.startswith("qtd_") else v for c, v in t.items()}))
+    if faltando:
+        db.commit()
+    return len(faltando)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import socket
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db.session import on_commit
+from app.services.eventos import hub, publicar, PERM_INTERNO
+
+# Catalogo serializado em memoria, por processo. Invalidacoes valem no commit neste
+# worker e chegam aos demais pelo evento catalogo.alterado. O ETag e o hash do corpo:
+# igual em todos os workers e entre restarts, entao um 304 nunca cobre conteudo diferente.
+_lock = threading.Lock()
+_versao = 1
+_cache: tuple[int, bytes, str] | None = None
+
+def _origem() -> str:
+    # Calculado na chamada: com gunicorn --preload o modulo e importado antes do fork.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def catalogo_etag(corpo: bytes) -> str:
+    return f'W/"produtos-{hashlib.blake2b(corpo, digest_size=12).hexdigest()}"'
+
+def _bump():
+    global _versao, _cache
+    with _lock:
+        _versao += 1
+        _cache = None
+
+def invalidar_catalogo(db: Session | None = None):
+    # Com sessao, a versao so avanca depois do commit (leitores nao cacheiam dado antigo
+    # sob a versao nova) e os outros workers recebem o evento; sem sessao, avanca na hora
+    # e so neste processo.
+    if db is None:
+        _bump()
+        return
+    on_commit(db, _bump)
+    publicar(db, "catalogo.alterado", {"origem": _origem()}, perm=PERM_INTERNO, chave="catalogo")
+
+@event.listens_for(Session, "after_begin")
+def _versao_da_transacao(session, transaction, connection):
+    # Versao vista quando a transacao abriu. O snapshot do SQLite comeca no primeiro SELECT
+    # depois do BEGIN, entao um catalogo lido nessa transacao nunca e mais antigo que ela.
+    session.info["versao_catalogo"] = _versao
+
+def obter_catalogo(db: Session, build) -> tuple[bytes, str]:
+    global _cache
+    cached = _cache
+    if cached and cached[0] == _versao:
+        return cached[1], cached[2]
+    corpo = build()
+    etag = catalogo_etag(corpo)
+    # A versao que vale e a do inicio da transacao que leu o catalogo, nao a de agora: a
+    # transacao pode ter aberto antes de uma invalidacao e lido o dado antigo.
+    versao = db.info.get("versao_catalogo")
+    with _lock:
+        # So guarda se ninguem invalidou desde que a transacao abriu.
+        if _versao == versao:
+            _cache = (versao, corpo, etag)
+    return corpo, etag
+
+def _invalidado_em_outro_worker(ev: dict):
+    # O worker de origem ja invalidou no proprio commit.
+    if ev["dados"].get("origem") != _origem():
+        _bump()
+
+hub.assinar("catalogo.", _invalidado_em_outro_worker)
@@ -1,207 +1,226 @@
-from sqlalchemy import select, func
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from decimal import Decimal
 
+from app.core.query_budget import produtos_no_request
+from app.db.session import update_returning
 from app.models.models import (
-    Produto, ProdutoTipo, ProdutoComponente,
+    Produto, ProdutoTipo,
     Comanda, ComandaStatus, ItemComanda,
-    MovEstoque, TipoMov
+    TipoMov, now_br
 )
+from app.services.estoque_service import (
+    registrar_movs, inserir_movs, baixar_saldo, ajustar_estoque_atual
+)
+from app.services.bom_cache import Bom, boms, componentes_combo
+from app.services.vendas_service import registrar_venda, registrar_venda_comanda, CANAL_BALCAO
+
+def _planejar_baixa(db: Session, itens: list[tuple[int, Decimal]]):
+    # Agrega as quantidades por produto e carrega numa consulta os produtos e os
+    # componentes dos combos; a ficha dos combos vem do cache (bom_cache).
+    qtd_por_produto: dict[int, Decimal] = {}
+    for id_produto, qtd in itens:
+        qtd_por_produto[id_produto] = qtd_por_produto.get(id_produto, Decimal(0)) + Decimal(qtd)
+
+    fichas = boms(db)
+    ids = set(qtd_por_produto)
+    for id_produto in qtd_por_produto:
+        ids.update(comp_id for comp_id, _ in fichas.get(id_produto, ()))
+    produtos_no_request(len(ids))
+    produtos = {
+        p.id: p for p in db.execute(select(Produto).where(Produto.id.in_(ids))).scalars()
+    }
+    for id_produto in qtd_por_produto:
+        produto = produtos.get(id_produto)
+        if not produto or not produto.ativo:
+            raise ValueError("Produto invalido/inativo.")
+    for _, qtd in itens:
+        if qtd <= 0:
+            raise ValueError("Quantidade invalida.")
+
+    comps_por_combo: dict[int, Bom] = {}
+    for id_produto in qtd_por_produto:
+        if produtos[id_produto].tipo == ProdutoTipo.COMBO:
+            comps_por_combo[id_produto] = fichas.get(id_produto, ())
+            if not comps_por_combo[id_produto]:
+                raise ValueError("Combo sem componentes cadastrados.")
+
+    return qtd_por_produto, produtos, comps_por_combo
+
+def _movs_de_baixa(produto: Produto, qtd: Decimal, comps: Bom, detalhe_simples: str, detalhe_combo: str) -> list[dict]:
+    if produto.tipo == ProdutoTipo.SIMPLES:
+        return [{"id_produto": produto.id, "tipo": TipoMov.BAIXA, "quantidade": qtd, "detalhe": detalhe_simples}]
+    return [
+        {
+            "id_produto": comp_id,
+            "tipo": TipoMov.BAIXA,
+            "quantidade": quantidade * qtd,
+            "detalhe": detalhe_combo.format(nome=produto.nome),
+        }
+        for comp_id, quantidade in comps
+    ]
+
+def _aplicar_baixa(db: Session, movs: list[dict], produtos: dict[int, Produto], via_combo: set[int]):
+    # Baixa de estoque por produto, em ordem de id (lotes concorrentes nunca travam linhas
+    # em ordem inversa): um UPDATE condicional em saldos_estoque e depois um UPDATE de
+    # produtos.estoque_atual, ou seja, duas statements e duas travas de linha por produto
+    # afetado (componentes de combo incluidos). Falhou um, a excecao derruba a transacao.
+    necessidade: dict[int, Decimal] = {}
+    contagem: dict[int, int] = {}
+    for m in movs:
+        pid = m["id_produto"]
+        necessidade[pid] = necessidade.get(pid, Decimal(0)) + m["quantidade"]
+        contagem[pid] = contagem.get(pid, 0) + 1
+
+    for pid in sorted(necessidade):
+        row = produtos.get(pid)
+        if pid in via_combo and (not row or not row.ativo):
+            raise ValueError("Componente invalido/inativo no combo.")
+        ok, saldo = baixar_saldo(db, pid, necessidade[pid], contagem[pid])
+        if not ok:
+            if pid in via_combo:
+                if saldo <= 0:
+                    raise ValueError(f"Sem estoque do componente: {row.nome}")
+                raise ValueError(f"Estoque insuficiente do componente: {row.nome}")
+            if saldo <= 0:
+                raise ValueError("Produto sem estoque disponivel.")
+            raise ValueError("Quantidade solicitada maior que o estoque disponivel.")
 
-def _saldo_from_movs(db: Session, produto_id: int, fallback: Decimal) -> Decimal:
-    has_movs = db.execute(
-        select(func.count()).where(MovEstoque.id_produto == produto_id)
-    ).scalar_one()
-    if not has_movs:
-        return Decimal(fallback)
-
-    entradas = db.execute(
-        select(func.coalesce(func.sum(MovEstoque.quantidade), 0)).where(
-            MovEstoque.id_produto == produto_id,
-            MovEstoque.tipo.in_([TipoMov.ENTRADA, TipoMov.ESTORNO])
-        )
-    ).scalar_one()
-    saidas = db.execute(
-        select(func.coalesce(func.sum(MovEstoque.quantidade), 0)).where(
-            MovEstoque.id_produto == produto_id,
-            MovEstoque.tipo == TipoMov.BAIXA
-        )
-    ).scalar_one()
-    return Decimal(entradas) - Decimal(saidas)
+    for pid in sorted(necessidade):
+        ajustar_estoque_atual(db, pid, -necessidade[pid])
+
+def _via_combo(comps_por_combo: dict[int, Bom]) -> set[int]:
+    return {comp_id for comps in comps_por_combo.values() for comp_id, _ in comps}
+
+def _somar_total_comanda(db: Session, comanda: Comanda, delta: Decimal):
+    # valor_total = valor_total + :delta atomico; dois garcons na mesma comanda nao perdem
+    # atualizacao, e a comanda precisa continuar ABERTA.
+    t = Comanda.__table__
+    novo = update_returning(
+        db,
+        update(t).where(t.c.id == comanda.id, t.c.status == ComandaStatus.ABERTA).values(
+            valor_total=t.c.valor_total + delta, atualizada_em=now_br()
+        ),
+        t.c.valor_total,
+        t.c.id == comanda.id
+    )
+    if novo is None:
+        raise ValueError("Comanda invÇ­lida ou nÇœo estÇ­ aberta.")
+    set_committed_value(comanda, "valor_total", novo)
 
-def add_item_comanda(db: Session, id_comanda: int, id_produto: int, qtd: Decimal):
+def add_itens_comanda(db: Session, id_comanda: int, itens: list[tuple[int, Decimal]]) -> list[ItemComanda]:
+    # Tudo ou nada: valida o lote inteiro antes de gravar qualquer item.
     comanda = db.get(Comanda, id_comanda)
     if not comanda or comanda.status != ComandaStatus.ABERTA:
         raise ValueError("Comanda invÇ­lida ou nÇœo estÇ­ aberta.")
+    if not itens:
+        raise ValueError("Informe ao menos um item.")
 
-    produto = db.get(Produto, id_produto)
-    if not produto or not produto.ativo:
-        raise ValueError("Produto invÇ­lido/inativo.")
-
-    if qtd <= 0:
-        raise ValueError("Quantidade invÇ­lida.")
-
-    if produto.tipo == ProdutoTipo.SIMPLES:
-        row = db.execute(
-            select(Produto).where(Produto.id == id_produto).with_for_update()
-        ).scalar_one()
-
-        saldo_atual = _saldo_from_movs(db, row.id, row.estoque_atual)
-        if Decimal(saldo_atual) <= 0:
-            raise ValueError("Produto sem estoque disponÇðvel.")
-        if Decimal(saldo_atual) < qtd:
-            raise ValueError("Quantidade solicitada maior que o estoque disponÇðvel.")
+    qtd_por_produto, produtos, comps_por_combo = _planejar_baixa(db, itens)
 
+    novos = []
+    movs_por_item = []
+    total_lote = Decimal(0)
+    for id_produto, qtd in qtd_por_produto.items():
+        produto = produtos[id_produto]
         preco = Decimal(produto.preco)
-        total = (preco * qtd)
-
-        item = ItemComanda(
+        total = preco * qtd
+        total_lote += total
+        novos.append(ItemComanda(
             id_comanda=id_comanda,
             id_produto=id_produto,
             quantidade=qtd,
             preco_unitario=preco,
             total_item=total
-        )
-        db.add(item)
-
-        row.estoque_atual = Decimal(row.estoque_atual) - qtd
-
-        db.flush()
-        db.add(MovEstoque(
-            id_comanda=id_comanda,
-            id_item_comanda=item.id,
-            id_produto=id_produto,
-            tipo=TipoMov.BAIXA,
-            quantidade=qtd,
-            detalhe="Venda produto simples"
+        ))
+        movs_por_item.append(_movs_de_baixa(
+            produto, qtd, comps_por_combo.get(id_produto, ()),
+            "Venda produto simples", "Venda combo (item {nome})"
         ))
 
-        comanda.valor_total = Decimal(comanda.valor_total) + total
-
-    else:
-        comps = db.execute(
-            select(ProdutoComponente).where(ProdutoComponente.id_produto_combo == id_produto)
-        ).scalars().all()
-        if not comps:
-            raise ValueError("Combo sem componentes cadastrados.")
-
-        comp_ids = sorted([c.id_produto_componente for c in comps])
-        locked = db.execute(
-            select(Produto).where(Produto.id.in_(comp_ids)).with_for_update()
-        ).scalars().all()
-        locked_map = {p.id: p for p in locked}
-
-        for c in comps:
-            comp = locked_map.get(c.id_produto_componente)
-            need = Decimal(c.quantidade) * qtd
-            saldo_comp = _saldo_from_movs(db, comp.id, comp.estoque_atual) if comp else Decimal(0)
-            if not comp or not comp.ativo:
-                raise ValueError("Componente invÇ­lido/inativo no combo.")
-            if Decimal(saldo_comp) <= 0:
-                raise ValueError(f"Sem estoque do componente: {comp.nome}")
-            if Decimal(saldo_comp) < need:
-                raise ValueError(f"Estoque insuficiente do componente: {comp.nome}")
-
-        preco = Decimal(produto.preco)
-        total = (preco * qtd)
+    movs = [m for ms in movs_por_item for m in ms]
+    _aplicar_baixa(db, movs, produtos, _via_combo(comps_por_combo))
+    _somar_total_comanda(db, comanda, total_lote)
 
-        item = ItemComanda(
-            id_comanda=id_comanda,
-            id_produto=id_produto,
-            quantidade=qtd,
-            preco_unitario=preco,
-            total_item=total
-        )
-        db.add(item)
-        db.flush()
-
-        for c in comps:
-            comp = locked_map[c.id_produto_componente]
-            need = Decimal(c.quantidade) * qtd
-            comp.estoque_atual = Decimal(comp.estoque_atual) - need
-
-            db.add(MovEstoque(
-                id_comanda=id_comanda,
-                id_item_comanda=item.id,
-                id_produto=comp.id,
-                tipo=TipoMov.BAIXA,
-                quantidade=need,
-                detalhe=f"Venda combo (item {produto.nome})"
-            ))
-
-        comanda.valor_total = Decimal(comanda.valor_total) + total
+    db.add_all(novos)
+    db.flush()
+    for item, ms in zip(novos, movs_por_item):
+        for m in ms:
+            m.update(id_comanda=id_comanda, id_item_comanda=item.id)
+    inserir_movs(db, movs)
+    return novos
 
+def add_item_comanda(db: Session, id_comanda: int, id_produto: int, qtd: Decimal):
+    add_itens_comanda(db, id_comanda, [(id_produto, qtd)])
     return {"ok": True, "id_comanda": id_comanda}
 
-def vender_balcao(db: Session, id_produto: int, qtd: Decimal) -> tuple[Decimal, str]:
-    produto = db.get(Produto, id_produto)
-    if not produto or not produto.ativo:
-        raise ValueError("Produto invalido/inativo.")
-    if qtd <= 0:
-        raise ValueError("Quantidade invalida.")
-
-    if produto.tipo == ProdutoTipo.SIMPLES:
-        row = db.execute(
-            select(Produto).where(Produto.id == id_produto).with_for_update()
-        ).scalar_one()
-
-        saldo_atual = _saldo_from_movs(db, row.id, row.estoque_atual)
-        if Decimal(saldo_atual) <= 0:
-            raise ValueError("Produto sem estoque disponivel.")
-        if Decimal(saldo_atual) < qtd:
-            raise ValueError("Quantidade solicitada maior que o estoque disponivel.")
+def vender_balcao_lote(db: Session, itens: list[tuple[int, Decimal]], id_vendedor: int) -> tuple[Decimal, list[dict]]:
+    # Venda de balcao em lote: mesmo planejamento das comandas (produtos repetidos somados,
+    # combos expandidos). O custo cresce com o lote: a baixa de _aplicar_baixa por produto
+    # afetado e um upsert de rollup por produto vendido; so os movimentos saem num INSERT
+    # em lote.
+    if not itens:
+        raise ValueError("Informe ao menos um item.")
+    qtd_por_produto, produtos, comps_por_combo = _planejar_baixa(db, itens)
+
+    movs = []
+    for id_produto, qtd in qtd_por_produto.items():
+        movs.extend(_movs_de_baixa(
+            produtos[id_produto], qtd, comps_por_combo.get(id_produto, ()),
+            "Venda balcao", "Venda balcao combo ({nome})"
+        ))
+    _aplicar_baixa(db, movs, produtos, _via_combo(comps_por_combo))
+    inserir_movs(db, movs)
 
-        row.estoque_atual = Decimal(row.estoque_atual) - qtd
-        total = Decimal(produto.preco) * qtd
+    linhas = []
+    total = Decimal(0)
+    for id_produto, qtd in itens:
+        produto = produtos[id_produto]
+        preco = Decimal(produto.preco)
+        subtotal = preco * Decimal(qtd)
+        total += subtotal
+        linhas.append({
+            "id_produto": id_produto,
+            "nome": produto.nome,
+            "quantidade": Decimal(qtd),
+            "preco_unitario": preco,
+            "subtotal": subtotal,
+        })
+    registrar_venda(db, CANAL_BALCAO, id_vendedor, [(l["id_produto"], l["quantidade"], l["subtotal"]) for l in linhas])
+    return total, linhas
+
+def vender_balcao(db: Session, id_produto: int, qtd: Decimal, id_vendedor: int) -> tuple[Decimal, str]:
+    total, linhas = vender_balcao_lote(db, [(id_produto, qtd)], id_vendedor)
+    return total, linhas[0]["nome"]
+
+def _estornar_item(db: Session, comanda: Comanda, item: ItemComanda, produto: Produto):
+    qtd_item = Decimal(item.quantidade)
 
-        db.add(MovEstoque(
-            id_comanda=None,
-            id_item_comanda=None,
-            id_produto=id_produto,
-            tipo=TipoMov.BAIXA,
-            quantidade=qtd,
-            detalhe="Venda balcao"
-        ))
-        return total, produto.nome
-
-    comps = db.execute(
-        select(ProdutoComponente).where(ProdutoComponente.id_produto_combo == id_produto)
-    ).scalars().all()
-    if not comps:
-        raise ValueError("Combo sem componentes cadastrados.")
-
-    comp_ids = sorted([c.id_produto_componente for c in comps])
-    locked = db.execute(
-        select(Produto).where(Produto.id.in_(comp_ids)).with_for_update()
-    ).scalars().all()
-    locked_map = {p.id: p for p in locked}
-
-    for c in comps:
-        comp = locked_map.get(c.id_produto_componente)
-        need = Decimal(c.quantidade) * qtd
-        saldo_comp = _saldo_from_movs(db, comp.id, comp.estoque_atual) if comp else Decimal(0)
-        if not comp or not comp.ativo:
-            raise ValueError("Componente invalido/inativo no combo.")
-        if Decimal(saldo_comp) <= 0:
-            raise ValueError(f"Sem estoque do componente: {comp.nome}")
-        if Decimal(saldo_comp) < need:
-            raise ValueError(f"Estoque insuficiente do componente: {comp.nome}")
-
-    total = Decimal(produto.preco) * qtd
-    for c in comps:
-        comp = locked_map[c.id_produto_componente]
-        need = Decimal(c.quantidade) * qtd
-        comp.estoque_atual = Decimal(comp.estoque_atual) - need
-
-        db.add(MovEstoque(
-            id_comanda=None,
-            id_item_comanda=None,
-            id_produto=comp.id,
-            tipo=TipoMov.BAIXA,
-            quantidade=need,
-            detalhe=f"Venda balcao combo ({produto.nome})"
-        ))
-    return total, produto.nome
+    if produto.tipo == ProdutoTipo.SIMPLES:
+        movs = [{
+            "id_comanda": comanda.id,
+            "id_item_comanda": item.id,
+            "id_produto": produto.id,
+            "tipo": TipoMov.ESTORNO,
+            "quantidade": qtd_item,
+            "detalhe": "Estorno por remoÇõÇœo de item"
+        }]
+    else:
+        movs = [
+            {
+                "id_comanda": comanda.id,
+                "id_item_comanda": item.id,
+                "id_produto": comp_id,
+                "tipo": TipoMov.ESTORNO,
+                "quantidade": quantidade * qtd_item,
+                "detalhe": f"Estorno por remoÇõÇœo de combo ({produto.nome})"
+            }
+            for comp_id, quantidade in componentes_combo(db, produto.id)
+        ]
+    registrar_movs(db, movs)
+    for m in sorted(movs, key=lambda m: m["id_produto"]):
+        ajustar_estoque_atual(db, m["id_produto"], m["quantidade"])
 
 def remove_item_comanda(db: Session, item_id: int):
     item = db.get(ItemComanda, item_id)
@@ -216,57 +235,48 @@ def remove_item_comanda(db: Session, item_id: int):
     if not produto:
         raise ValueError("Produto do item nÇœo encontrado.")
 
-    qtd_item = Decimal(item.quantidade)
-    total_item = Decimal(item.total_item)
-
-    if produto.tipo == ProdutoTipo.SIMPLES:
-        row = db.execute(select(Produto).where(Produto.id == produto.id).with_for_update()).scalar_one()
-        row.estoque_atual = Decimal(row.estoque_atual) + qtd_item
-
-        db.add(MovEstoque(
-            id_comanda=comanda.id,
-            id_item_comanda=item.id,
-            id_produto=produto.id,
-            tipo=TipoMov.ESTORNO,
-            quantidade=qtd_item,
-            detalhe="Estorno por remoÇõÇœo de item"
-        ))
-    else:
-        comps = db.execute(select(ProdutoComponente).where(ProdutoComponente.id_produto_combo == produto.id)).scalars().all()
-        comp_ids = sorted([c.id_produto_componente for c in comps])
-        locked = db.execute(select(Produto).where(Produto.id.in_(comp_ids)).with_for_update()).scalars().all()
-        locked_map = {p.id: p for p in locked}
-
-        for c in comps:
-            comp = locked_map.get(c.id_produto_componente)
-            need = Decimal(c.quantidade) * qtd_item
-            comp.estoque_atual = Decimal(comp.estoque_atual) + need
-            db.add(MovEstoque(
-                id_comanda=comanda.id,
-                id_item_comanda=item.id,
-                id_produto=comp.id,
-                tipo=TipoMov.ESTORNO,
-                quantidade=need,
-                detalhe=f"Estorno por remoÇõÇœo de combo ({produto.nome})"
-            ))
+    _estornar_item(db, comanda, item, produto)
 
     # remove item + ajusta total
-    comanda.valor_total = Decimal(comanda.valor_total) - total_item
+    _somar_total_comanda(db, comanda, -Decimal(item.total_item))
     db.delete(item)
 
-def cancel_comanda(db: Session, id_comanda: int):
-    comanda = db.get(Comanda, id_comanda)
-    if not comanda or comanda.status != ComandaStatus.ABERTA:
+def _fechar_comanda(db: Session, id_comanda: int, status: ComandaStatus, **valores) -> tuple[Comanda, Decimal]:
+    # UPDATE ... SET status WHERE status = 'ABERTA' RETURNING valor_total: de dois fechamentos
+    # concorrentes so um encontra a linha aberta; o outro recebe ValueError antes de ler os itens.
+    t = Comanda.__table__
+    total = update_returning(
+        db,
+        update(t).where(t.c.id == id_comanda, t.c.status == ComandaStatus.ABERTA).values(
+            status=status, atualizada_em=now_br(), **valores
+        ),
+        t.c.valor_total,
+        t.c.id == id_comanda
+    )
+    if total is None:
         raise ValueError("Comanda invÇ­lida ou nÇœo estÇ­ aberta.")
+    comanda = db.get(Comanda, id_comanda)
+    set_committed_value(comanda, "status", status)
+    set_committed_value(comanda, "valor_total", total)
+    return comanda, Decimal(total)
+
+def cancel_comanda(db: Session, id_comanda: int):
+    comanda, _ = _fechar_comanda(db, id_comanda, ComandaStatus.CANCELADA, valor_total=0)
 
     itens = db.execute(select(ItemComanda).where(ItemComanda.id_comanda == id_comanda)).scalars().all()
+    produtos = {
+        p.id: p for p in db.execute(
+            select(Produto).where(Produto.id.in_({it.id_produto for it in itens}))
+        ).scalars()
+    }
     for it in itens:
-        remove_item_comanda(db, it.id)
-
-    comanda.status = ComandaStatus.CANCELADA
-
-def finalizar_comanda(db: Session, id_comanda: int):
-    comanda = db.get(Comanda, id_comanda)
-    if not comanda or comanda.status != ComandaStatus.ABERTA:
-        raise ValueError("Comanda invÇ­lida ou nÇœo estÇ­ aberta.")
-    comanda.status = ComandaStatus.FINALIZADA
+        produto = produtos.get(it.id_produto)
+        if not produto:
+            raise ValueError("Produto do item nÇœo encontrado.")
+        _estornar_item(db, comanda, it, produto)
+        db.delete(it)
+
+def finalizar_comanda(db: Session, id_comanda: int) -> Decimal:
+    comanda, total = _fechar_comanda(db, id_comanda, ComandaStatus.FINALIZADA)
+    registrar_venda_comanda(db, comanda)
+    return total
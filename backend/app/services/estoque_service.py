@@ -0,0 +1,218 @@
+from sqlalchemy import select, func, case, update, insert, delete
+from sqlalchemy.orm import Session
+from decimal import Decimal
+
+from app.db.session import update_returning, upsert_somando
+from app.models.models import Produto, MovEstoque, TipoMov, SaldoEstoque, now_br
+from app.services.catalogo_cache import invalidar_catalogo
+from app.services.eventos import publicar, PERM_CAIXA
+
+TIPOS_ENTRADA = (TipoMov.ENTRADA, TipoMov.ESTORNO)
+
+def _delta(tipo: TipoMov, quantidade: Decimal) -> Decimal:
+    return Decimal(quantidade) if tipo in TIPOS_ENTRADA else -Decimal(quantidade)
+
+def registrar_mov(
+    db: Session,
+    id_produto: int,
+    tipo: TipoMov,
+    quantidade: Decimal,
+    detalhe: str | None = None,
+    id_comanda: int | None = None,
+    id_item_comanda: int | None = None,
+):
+    # Toda movimentacao de estoque passa por aqui: grava o ledger e atualiza o saldo
+    # materializado na mesma transacao.
+    registrar_movs(db, [{
+        "id_comanda": id_comanda,
+        "id_item_comanda": id_item_comanda,
+        "id_produto": id_produto,
+        "tipo": tipo,
+        "quantidade": quantidade,
+        "detalhe": detalhe,
+    }])
+
+_CAMPOS_MOV = ("id_comanda", "id_item_comanda", "id_produto", "tipo", "quantidade", "detalhe")
+
+def inserir_movs(db: Session, movs: list[dict]):
+    # So o ledger; quem chama ja ajustou saldos_estoque (ver baixar_saldo). Um INSERT em
+    # lote (executemany) para todos os movimentos, nao um por movimento.
+    if not movs:
+        return
+    db.execute(insert(MovEstoque), [{c: m.get(c) for c in _CAMPOS_MOV} for m in movs])
+    invalidar_catalogo(db)
+
+def _publicar_saldo(db: Session, id_produto: int, saldo: Decimal):
+    publicar(db, "produto.saldo", {"id_produto": id_produto, "saldo": saldo}, perm=PERM_CAIXA, chave=("saldo", id_produto))
+
+def _somar_saldo(db: Session, id_produto: int, delta: Decimal, n_movs: int, guarda=None) -> Decimal | None:
+    t = SaldoEstoque.__table__
+    cond = [t.c.id_produto == id_produto]
+    if guarda is not None:
+        cond.append(guarda)
+    return update_returning(
+        db,
+        update(t).where(*cond).values(
+            saldo=t.c.saldo + delta,
+            qtd_movs=t.c.qtd_movs + n_movs,
+            atualizado_em=now_br()
+        ),
+        t.c.saldo,
+        t.c.id_produto == id_produto
+    )
+
+def registrar_movs(db: Session, movs: list[dict]):
+    # Versao em lote: insere todos os movimentos e faz um unico upsert atomico de saldo
+    # por produto (em ordem de id), nao um por movimento.
+    deltas: dict[int, Decimal] = {}
+    contagem: dict[int, int] = {}
+    for m in movs:
+        pid = m["id_produto"]
+        deltas[pid] = deltas.get(pid, Decimal(0)) + _delta(m["tipo"], m["quantidade"])
+        contagem[pid] = contagem.get(pid, 0) + 1
+
+    for pid in sorted(deltas):
+        # Upsert: a primeira movimentacao de um produto pode chegar em duas transacoes ao
+        # mesmo tempo; um INSERT simples faria a segunda estourar a chave primaria.
+        saldo = upsert_somando(
+            db, SaldoEstoque.__table__, {"id_produto": pid},
+            {"saldo": deltas[pid], "qtd_movs": contagem[pid]},
+            valores={"atualizado_em": now_br()}, retornar="saldo"
+        )
+        _publicar_saldo(db, pid, saldo)
+    inserir_movs(db, movs)
+
+def baixar_saldo(db: Session, id_produto: int, quantidade: Decimal, n_movs: int = 1) -> tuple[bool, Decimal]:
+    # Baixa condicional em um unico UPDATE (... WHERE saldo >= :q RETURNING saldo): a linha
+    # so fica travada do UPDATE ate o commit. Retorna (ok, saldo); sem sucesso, o saldo e o
+    # atual, para a mensagem de erro.
+    t = SaldoEstoque.__table__
+    quantidade = Decimal(quantidade)
+    for _ in range(2):
+        novo = _somar_saldo(db, id_produto, -quantidade, n_movs, (t.c.qtd_movs > 0) & (t.c.saldo >= quantidade))
+        if novo is not None:
+            _publicar_saldo(db, id_produto, novo)
+            return True, Decimal(novo)
+
+        atual = db.execute(select(t.c.saldo, t.c.qtd_movs).where(t.c.id_produto == id_produto)).first()
+        if atual and atual.qtd_movs:
+            return False, Decimal(atual.saldo)
+
+        # Primeira movimentacao do produto: o saldo efetivo ainda e o estoque_atual. Acontece
+        # uma vez por produto, entao aqui vale travar a linha do produto.
+        estoque = db.execute(
+            select(Produto.estoque_atual).where(Produto.id == id_produto).with_for_update()
+        ).scalar_one_or_none()
+        atual = db.execute(select(t.c.saldo, t.c.qtd_movs).where(t.c.id_produto == id_produto)).first()
+        if atual and atual.qtd_movs:
+            continue  # outra transacao fez a primeira baixa enquanto esperavamos a trava
+        if estoque is None or Decimal(estoque) < quantidade:
+            return False, Decimal(estoque or 0)
+        novo = upsert_somando(
+            db, t, {"id_produto": id_produto},
+            {"saldo": -quantidade, "qtd_movs": n_movs},
+            valores={"atualizado_em": now_br()}, retornar="saldo"
+        )
+        _publicar_saldo(db, id_produto, novo)
+        return True, Decimal(novo)
+    return False, Decimal(0)
+
+def ajustar_estoque_atual(db: Session, id_produto: int, delta: Decimal) -> Decimal | None:
+    # estoque_atual = estoque_atual + :delta num unico UPDATE. Chamar depois de mexer em
+    # saldos_estoque (ordem de travas de todas as rotas). None = produto inexistente.
+    t = Produto.__table__
+    return update_returning(
+        db,
+        update(t).where(t.c.id == id_produto).values(estoque_atual=t.c.estoque_atual + delta, atualizado_em=now_br()),
+        t.c.estoque_atual,
+        t.c.id == id_produto
+    )
+
+def saldo_atual(db: Session, produto_id: int, fallback: Decimal) -> Decimal:
+    # Sem movimentacoes o saldo e o estoque_atual cadastrado (mesma regra do ledger).
+    row = db.execute(
+        select(SaldoEstoque.saldo, SaldoEstoque.qtd_movs).where(SaldoEstoque.id_produto == produto_id)
+    ).first()
+    if not row or not row.qtd_movs:
+        return Decimal(fallback)
+    return Decimal(row.saldo)
+
+def saldos_atuais(db: Session, produtos) -> dict[int, Decimal]:
+    # Versao em lote de saldo_atual: uma unica consulta para todos os produtos informados.
+    produtos = list(produtos)
+    if not produtos:
+        return {}
+    rows = {
+        pid: (saldo, qtd)
+        for pid, saldo, qtd in db.execute(
+            select(SaldoEstoque.id_produto, SaldoEstoque.saldo, SaldoEstoque.qtd_movs)
+            .where(SaldoEstoque.id_produto.in_({p.id for p in produtos}))
+        ).all()
+    }
+    saldos = {}
+    for p in produtos:
+        row = rows.get(p.id)
+        saldos[p.id] = Decimal(row[0]) if row and row[1] else Decimal(p.estoque_atual)
+    return saldos
+
+def _ledger_stmt():
+    return select(
+        MovEstoque.id_produto,
+        func.count().label("qtd_movs"),
+        func.coalesce(func.sum(case(
+            (MovEstoque.tipo.in_(TIPOS_ENTRADA), MovEstoque.quantidade),
+            else_=-MovEstoque.quantidade
+        )), 0).label("saldo")
+    ).group_by(MovEstoque.id_produto)
+
+def saldos_do_ledger(db: Session) -> dict[int, tuple[Decimal, int]]:
+    return {
+        pid: (Decimal(saldo), qtd)
+        for pid, qtd, saldo in db.execute(_ledger_stmt()).all()
+    }
+
+def rebuild_saldos(db: Session) -> int:
+    db.execute(delete(SaldoEstoque))
+    ledger = saldos_do_ledger(db)
+    agora = now_br()
+    # Somando: um movimento gravado por outra transacao entre o DELETE e aqui ja criou a
+    # linha do produto (e nao entrou na leitura do ledger).
+    for pid in sorted(ledger):
+        saldo, qtd = ledger[pid]
+        upsert_somando(
+            db, SaldoEstoque.__table__, {"id_produto": pid},
+            {"saldo": saldo, "qtd_movs": qtd}, valores={"atualizado_em": agora}
+        )
+    return len(ledger)
+
+def verificar_saldos(db: Session) -> list[dict]:
+    ledger = saldos_do_ledger(db)
+    materializado = {
+        pid: (Decimal(saldo), qtd)
+        for pid, saldo, qtd in db.execute(
+            select(SaldoEstoque.id_produto, SaldoEstoque.saldo, SaldoEstoque.qtd_movs)
+        ).all()
+    }
+    divergencias = []
+    for pid in sorted(set(ledger) | set(materializado)):
+        esperado = ledger.get(pid, (Decimal(0), 0))
+        atual = materializado.get(pid, (Decimal(0), 0))
+        if esperado[0] != atual[0] or esperado[1] != atual[1]:
+            divergencias.append({
+                "id_produto": pid,
+                "saldo_ledger": esperado[0],
+                "saldo_materializado": atual[0],
+                "qtd_movs_ledger": esperado[1],
+                "qtd_movs_materializado": atual[1],
+            })
+    return divergencias
+
+def garantir_saldos(db: Session) -> int:
+    # Backfill unico para bancos que ja tinham ledger antes da tabela de saldos.
+    has_saldos = db.execute(select(SaldoEstoque.id_produto).limit(1)).first()
+    has_movs = db.execute(select(MovEstoque.id).limit(1)).first()
+    if has_saldos or not has_movs:
+        return 0
+    n = rebuild_saldos(db)
+    db.commit()
+    return n
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import select as _select
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+
+from sqlalchemy import select, func, delete, event, or_, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal, WriterSessionLocal, engine, on_commit, tarefa_exclusiva
+from app.models.models import Evento, now_br
+
+logger = logging.getLogger(__name__)
+
+# Publico de cada evento, espelhando as dependencias de security.py.
+PERM_CAIXA = "CAIXA"        # require_caixa
+PERM_VENDEDOR = "VENDEDOR"  # require_vendedor
+PERM_INTERNO = "INTERNO"    # so handlers internos (invalidacao de cache), nunca vai ao cliente
+
+# Canal do NOTIFY que acorda o hub dos outros workers (Postgres).
+CANAL_EVENTOS = "bar_eventos"
+# Advisory lock da limpeza da outbox (uma por vez entre os workers).
+_CHAVE_PRUNE = 0x6261725F657674
+
+ROLES_POR_PERM = {
+    PERM_CAIXA: ("CAIXA", "VENDEDOR", "ADMIN"),
+    PERM_VENDEDOR: ("VENDEDOR", "ADMIN"),
+    PERM_INTERNO: (),
+}
+
+def _json_default(v):
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Enum):
+        return v.value
+    raise TypeError(f"tipo nao serializavel: {type(v)!r}")
+
+def publicar(
+    db: Session,
+    tipo: str,
+    dados,
+    perm: str = PERM_VENDEDOR,
+    id_vendedor: int | None = None,
+    chave=None,
+):
+    # Enfileira o evento na sessao; ele e gravado na outbox junto com o commit e so
+    # chega aos clientes depois que a transacao foi confirmada. `dados` pode ser um
+    # callable, avaliado apos o flush (ids ja atribuidos). Eventos com a mesma chave
+    # na mesma transacao sao colapsados no ultimo.
+    pendentes = db.info.setdefault("eventos", [])
+    if chave is not None:
+        pendentes[:] = [ev for ev in pendentes if ev["chave"] != chave]
+    pendentes.append({"tipo": tipo, "dados": dados, "perm": perm, "id_vendedor": id_vendedor, "chave": chave})
+
+@event.listens_for(Session, "before_commit")
+def _gravar_eventos(session: Session):
+    pendentes = session.info.pop("eventos", None)
+    if not pendentes:
+        return
+    session.flush()
+    eventos = [
+        {
+            "tipo": ev["tipo"],
+            "dados": ev["dados"]() if callable(ev["dados"]) else ev["dados"],
+            "perm": ev["perm"],
+            "id_vendedor": ev["id_vendedor"],
+        }
+        for ev in pendentes
+    ]
+    session.add(Evento(payload=json.dumps(eventos, default=_json_default)))
+    if settings.EVENTOS_NOTIFY and session.get_bind().dialect.name == "postgresql":
+        # Entregue pelo Postgres so no commit; varios NOTIFY iguais na transacao viram um.
+        session.execute(text("SELECT pg_notify(:canal, '')"), {"canal": CANAL_EVENTOS})
+    on_commit(session, hub.acordar)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_eventos(session: Session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop("eventos", None)
+
+def publicar_caixa_mov(db: Session, mov):
+    publicar(db, "caixa.movimento", lambda: {
+        "id": mov.id,
+        "id_caixa": mov.id_caixa,
+        "tipo": mov.tipo,
+        "valor": mov.valor,
+        "pagamento_tipo": mov.pagamento_tipo,
+        "criado_em": mov.criado_em,
+    }, perm=PERM_VENDEDOR)
+
+
+class Assinatura:
+    def __init__(self, loop: asyncio.AbstractEventLoop, role: str, user_id: int, maxsize: int = 1000):
+        self.loop = loop
+        self.role = role
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.atrasada = False
+
+    def aceita(self, ev: dict) -> bool:
+        if self.role not in ROLES_POR_PERM.get(ev["perm"], ()):
+            return False
+        # Comandas: vendedor so ve as proprias (como em /comandas/abertas).
+        if ev.get("id_vendedor") is not None and self.role != "ADMIN":
+            return ev["id_vendedor"] == self.user_id
+        return True
+
+    def filtrar(self, id_evento: int, eventos: list[dict]) -> dict | None:
+        visiveis = [{"tipo": ev["tipo"], "dados": ev["dados"]} for ev in eventos if self.aceita(ev)]
+        if not visiveis:
+            return None
+        return {"id": id_evento, "eventos": visiveis}
+
+    def entregar(self, id_evento: int, eventos: list[dict]):
+        msg = self.filtrar(id_evento, eventos)
+        if msg is not None:
+            self.loop.call_soon_threadsafe(self._put, msg)
+
+    def _put(self, msg: dict):
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta a fila e pede que ele recarregue o estado.
+            self.atrasada = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"id": msg["id"], "eventos": [{"tipo": "resync", "dados": None}]})
+
+
+class EventHub:
+    # Cada worker le a outbox (tabela eventos) em intervalos curtos e repassa os eventos
+    # aos websockets conectados nele e aos handlers internos. Como a fonte e o banco,
+    # funciona igual com um ou varios processos uvicorn. No Postgres um LISTEN acorda a
+    # leitura assim que outro worker confirma eventos; o intervalo vira rede de seguranca.
+    GAP_TTL_S = 10
+    PRUNE_EVERY_S = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assinantes: set[Assinatura] = set()
+        self._handlers: list[tuple[str, object]] = []
+        self._ultimo_id = 0
+        self._gaps: dict[int, float] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._escuta: threading.Thread | None = None
+        self._ultimo_prune = 0.0
+
+    @property
+    def ultimo_id(self) -> int:
+        return self._ultimo_id
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        db = SessionLocal()
+        try:
+            self._ultimo_id = db.execute(select(func.max(Evento.id))).scalar() or 0
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="eventos-hub", daemon=True)
+        self._thread.start()
+        if settings.EVENTOS_NOTIFY and engine.dialect.name == "postgresql":
+            self._escuta = threading.Thread(target=self._escutar, name="eventos-listen", daemon=True)
+            self._escuta.start()
+
+    def parar(self):
+        self._stop.set()
+        self._wake.set()
+        for t in (self._thread, self._escuta):
+            if t:
+                t.join(timeout=5)
+        self._thread = self._escuta = None
+
+    def acordar(self):
+        self._wake.set()
+
+    def assinar(self, prefixo: str, fn):
+        # Handler interno chamado (na thread do hub) para todo evento cujo tipo comeca com prefixo.
+        self._handlers.append((prefixo, fn))
+
+    def conectar(self, sub: Assinatura):
+        with self._lock:
+            self._assinantes.add(sub)
+
+    def desconectar(self, sub: Assinatura):
+        with self._lock:
+            self._assinantes.discard(sub)
+
+    def replay(self, desde: int, ate: int) -> list[tuple[int, list[dict]]]:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(Evento.id, Evento.payload)
+                .where(Evento.id > desde, Evento.id <= ate)
+                .order_by(Evento.id)
+            ).all()
+        finally:
+            db.close()
+        return [(id_evento, json.loads(payload)) for id_evento, payload in rows]
+
+    def _run(self):
+        intervalo = settings.EVENTOS_POLL_MS / 1000
+        while not self._stop.is_set():
+            self._wake.wait(intervalo)
+            self._wake.clear()
+            try:
+                self._poll()
+                if time.monotonic() - self._ultimo_prune > self.PRUNE_EVERY_S:
+                    self._prune()
+            except Exception:
+                logger.exception("falha lendo a outbox de eventos")
+
+    def _escutar(self):
+        # Conexao propria, fora do pool, em autocommit. Ao (re)conectar acorda o hub, porque
+        # notificacoes enviadas enquanto ninguem escutava se perdem.
+        while not self._stop.is_set():
+            try:
+                conn = engine.raw_connection()
+                conn.detach()
+                try:
+                    pg = conn.driver_connection
+                    pg.autocommit = True
+                    with pg.cursor() as cur:
+                        cur.execute(f"LISTEN {CANAL_EVENTOS}")
+                    self._wake.set()
+                    while not self._stop.is_set():
+                        if _select.select([pg], [], [], 1.0)[0]:
+                            pg.poll()
+                            if pg.notifies:
+                                pg.notifies.clear()
+                                self._wake.set()
+                finally:
+                    conn.close()
+            except Exception:
+                logger.exception("falha no LISTEN de eventos; tentando de novo")
+                self._stop.wait(5)
+
+    def _poll(self):
+        agora = time.monotonic()
+        self._gaps = {i: t for i, t in self._gaps.items() if agora - t < self.GAP_TTL_S}
+        cond = Evento.id > self._ultimo_id
+        if self._gaps:
+            # Ids pulados podem ser transacoes mais antigas que ainda nao commitaram.
+            cond = or_(cond, Evento.id.in_(list(self._gaps)))
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(Evento.id, Evento.payload).where(cond).order_by(Evento.id).limit(500)
+            ).all()
+        finally:
+            db.close()
+        for id_evento, payload in rows:
+            if id_evento in self._gaps:
+                del self._gaps[id_evento]
+            elif id_evento > self._ultimo_id:
+                if id_evento - self._ultimo_id <= 1000:
+                    for faltando in range(self._ultimo_id + 1, id_evento):
+                        self._gaps[faltando] = agora
+                self._ultimo_id = id_evento
+            self._despachar(id_evento, json.loads(payload))
+
+    def _despachar(self, id_evento: int, eventos: list[dict]):
+        for ev in eventos:
+            for prefixo, fn in self._handlers:
+                if ev["tipo"].startswith(prefixo):
+                    try:
+                        fn(ev)
+                    except Exception:
+                        logger.exception("falha no handler de evento %s", ev["tipo"])
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for sub in assinantes:
+            sub.entregar(id_evento, eventos)
+
+    def _prune(self):
+        # Todo worker agenda; no Postgres so quem pega a trava apaga (ver tarefa_exclusiva).
+        self._ultimo_prune = time.monotonic()
+        limite = now_br() - timedelta(minutes=settings.EVENTOS_RETENCAO_MIN)
+        with tarefa_exclusiva(_CHAVE_PRUNE) as pegou:
+            if not pegou:
+                return
+            db = WriterSessionLocal()
+            try:
+                db.execute(delete(Evento).where(Evento.criado_em < limite))
+                db.commit()
+            finally:
+                db.close()
+
+
+hub = EventHub()
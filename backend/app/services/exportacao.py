@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+from app.db.session import SessionLocal
+
+# Exportacoes em streaming: as linhas saem do cursor do banco em blocos (yield_per /
+# stream_results) direto para o corpo da resposta, sem montar a lista em memoria.
+
+LINHAS_POR_BLOCO = 1000
+
+def _valor(v):
+    if isinstance(v, Enum):
+        return v.value
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+def linhas_do_banco(stmt):
+    # Sessao propria: o gerador roda depois que a dependencia get_db ja foi encerrada.
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=LINHAS_POR_BLOCO))
+        for row in result:
+            yield row
+    finally:
+        db.close()
+
+def _fechar(fonte):
+    # Cliente desconectado: o servidor fecha so o gerador de fora. Fechar a fonte em cadeia
+    # chega ate linhas_do_banco, que devolve a conexao na hora, sem esperar o GC.
+    close = getattr(fonte, "close", None)
+    if close:
+        close()
+
+def csv_stream(colunas: list[str], rows):
+    try:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(colunas)
+        n = 0
+        for row in rows:
+            writer.writerow([_valor(v) for v in row])
+            n += 1
+            if n % LINHAS_POR_BLOCO == 0:
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode()
+    finally:
+        _fechar(rows)
+
+def ndjson_stream(colunas: list[str], rows):
+    try:
+        bloco = []
+        for row in rows:
+            bloco.append(json.dumps({c: _valor(v) for c, v in zip(colunas, row)}, ensure_ascii=False))
+            if len(bloco) == LINHAS_POR_BLOCO:
+                yield ("\n".join(bloco) + "\n").encode()
+                bloco = []
+        if bloco:
+            yield ("\n".join(bloco) + "\n").encode()
+    finally:
+        _fechar(rows)
+
+def gzip_stream(chunks):
+    try:
+        comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+        for chunk in chunks:
+            out = comp.compress(chunk)
+            if out:
+                yield out
+        yield comp.flush()
+    finally:
+        _fechar(chunks)
@@ -1,5 +1,205 @@
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert, select, delete
 from sqlalchemy.orm import Session
-from app.models.models import LogAcao
 
-def log_action(db: Session, usuario: str, acao: str, detalhe: str | None = None, ip: str | None = None):
-    db.add(LogAcao(usuario=usuario, acao=acao, detalhe=detalhe, ip=ip))
+from app.core.config import settings
+from app.db import log_partitions
+from app.db.session import WriterSessionLocal, engine, on_commit, tarefa_exclusiva
+from app.models.models import LogAcao, now_br
+
+logger = logging.getLogger(__name__)
+
+def log_action(db: Session, usuario: str, acao: str, detalhe: str | None = None, ip: str | None = None, sync: bool | None = None):
+    # sync=True grava na propria transacao (auditoria que precisa ser duravel junto com a
+    # acao). Caso contrario, com LOG_BUFFERED o registro vai para o buffer apos o commit.
+    if sync or not settings.LOG_BUFFERED:
+        db.add(LogAcao(usuario=usuario, acao=acao, detalhe=detalhe, ip=ip))
+        return
+    registro = {"usuario": usuario, "acao": acao, "detalhe": detalhe, "ip": ip, "data_hora": now_br()}
+    on_commit(db, lambda: log_buffer.enfileirar(registro))
+
+
+class LogBuffer:
+    # Fila limitada em memoria + thread que faz INSERT em lote a cada LOG_FLUSH_MS ou
+    # LOG_FLUSH_BATCH registros. Com a fila cheia o registro e descartado (e contado).
+    def __init__(self):
+        self._fila: queue.Queue = queue.Queue(maxsize=settings.LOG_BUFFER_MAX)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.enfileirados = 0
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+
+    def enfileirar(self, registro: dict):
+        try:
+            self._fila.put_nowait(registro)
+            with self._lock:
+                self.enfileirados += 1
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ativo": bool(self._thread and self._thread.is_alive()),
+                "pendentes": self._fila.qsize(),
+                "enfileirados": self.enfileirados,
+                "gravados": self.gravados,
+                "descartados": self.descartados,
+                "falhas": self.falhas,
+            }
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-buffer", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        # Flush final no shutdown.
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _coletar(self, espera: float) -> list[dict]:
+        lote = []
+        try:
+            lote.append(self._fila.get(timeout=espera))
+        except queue.Empty:
+            return lote
+        while len(lote) < settings.LOG_FLUSH_BATCH:
+            try:
+                lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, lote: list[dict]):
+        if not lote:
+            return
+        db = WriterSessionLocal()
+        try:
+            db.execute(insert(LogAcao), lote)
+            db.commit()
+            with self._lock:
+                self.gravados += len(lote)
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self.falhas += len(lote)
+            logger.exception("falha gravando %d registros de log", len(lote))
+        finally:
+            db.close()
+
+    def flush(self):
+        while True:
+            lote = self._coletar(0)
+            if not lote:
+                return
+            self._gravar(lote)
+
+    def _run(self):
+        espera = settings.LOG_FLUSH_MS / 1000
+        while not self._stop.is_set():
+            lote = self._coletar(espera)
+            # Junta o que chegar ate completar o lote ou estourar o intervalo contado a partir
+            # do primeiro registro: lote cheio grava na hora.
+            prazo = time.monotonic() + espera
+            while lote and len(lote) < settings.LOG_FLUSH_BATCH and not self._stop.is_set():
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._gravar(lote)
+
+
+log_buffer = LogBuffer()
+
+def purgar_logs(dias: int | None = None, lote: int | None = None) -> dict:
+    # Retencao: no Postgres particionado derruba as particoes mensais inteiras antes do
+    # limite; o restante sai em DELETEs de ate `lote` ids, cada um na sua transacao.
+    dias = settings.LOG_RETENTION_DAYS if dias is None else dias
+    lote = lote or settings.LOG_PURGE_BATCH
+    limite = now_br() - timedelta(days=dias)
+
+    particoes_removidas = []
+    if log_partitions.suportado(engine):
+        with engine.begin() as conn:
+            if log_partitions.logs_particionado(conn):
+                log_partitions.garantir_particoes(conn, now_br().date())
+                particoes_removidas = log_partitions.remover_particoes_antigas(conn, limite)
+
+    removidos = 0
+    while True:
+        db = WriterSessionLocal()
+        try:
+            ids = db.execute(
+                select(LogAcao.id).where(LogAcao.data_hora < limite).order_by(LogAcao.data_hora, LogAcao.id).limit(lote)
+            ).scalars().all()
+            if not ids:
+                break
+            db.execute(delete(LogAcao).where(LogAcao.id.in_(ids)))
+            db.commit()
+            removidos += len(ids)
+        finally:
+            db.close()
+        if len(ids) < lote:
+            break
+        time.sleep(0.05)  # deixa as escritas normais passarem entre os lotes
+    return {"limite": limite, "removidos": removidos, "particoes_removidas": particoes_removidas}
+
+
+# Chave do advisory lock da retencao: com varios workers, uma rodada por vez no banco.
+_CHAVE_RETENCAO = 0x6261725F6C6F67
+
+
+class RetencaoLogs:
+    # Roda purgar_logs a cada LOG_PURGE_INTERVAL_MIN numa thread do worker; no Postgres so
+    # o worker que pegar a trava faz a rodada.
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def iniciar(self):
+        if settings.LOG_PURGE_INTERVAL_MIN <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-retencao", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        # Primeira rodada um pouco depois do boot, para nao competir com o startup.
+        espera = 30
+        while not self._stop.wait(espera):
+            try:
+                with tarefa_exclusiva(_CHAVE_RETENCAO) as pegou:
+                    if pegou:
+                        r = purgar_logs()
+                        if r["removidos"] or r["particoes_removidas"]:
+                            logger.info("retencao de logs: %d removidos, particoes %s", r["removidos"], r["particoes_removidas"])
+            except Exception:
+                logger.exception("falha na retencao de logs")
+            espera = settings.LOG_PURGE_INTERVAL_MIN * 60
+
+
+retencao_logs = RetencaoLogs()
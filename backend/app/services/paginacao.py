@@ -0,0 +1,28 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+# Cursor opaco para paginacao por chave (data, id), sempre em ordem decrescente.
+
+def codificar_cursor(data: datetime, id_: int) -> str:
+    return base64.urlsafe_b64encode(f"{data.isoformat()}|{id_}".encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        data, id_ = bruto.rsplit("|", 1)
+        return datetime.fromisoformat(data), int(id_)
+    except Exception:
+        raise ValueError("Cursor invalido.")
+
+def apos_cursor(col_data, col_id, cursor: str):
+    # (data, id) < (cursor): proxima pagina em data desc, id desc, usando o indice (data, id).
+    data, id_ = decodificar_cursor(cursor)
+    return or_(col_data < data, and_(col_data == data, col_id < id_))
+
+def proximo_cursor(rows: list, limit: int, col_data: str, col_id: str = "id") -> str | None:
+    if len(rows) < limit:
+        return None
+    ultimo = rows[-1]
+    return codificar_cursor(getattr(ultimo, col_data), getattr(ultimo, col_id))
@@ -1,57 +1,35 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select
 from decimal import Decimal
 import math
 
-from app.models.models import Produto, ProdutoTipo, ProdutoComponente, MovEstoque, TipoMov
+from app.models.models import Produto, ProdutoTipo
+from app.services.bom_cache import boms, componentes_combo
+from app.services.estoque_service import saldo_atual, saldos_atuais
 
-def _saldo_from_movs(db: Session, produto_id: int, fallback: Decimal) -> Decimal:
-    has_movs = db.execute(
-        select(func.count()).where(MovEstoque.id_produto == produto_id)
-    ).scalar_one()
-    if not has_movs:
-        return Decimal(fallback)
-
-    entradas = db.execute(
-        select(func.coalesce(func.sum(MovEstoque.quantidade), 0)).where(
-            MovEstoque.id_produto == produto_id,
-            MovEstoque.tipo.in_([TipoMov.ENTRADA, TipoMov.ESTORNO])
-        )
-    ).scalar_one()
-    saidas = db.execute(
-        select(func.coalesce(func.sum(MovEstoque.quantidade), 0)).where(
-            MovEstoque.id_produto == produto_id,
-            MovEstoque.tipo == TipoMov.BAIXA
-        )
-    ).scalar_one()
-    return Decimal(entradas) - Decimal(saidas)
-
-def calcular_disponibilidade_combo(db: Session, combo_id: int) -> tuple[int, str | None]:
-    comps = db.execute(select(ProdutoComponente).where(ProdutoComponente.id_produto_combo == combo_id)).scalars().all()
+def _disponibilidade(comps: list[tuple[Decimal, Produto | None, Decimal | None]]) -> tuple[int, str | None]:
+    # comps: (quantidade no combo, produto componente, saldo do componente)
     if not comps:
         return 0, "Combo sem componentes cadastrados"
 
     mins = []
-    for c in comps:
-        comp = db.get(Produto, c.id_produto_componente)
+    for quantidade, comp, saldo_comp in comps:
         if not comp or not comp.ativo:
             return 0, "Componente inválido/inativo"
-        if Decimal(c.quantidade) <= 0:
+        if Decimal(quantidade) <= 0:
             return 0, "Quantidade do componente inválida"
-        saldo_comp = _saldo_from_movs(db, comp.id, comp.estoque_atual)
-        possible = int(Decimal(saldo_comp) // Decimal(c.quantidade))
+        possible = int(Decimal(saldo_comp) // Decimal(quantidade))
         mins.append(possible)
 
     return (min(mins) if mins else 0), None
 
-def produto_to_display(db: Session, p: Produto) -> dict:
-    saldo_atual = _saldo_from_movs(db, p.id, p.estoque_atual)
+def _montar_display(p: Produto, saldo: Decimal, combo: tuple[int, str | None] | None) -> dict:
     data = {
         "id": p.id,
         "nome": p.nome,
         "preco": p.preco,
         "estoque_atual": p.estoque_atual,
-        "saldo_atual": saldo_atual,
+        "saldo_atual": saldo,
         "estoque_minimo": p.estoque_minimo,
         "tipo": p.tipo.value if hasattr(p.tipo, "value") else p.tipo,
         "ativo": p.ativo,
@@ -60,13 +38,54 @@ def produto_to_display(db: Session, p: Produto) -> dict:
         "reason_disabled": None,
     }
     if data["tipo"] == "SIMPLES":
-        if Decimal(saldo_atual) <= 0:
+        if Decimal(saldo) <= 0:
             data["can_add"] = False
             data["reason_disabled"] = "Sem estoque"
     else:
-        disp, reason = calcular_disponibilidade_combo(db, p.id)
+        disp, reason = combo
         data["disponivel_combo"] = disp
         if disp <= 0:
             data["can_add"] = False
             data["reason_disabled"] = reason or "Sem componentes suficientes"
     return data
+
+def _carregar_componentes(db: Session, fichas: dict, conhecidos: dict[int, Produto]) -> dict[int, Produto]:
+    faltando = {comp_id for comps in fichas.values() for comp_id, _ in comps} - set(conhecidos)
+    produtos = dict(conhecidos)
+    if faltando:
+        produtos.update({p.id: p for p in db.execute(select(Produto).where(Produto.id.in_(faltando))).scalars()})
+    return produtos
+
+def calcular_disponibilidade_combo(db: Session, combo_id: int) -> tuple[int, str | None]:
+    comps = componentes_combo(db, combo_id)
+    produtos = _carregar_componentes(db, {combo_id: comps}, {})
+    ativos = [produtos[comp_id] for comp_id, _ in comps if comp_id in produtos and produtos[comp_id].ativo]
+    saldos = saldos_atuais(db, ativos)
+    return _disponibilidade([
+        (quantidade, produtos.get(comp_id), saldos.get(comp_id))
+        for comp_id, quantidade in comps
+    ])
+
+def produto_to_display(db: Session, p: Produto) -> dict:
+    saldo = saldo_atual(db, p.id, p.estoque_atual)
+    combo = calcular_disponibilidade_combo(db, p.id) if p.tipo == ProdutoTipo.COMBO else None
+    return _montar_display(p, saldo, combo)
+
+def produtos_to_display(db: Session, produtos: list[Produto]) -> list[dict]:
+    # Caminho em lote do catalogo: fichas dos combos do cache, no maximo uma carga de
+    # componentes fora da lista e uma consulta de saldos; disponibilidade em memoria.
+    fichas = boms(db)
+    combo_fichas = {p.id: fichas.get(p.id, ()) for p in produtos if p.tipo == ProdutoTipo.COMBO}
+    todos = _carregar_componentes(db, combo_fichas, {p.id: p for p in produtos})
+    saldos = saldos_atuais(db, todos.values())
+
+    out = []
+    for p in produtos:
+        combo = None
+        if p.tipo == ProdutoTipo.COMBO:
+            combo = _disponibilidade([
+                (quantidade, todos.get(comp_id), saldos.get(comp_id))
+                for comp_id, quantidade in combo_fichas[p.id]
+            ])
+        out.append(_montar_display(p, saldos[p.id], combo))
+    return out
@@ -0,0 +1,167 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.query_budget import produtos_no_request
+from app.db.session import on_commit, upsert_somando
+from app.models.models import (
+    Comanda, ComandaStatus, ItemComanda, Produto, User,
+    VendaDiaProduto, VendaDiaVendedor, BR_TZ, now_br
+)
+
+CANAL_COMANDA = "COMANDA"
+CANAL_BALCAO = "BALCAO"
+
+def dia_negocio(dt: datetime | None = None) -> date:
+    # Mesma regra no registro da venda e no rebuild: o dia vira em DIA_NEGOCIO_CORTE_H.
+    return ((dt or now_br()) - timedelta(hours=settings.DIA_NEGOCIO_CORTE_H)).date()
+
+def inicio_dia_negocio(dia: date) -> datetime:
+    return datetime.combine(dia, time(settings.DIA_NEGOCIO_CORTE_H), tzinfo=BR_TZ)
+
+def registrar_venda(
+    db: Session,
+    canal: str,
+    id_vendedor: int,
+    linhas: list[tuple[int, Decimal, Decimal]],
+    dia: date | None = None,
+    contar: bool = True,
+):
+    # Soma a venda nos rollups (dia x produto e dia x vendedor) na mesma transacao.
+    # linhas: (id_produto, quantidade, total); produtos repetidos sao somados.
+    dia = dia or dia_negocio()
+    por_produto: dict[int, list[Decimal]] = {}
+    for id_produto, qtd, total in linhas:
+        acc = por_produto.setdefault(id_produto, [Decimal(0), Decimal(0)])
+        acc[0] += Decimal(qtd)
+        acc[1] += Decimal(total)
+    produtos_no_request(len(por_produto))
+
+    for id_produto in sorted(por_produto):
+        qtd, total = por_produto[id_produto]
+        upsert_somando(
+            db, VendaDiaProduto.__table__,
+            {"dia": dia, "id_produto": id_produto, "id_vendedor": id_vendedor, "canal": canal},
+            {"quantidade": qtd, "total": total}
+        )
+    total_venda = sum((t for _, t in por_produto.values()), Decimal(0))
+    upsert_somando(
+        db, VendaDiaVendedor.__table__,
+        {"dia": dia, "id_vendedor": id_vendedor, "canal": canal},
+        {"qtd_vendas": 1, "total": total_venda}
+    )
+    if contar:
+        on_commit(db, lambda: _contar_venda(canal, sum((q for q, _ in por_produto.values()), Decimal(0)), total_venda))
+
+def _contar_venda(canal: str, itens: Decimal, total: Decimal):
+    metrics.itens_vendidos.inc(float(itens), canal=canal)
+    metrics.valor_vendido.inc(float(total), canal=canal)
+    if canal == CANAL_BALCAO:
+        metrics.vendas_balcao.inc()
+    else:
+        metrics.comandas_finalizadas.inc()
+
+def _linhas_da_comanda(db: Session, id_comanda: int) -> list[tuple[int, Decimal, Decimal]]:
+    return [
+        (pid, qtd, total)
+        for pid, qtd, total in db.execute(
+            select(ItemComanda.id_produto, func.sum(ItemComanda.quantidade), func.sum(ItemComanda.total_item))
+            .where(ItemComanda.id_comanda == id_comanda)
+            .group_by(ItemComanda.id_produto)
+        ).all()
+    ]
+
+def registrar_venda_comanda(db: Session, comanda: Comanda, dia: date | None = None, contar: bool = True):
+    registrar_venda(db, CANAL_COMANDA, comanda.id_vendedor, _linhas_da_comanda(db, comanda.id), dia, contar)
+
+def resumo_periodo(
+    db: Session,
+    inicio: date,
+    fim: date,
+    id_vendedor: int | None = None,
+    canal: str | None = None,
+) -> dict:
+    # Periodo fechado [inicio, fim], lido so dos rollups.
+    def filtrar(stmt, t):
+        stmt = stmt.where(t.dia >= inicio, t.dia <= fim)
+        if id_vendedor is not None:
+            stmt = stmt.where(t.id_vendedor == id_vendedor)
+        if canal:
+            stmt = stmt.where(t.canal == canal)
+        return stmt
+
+    total_prod = func.sum(VendaDiaProduto.total)
+    produtos = [
+        {"id": pid, "nome": nome, "quantidade": qtd, "total": total}
+        for pid, nome, qtd, total in db.execute(
+            filtrar(
+                select(Produto.id, Produto.nome, func.sum(VendaDiaProduto.quantidade), total_prod)
+                .join(Produto, Produto.id == VendaDiaProduto.id_produto),
+                VendaDiaProduto
+            ).group_by(Produto.id, Produto.nome).order_by(total_prod.desc())
+        ).all()
+    ]
+
+    total_vend = func.sum(VendaDiaVendedor.total)
+    vendedores = [
+        {"id": vid, "nome": nome, "qtd_vendas": qtd, "total": total}
+        for vid, nome, qtd, total in db.execute(
+            filtrar(
+                select(User.id, User.nome, func.sum(VendaDiaVendedor.qtd_vendas), total_vend)
+                .join(User, User.id == VendaDiaVendedor.id_vendedor),
+                VendaDiaVendedor
+            ).group_by(User.id, User.nome).order_by(total_vend.desc())
+        ).all()
+    ]
+
+    por_dia = [
+        {"dia": dia, "qtd_vendas": qtd, "total": total}
+        for dia, qtd, total in db.execute(
+            filtrar(
+                select(VendaDiaVendedor.dia, func.sum(VendaDiaVendedor.qtd_vendas), total_vend),
+                VendaDiaVendedor
+            ).group_by(VendaDiaVendedor.dia).order_by(VendaDiaVendedor.dia)
+        ).all()
+    ]
+
+    return {
+        "inicio": inicio,
+        "fim": fim,
+        "total_vendas": sum((Decimal(d["total"]) for d in por_dia), Decimal(0)),
+        "qtd_vendas": sum(d["qtd_vendas"] for d in por_dia),
+        "produtos": produtos,
+        "vendedores": vendedores,
+        "por_dia": por_dia,
+    }
+
+def rebuild_vendas_dia(db: Session) -> int:
+    # Recalcula o canal COMANDA a partir das comandas finalizadas (dia de negocio de atualizada_em).
+    # Vendas de balcao nao tem itens gravados, entao o historico delas e mantido.
+    db.execute(delete(VendaDiaProduto).where(VendaDiaProduto.canal == CANAL_COMANDA))
+    db.execute(delete(VendaDiaVendedor).where(VendaDiaVendedor.canal == CANAL_COMANDA))
+    comandas = db.execute(
+        select(Comanda).where(Comanda.status == ComandaStatus.FINALIZADA).order_by(Comanda.id)
+    ).scalars().all()
+    for c in comandas:
+        registrar_venda_comanda(db, c, dia_negocio(c.atualizada_em), contar=False)
+    return len(comandas)
+
+def garantir_vendas_dia(db: Session) -> int:
+    # Backfill unico para bancos que ja tinham comandas finalizadas antes dos rollups.
+    has_rollup = db.execute(select(VendaDiaVendedor.dia).limit(1)).first()
+    has_finalizadas = db.execute(
+        select(Comanda.id).where(Comanda.status == ComandaStatus.FINALIZADA).limit(1)
+    ).first()
+    if has_rollup or not has_finalizadas:
+        return 0
+    n = rebuild_vendas_dia(db)
+    db.commit()
+    return n
+
+def periodo_anterior(inicio: date, fim: date) -> tuple[date, date]:
+    dias = (fim - inicio).days + 1
+    return inicio - timedelta(days=dias), inicio - timedelta(days=1)
@@ -0,0 +1,131 @@
+import json
+import math
+import platform
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Utilitarios compartilhados pelos scripts de benchmark: latencias por operacao,
+# percentis, leitura do /metrics e resultados em JSON comparaveis entre execucoes.
+
+def percentil(valores: list[float], p: float) -> float:
+    # Nearest-rank, sobre a lista ja ordenada.
+    if not valores:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(valores)) - 1)
+    return valores[k]
+
+def resumir(amostras: list[float], duracao_s: float | None = None) -> dict:
+    ordenadas = sorted(amostras)
+    out = {
+        "n": len(ordenadas),
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+        "max_ms": round((ordenadas[-1] if ordenadas else 0) * 1000, 3),
+        "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 3) if ordenadas else 0.0,
+    }
+    if duracao_s:
+        out["por_s"] = round(len(ordenadas) / duracao_s, 2)
+    return out
+
+
+class Latencias:
+    # Amostras por operacao, de varias threads. status: "ok", "rejeitada" (4xx esperado,
+    # ex.: sem estoque) ou "erro".
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._amostras: dict[str, list[float]] = {}
+        self._status: dict[str, dict[str, int]] = {}
+
+    def registrar(self, operacao: str, segundos: float, status: str = "ok"):
+        with self._lock:
+            self._amostras.setdefault(operacao, []).append(segundos)
+            contagem = self._status.setdefault(operacao, {})
+            contagem[status] = contagem.get(status, 0) + 1
+
+    def amostras(self, operacao: str) -> list[float]:
+        with self._lock:
+            return list(self._amostras.get(operacao, []))
+
+    def medir(self, operacao: str, fn, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            r = fn(*args, **kwargs)
+        except Exception:
+            self.registrar(operacao, time.perf_counter() - inicio, "erro")
+            raise
+        self.registrar(operacao, time.perf_counter() - inicio)
+        return r
+
+    def resumo(self, duracao_s: float | None = None) -> dict:
+        with self._lock:
+            itens = [(op, list(a), dict(self._status[op])) for op, a in self._amostras.items()]
+        return {op: {**resumir(a, duracao_s), "status": st} for op, a, st in sorted(itens)}
+
+
+def ler_metricas(texto: str) -> dict[str, float]:
+    # Formato texto do Prometheus -> {"nome{labels}": valor}; ignora HELP/TYPE.
+    out = {}
+    for linha in texto.splitlines():
+        if not linha or linha.startswith("#"):
+            continue
+        nome, _, valor = linha.rpartition(" ")
+        try:
+            out[nome] = float(valor)
+        except ValueError:
+            continue
+    return out
+
+def somar_metrica(metricas: dict[str, float], nome: str, contem: str = "") -> float:
+    return sum(v for k, v in metricas.items() if (k == nome or k.startswith(nome + "{")) and contem in k)
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def ambiente() -> dict:
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+    }
+
+def salvar_json(caminho: str, dados: dict):
+    Path(caminho).write_text(json.dumps(dados, indent=2, ensure_ascii=False, default=str))
+
+def comparar(atual: dict, anterior: dict, campos=("p50_ms", "p95_ms", "p99_ms", "por_s")) -> list[str]:
+    # Diferencas por operacao entre dois resultados ({"operacoes": {op: resumo}}).
+    linhas = []
+    antes = anterior.get("operacoes", {})
+    for op, r in atual.get("operacoes", {}).items():
+        if op not in antes:
+            continue
+        partes = []
+        for campo in campos:
+            a, b = antes[op].get(campo), r.get(campo)
+            if a is None or b is None:
+                continue
+            pct = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            partes.append(f"{campo} {a} -> {b} ({pct})")
+        if partes:
+            linhas.append(f"{op}: " + ", ".join(partes))
+    return linhas
+
+def imprimir_tabela(operacoes: dict):
+    print(f"{'operacao':<32} {'n':>7} {'/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  status")
+    for op, r in operacoes.items():
+        status = " ".join(f"{k}={v}" for k, v in sorted(r.get("status", {}).items()))
+        if "queries" in r:
+            status = f"queries={r['queries']} {status}".strip()
+        print(
+            f"{op:<32} {r['n']:>7} {r.get('por_s', ''):>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+            f"{r['p99_ms']:>9} {r['max_ms']:>9}  {status}"
+        )
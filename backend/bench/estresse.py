@@ -0,0 +1,339 @@
+import argparse
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from app.db.migrations import migrar
+from app.db.session import WriterSessionLocal, SessionLocal, engine
+from app.models import models  # noqa: F401 (register models)
+from app.models.models import (
+    Comanda, ComandaStatus, ItemComanda, Produto, ProdutoComponente, ProdutoTipo, Role, SaldoEstoque, TipoMov, User
+)
+from app.services.bom_cache import invalidar_bom
+from app.services.comanda_service import add_item_comanda, remove_item_comanda, vender_balcao, vender_balcao_lote
+from app.services.estoque_service import ajustar_estoque_atual, registrar_mov, saldos_do_ledger
+
+from bench.comum import Latencias, ambiente, resumir, salvar_json
+
+# Estresse de concorrencia das baixas de estoque, em processo, contra o DATABASE_URL:
+# muitas sessoes vendendo os mesmos produtos quentes e combos com componentes em comum,
+# lancando itens nas mesmas comandas, removendo itens e dando entrada ao mesmo tempo.
+# A cada nivel de concorrencia confere:
+#   - estoque_atual == saldo do ledger == saldos_estoque, e nenhum saldo negativo;
+#   - saldo final == inicial + entradas - vendas confirmadas + estornos (sem venda a mais);
+#   - valor_total de cada comanda == soma dos itens (nenhum UPDATE perdido);
+#   - nenhum deadlock/erro de banco (so recusas de negocio, ValueError).
+# Sai com codigo 1 se alguma checagem falhar.
+#
+#   DATABASE_URL=postgresql://... python -m bench.estresse --workers 1,2,4,8,16,32 --duracao 10
+#   python -m bench.estresse --modo processo --workers 2,4,8
+
+
+PARTIDA_PROCESSOS_S = 5  # tempo para os processos (spawn) importarem o app antes da largada
+
+
+class Contabil:
+    # Consumo liquido por produto SIMPLES visto pelos workers (so transacoes confirmadas;
+    # estornos e entradas entram negativos).
+    def __init__(self, fichas: dict[int, list[tuple[int, Decimal]]]):
+        self.fichas = fichas
+        self.delta: dict[int, Decimal] = {}
+
+    def aplicar(self, id_produto: int, qtd: Decimal, sinal: int):
+        for pid, q in self.fichas.get(id_produto) or [(id_produto, Decimal(1))]:
+            self.delta[pid] = self.delta.get(pid, Decimal(0)) + sinal * q * qtd
+
+    def juntar(self, outro: dict[int, Decimal]):
+        for pid, v in outro.items():
+            self.delta[pid] = self.delta.get(pid, Decimal(0)) + v
+
+
+def preparar(args, rnd: random.Random) -> dict:
+    # Produtos novos a cada nivel: estoque so por entrada (ledger e estoque_atual juntos).
+    db = WriterSessionLocal()
+    try:
+        vendedor = db.execute(select(User.id).order_by(User.id).limit(1)).scalar()
+        if vendedor is None:
+            u = User(nome="Estresse", username="estresse", password_hash="!", role=Role.VENDEDOR, ativo=True)
+            db.add(u)
+            db.flush()
+            vendedor = u.id
+
+        simples = []
+        for i in range(args.produtos):
+            p = Produto(nome=f"Estresse #{i}", preco=Decimal(rnd.randint(5, 20)), estoque_atual=0, tipo=ProdutoTipo.SIMPLES, ativo=True)
+            db.add(p)
+            db.flush()
+            ajustar_estoque_atual(db, p.id, Decimal(args.estoque))
+            registrar_mov(db, p.id, TipoMov.ENTRADA, Decimal(args.estoque), detalhe="estresse")
+            simples.append(p.id)
+
+        # Combos compartilham componentes: a mesma linha de saldo e disputada por varios.
+        combos, fichas = [], {}
+        for i in range(args.combos):
+            c = Produto(nome=f"Estresse combo #{i}", preco=Decimal(30), estoque_atual=0, tipo=ProdutoTipo.COMBO, ativo=True)
+            db.add(c)
+            db.flush()
+            comps = [(pid, Decimal(rnd.randint(1, 2))) for pid in rnd.sample(simples, min(3, len(simples)))]
+            for pid, q in comps:
+                db.add(ProdutoComponente(id_produto_combo=c.id, id_produto_componente=pid, quantidade=q))
+            combos.append(c.id)
+            fichas[c.id] = comps
+
+        comandas = []
+        for i in range(args.comandas):
+            c = Comanda(id_vendedor=vendedor, mesa=f"E{i}", status=ComandaStatus.ABERTA, valor_total=0)
+            db.add(c)
+            db.flush()
+            comandas.append(c.id)
+        invalidar_bom(db)
+        db.commit()
+    finally:
+        db.close()
+    return {
+        "vendedor": vendedor, "simples": simples, "combos": combos, "comandas": comandas,
+        "fichas": {k: [(pid, str(q)) for pid, q in v] for k, v in fichas.items()},
+    }
+
+def _fichas(alvo: dict) -> dict[int, list[tuple[int, Decimal]]]:
+    return {int(k): [(pid, Decimal(q)) for pid, q in v] for k, v in alvo["fichas"].items()}
+
+def _erro_de_banco(e: Exception) -> str:
+    msg = str(getattr(e, "orig", e)).lower()
+    if "deadlock" in msg:
+        return "deadlock"
+    if "locked" in msg or "timeout" in msg or isinstance(e, TimeoutError):
+        return "lock_timeout"
+    if "serializ" in msg:
+        return "serializacao"
+    return type(e).__name__
+
+
+def _sortear(alvo: dict, rnd: random.Random):
+    # Escolhe a acao; devolve (nome, fn(db, pendente)). fn trabalha na sessao sem commit e
+    # deixa em `pendente` o efeito no estoque, aplicado so depois do commit.
+    produto = lambda: rnd.choice(alvo["combos"]) if alvo["combos"] and rnd.random() < 0.3 else rnd.choice(alvo["simples"])
+    sorteio = rnd.random()
+    if sorteio < 0.40:
+        id_comanda, pid, qtd = rnd.choice(alvo["comandas"]), produto(), Decimal(rnd.randint(1, 2))
+        def fn(db, pendente):
+            add_item_comanda(db, id_comanda, pid, qtd)
+            pendente.append((pid, qtd, 1))
+        return "add_item_comanda", fn
+    if sorteio < 0.62:
+        pid, qtd = produto(), Decimal(rnd.randint(1, 2))
+        def fn(db, pendente):
+            vender_balcao(db, pid, qtd, alvo["vendedor"])
+            pendente.append((pid, qtd, 1))
+        return "vender_balcao", fn
+    if sorteio < 0.85:
+        itens = [(produto(), Decimal(rnd.randint(1, 2))) for _ in range(rnd.randint(2, 4))]
+        def fn(db, pendente):
+            vender_balcao_lote(db, itens, alvo["vendedor"])
+            pendente.extend((pid, qtd, 1) for pid, qtd in itens)
+        return "vender_balcao_lote", fn
+    if sorteio < 0.97:
+        id_comanda = rnd.choice(alvo["comandas"])
+        def fn(db, pendente):
+            item = db.execute(
+                select(ItemComanda).where(ItemComanda.id_comanda == id_comanda).order_by(func.random()).limit(1)
+            ).scalars().first()
+            if item is None:
+                return
+            pid, qtd = item.id_produto, Decimal(item.quantidade)
+            remove_item_comanda(db, item.id)
+            pendente.append((pid, qtd, -1))
+        return "remove_item_comanda", fn
+    pid, qtd = rnd.choice(alvo["simples"]), Decimal(rnd.randint(5, 20))
+    def fn(db, pendente):
+        # Mesma ordem da rota de entrada (e das vendas): saldo primeiro, depois produtos.
+        registrar_mov(db, pid, TipoMov.ENTRADA, qtd, detalhe="estresse")
+        ajustar_estoque_atual(db, pid, qtd)
+        pendente.append((pid, qtd, -1))
+    return "entrada", fn
+
+def trabalhar(alvo: dict, fim: float, seed: int, lat: Latencias, contabil: Contabil, erros: dict, lock: threading.Lock):
+    rnd = random.Random(seed)
+    while time.time() < fim:
+        db = WriterSessionLocal()
+        pendente: list = []
+        nome, fn = _sortear(alvo, rnd)
+        inicio = time.perf_counter()
+        try:
+            fn(db, pendente)
+            db.commit()
+            status = "ok"
+        except ValueError:
+            db.rollback()
+            pendente = []
+            status = "rejeitada"
+        except Exception as e:
+            # Deadlock, lock timeout, StaleDataError (linha sumiu no meio)...: tudo que nao
+            # e recusa de negocio conta como falha.
+            db.rollback()
+            pendente = []
+            status = "erro"
+            tipo = _erro_de_banco(e)
+            with lock:
+                erros[tipo] = erros.get(tipo, 0) + 1
+        finally:
+            db.close()
+        lat.registrar(nome, time.perf_counter() - inicio, status)
+        if pendente:
+            with lock:
+                for pid, qtd, sinal in pendente:
+                    contabil.aplicar(pid, qtd, sinal)
+
+def _rodar_processo(alvo: dict, comeco: float, fim: float, seed: int, threads: int) -> dict:
+    # Entrada de cada processo do modo processo; devolve tudo serializavel. Todos comecam
+    # juntos em `comeco`, depois de importar o app.
+    time.sleep(max(0.0, comeco - time.time()))
+    lat, contabil, erros, lock = Latencias(), Contabil(_fichas(alvo)), {}, threading.Lock()
+    _threads(alvo, fim, seed, threads, lat, contabil, erros, lock)
+    return {
+        "amostras": {op: lat.amostras(op) for op in lat.resumo()},
+        "status": {op: r["status"] for op, r in lat.resumo().items()},
+        "delta": {pid: str(v) for pid, v in contabil.delta.items()},
+        "erros": erros,
+    }
+
+def _threads(alvo, fim, seed, n, lat, contabil, erros, lock):
+    ts = [
+        threading.Thread(target=trabalhar, args=(alvo, fim, seed * 1000 + i, lat, contabil, erros, lock), daemon=True)
+        for i in range(n)
+    ]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+def verificar(alvo: dict, iniciais: dict[int, Decimal], contabil: Contabil) -> dict:
+    db = SessionLocal()
+    try:
+        ids = alvo["simples"]
+        estoque = dict(db.execute(select(Produto.id, Produto.estoque_atual).where(Produto.id.in_(ids))).all())
+        materializado = dict(db.execute(select(SaldoEstoque.id_produto, SaldoEstoque.saldo).where(SaldoEstoque.id_produto.in_(ids))).all())
+        ledger = {pid: s for pid, (s, _) in saldos_do_ledger(db).items() if pid in set(ids)}
+        comandas = db.execute(
+            select(Comanda.id, Comanda.valor_total, func.coalesce(func.sum(ItemComanda.total_item), 0))
+            .outerjoin(ItemComanda, ItemComanda.id_comanda == Comanda.id)
+            .where(Comanda.id.in_(alvo["comandas"]))
+            .group_by(Comanda.id, Comanda.valor_total)
+        ).all()
+    finally:
+        db.close()
+
+    problemas = []
+    for pid in ids:
+        e, m, l = Decimal(estoque[pid]), Decimal(materializado.get(pid, 0)), Decimal(ledger.get(pid, 0))
+        if not (e == m == l):
+            problemas.append(f"produto {pid}: estoque_atual={e} saldos_estoque={m} ledger={l}")
+        if l < 0 or e < 0:
+            problemas.append(f"produto {pid}: saldo negativo ({l})")
+        esperado = iniciais[pid] - contabil.delta.get(pid, Decimal(0))
+        if l != esperado:
+            problemas.append(f"produto {pid}: saldo {l} != esperado {esperado} (venda a mais ou perdida)")
+    for id_comanda, valor_total, soma in comandas:
+        if Decimal(valor_total) != Decimal(soma):
+            problemas.append(f"comanda {id_comanda}: valor_total={valor_total} soma dos itens={soma}")
+    return {"problemas": problemas}
+
+def nivel(args, workers: int, rnd: random.Random) -> dict:
+    alvo = preparar(args, rnd)
+    iniciais = {pid: Decimal(args.estoque) for pid in alvo["simples"]}
+    contabil, lat, erros, lock = Contabil(_fichas(alvo)), Latencias(), {}, threading.Lock()
+    if args.modo == "processo":
+        comeco = time.time() + PARTIDA_PROCESSOS_S
+        fim = comeco + args.duracao
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(workers) as pool:
+            parciais = pool.starmap(_rodar_processo, [
+                (alvo, comeco, fim, rnd.randint(0, 10**6) + i, args.threads_por_processo) for i in range(workers)
+            ])
+        for p in parciais:
+            for op, amostras in p["amostras"].items():
+                for s in amostras:
+                    lat.registrar(op, s, "ok")
+            contabil.juntar({int(pid): Decimal(v) for pid, v in p["delta"].items()})
+            for k, v in p["erros"].items():
+                erros[k] = erros.get(k, 0) + v
+        status = {}
+        for p in parciais:
+            for op, st in p["status"].items():
+                acc = status.setdefault(op, {})
+                for k, v in st.items():
+                    acc[k] = acc.get(k, 0) + v
+        duracao = args.duracao
+    else:
+        inicio = time.perf_counter()
+        _threads(alvo, time.time() + args.duracao, rnd.randint(0, 10**6), workers, lat, contabil, erros, lock)
+        status = None
+        duracao = time.perf_counter() - inicio
+
+    operacoes = lat.resumo(duracao)
+    if status is not None:
+        for op, st in status.items():
+            operacoes[op]["status"] = st
+    todas = [s for op in operacoes for s in lat.amostras(op)]
+    ok = sum(r["status"].get("ok", 0) for r in operacoes.values())
+    rejeitadas = sum(r["status"].get("rejeitada", 0) for r in operacoes.values())
+    checagem = verificar(alvo, iniciais, contabil)
+    if erros:
+        checagem["problemas"].append(f"erros de banco: {erros}")
+    return {
+        "workers": workers,
+        "duracao_s": round(duracao, 3),
+        "ops_por_s": round(len(todas) / duracao, 2),
+        "ok_por_s": round(ok / duracao, 2),
+        "ok": ok,
+        "rejeitadas": rejeitadas,
+        "erros": erros,
+        "latencia": resumir(todas),
+        "operacoes": operacoes,
+        **checagem,
+    }
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.estresse", description="Estresse de concorrencia das vendas (sem venda a mais).")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="niveis de concorrencia, separados por virgula")
+    parser.add_argument("--modo", choices=("thread", "processo"), default="thread")
+    parser.add_argument("--threads-por-processo", type=int, default=1)
+    parser.add_argument("--duracao", type=float, default=5, help="segundos por nivel")
+    parser.add_argument("--produtos", type=int, default=4, help="produtos quentes por nivel")
+    parser.add_argument("--combos", type=int, default=3)
+    parser.add_argument("--comandas", type=int, default=3, help="comandas abertas disputadas")
+    parser.add_argument("--estoque", type=int, default=150, help="estoque inicial por produto (baixo = esgota na corrida)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--saida", default=None, help="grava o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    migrar(engine)
+    rnd = random.Random(args.seed)
+    niveis = []
+    print(f"{'workers':>7} {'ops/s':>9} {'ok/s':>9} {'ok':>7} {'recus.':>7} {'p50':>8} {'p95':>8} {'p99':>8}  checagens")
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = nivel(args, workers, rnd)
+        niveis.append(r)
+        lat = r["latencia"]
+        print(
+            f"{workers:>7} {r['ops_por_s']:>9} {r['ok_por_s']:>9} {r['ok']:>7} {r['rejeitadas']:>7} "
+            f"{lat['p50_ms']:>8} {lat['p95_ms']:>8} {lat['p99_ms']:>8}  "
+            + ("ok" if not r["problemas"] else f"{len(r['problemas'])} FALHAS")
+        )
+        for p in r["problemas"][:10]:
+            print("   ", p)
+
+    if args.saida:
+        salvar_json(args.saida, {
+            "ambiente": ambiente(), "banco": engine.dialect.name,
+            "parametros": vars(args), "niveis": niveis,
+        })
+    return 1 if any(r["problemas"] for r in niveis) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select, text
+
+from app.core.security import hash_password
+from app.db.migrations import migrar
+from app.db.session import Base, WriterSessionLocal, engine, upsert_somando
+from app.models import models  # noqa: F401 (register models)
+from app.models.models import (
+    BR_TZ, Caixa, CaixaMov, CaixaMovTipo, CaixaStatus, Comanda, ComandaStatus, ItemComanda, LogAcao,
+    MovEstoque, PagamentoTipo, Produto, ProdutoComponente, ProdutoTipo, Role, TipoMov, User,
+    VendaDiaProduto, VendaDiaVendedor
+)
+from app.services.caixa_service import garantir_caixa_totais
+from app.services.estoque_service import rebuild_saldos
+from app.services.vendas_service import CANAL_BALCAO, CANAL_COMANDA
+
+# Gera um historico sintetico grande direto no DATABASE_URL configurado, com INSERTs em
+# lote (executemany do core, ids atribuidos aqui): produtos, combos, vendedores e, dia a
+# dia, comandas com itens, vendas de balcao, movimentos de estoque, caixas e logs. Os
+# derivados (saldos_estoque, rollups de vendas, caixa_totais) saem consistentes com o ledger.
+#
+#   DATABASE_URL=sqlite:///./grande.db python -m bench.gerar_dados --dias 365 --movs 2000000
+
+SENHA_VENDEDORES = "bench-senha-123"
+ACOES_LOG = ("LOGIN", "CRIAR_COMANDA", "ADD_ITEM_COMANDA", "FINALIZAR_COMANDA", "REMOVER_ITEM_COMANDA", "VENDA_BALCAO")
+
+
+class Gravador:
+    # Acumula linhas por tabela e grava em lotes numa transacao por lote. So grava em
+    # talvez_gravar(), chamado entre vendas, para nunca separar filhos dos pais (FKs).
+    def __init__(self, lote: int):
+        self.lote = lote
+        self.linhas: dict = {}
+        self.total: dict[str, int] = {}
+        self.proximo_id: dict[str, int] = {}
+        self._conn = engine.execution_options(escrita=True)
+
+    def iniciar_ids(self, *tabelas):
+        with engine.connect() as conn:
+            for t in tabelas:
+                self.proximo_id[t.name] = (conn.execute(select(func.max(t.c.id))).scalar() or 0) + 1
+
+    def novo_id(self, tabela) -> int:
+        i = self.proximo_id[tabela.name]
+        self.proximo_id[tabela.name] = i + 1
+        return i
+
+    def add(self, tabela, linha: dict):
+        self.linhas.setdefault(tabela, []).append(linha)
+
+    def talvez_gravar(self):
+        if sum(len(v) for v in self.linhas.values()) >= self.lote:
+            self.gravar()
+
+    def gravar(self):
+        # Ordem das FKs (sorted_tables), tudo que estiver pendente.
+        with self._conn.begin() as conn:
+            for tabela in Base.metadata.sorted_tables:
+                pendentes = self.linhas.pop(tabela, None)
+                if pendentes:
+                    conn.execute(insert(tabela), pendentes)
+                    self.total[tabela.name] = self.total.get(tabela.name, 0) + len(pendentes)
+
+    def ajustar_sequences(self):
+        if engine.dialect.name != "postgresql":
+            return
+        with self._conn.begin() as conn:
+            for nome in self.proximo_id:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{nome}', 'id'), COALESCE((SELECT max(id) FROM {nome}), 1))"
+                ))
+
+
+def _horario(rnd: random.Random, dia: date) -> datetime:
+    # Noite de bar: 18h as 3h do dia seguinte, mais cheio perto da meia-noite.
+    minutos = min(max(rnd.gauss(330, 120), 0), 540)
+    return datetime.combine(dia, datetime.min.time(), BR_TZ) + timedelta(hours=18, minutes=minutos)
+
+def _dinheiro(v) -> Decimal:
+    return Decimal(v).quantize(Decimal("0.01"))
+
+def gerar(args) -> dict:
+    rnd = random.Random(args.seed)
+    migrar(engine)
+
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(Comanda.__table__)).scalar() and not args.forcar:
+            raise SystemExit("o banco ja tem comandas; use --forcar para acrescentar mesmo assim")
+
+    g = Gravador(args.lote)
+    tabelas = [t.__table__ for t in (User, Produto, ProdutoComponente, Caixa, CaixaMov, Comanda, ItemComanda, MovEstoque, LogAcao)]
+    g.iniciar_ids(*tabelas)
+    P, PC, U = Produto.__table__, ProdutoComponente.__table__, User.__table__
+    CX, CM, C, IC, ME, LG = (t.__table__ for t in (Caixa, CaixaMov, Comanda, ItemComanda, MovEstoque, LogAcao))
+
+    inicio = datetime.now(BR_TZ).date() - timedelta(days=args.dias)
+    criado = datetime.combine(inicio, datetime.min.time(), BR_TZ)
+
+    # Cadastro
+    senha = hash_password(SENHA_VENDEDORES)
+    vendedores = []
+    for i in range(args.vendedores):
+        uid = g.novo_id(U)
+        g.add(U, {"id": uid, "nome": f"Vendedor {uid}", "username": f"gen_vendedor_{uid}", "password_hash": senha,
+                  "role": Role.VENDEDOR, "ativo": True, "criado_em": criado})
+        vendedores.append(uid)
+
+    precos, simples, combos, fichas = {}, [], [], {}
+    for i in range(args.produtos):
+        pid = g.novo_id(P)
+        precos[pid] = _dinheiro(rnd.choice((6, 8, 10, 12, 15, 18, 25, 30, 45)))
+        g.add(P, {"id": pid, "nome": f"Produto {pid}", "preco": precos[pid], "estoque_atual": 0, "estoque_minimo": 10,
+                  "tipo": ProdutoTipo.SIMPLES, "ativo": True, "criado_em": criado, "atualizado_em": criado})
+        simples.append(pid)
+    for i in range(args.combos):
+        pid = g.novo_id(P)
+        comps = [(c, Decimal(rnd.randint(1, 3))) for c in rnd.sample(simples, min(rnd.randint(2, 4), len(simples)))]
+        precos[pid] = _dinheiro(sum(precos[c] * q for c, q in comps) * Decimal("0.85"))
+        g.add(P, {"id": pid, "nome": f"Combo {pid}", "preco": precos[pid], "estoque_atual": 0, "estoque_minimo": 0,
+                  "tipo": ProdutoTipo.COMBO, "ativo": True, "criado_em": criado, "atualizado_em": criado})
+        for c, q in comps:
+            g.add(PC, {"id": g.novo_id(PC), "id_produto_combo": pid, "id_produto_componente": c, "quantidade": q})
+        combos.append(pid)
+        fichas[pid] = comps
+
+    # Movimentos por comanda/venda: ~1 por item simples, len(ficha) por combo.
+    itens_medio = (1 + args.itens_max) / 2
+    comps_medio = sum(len(f) for f in fichas.values()) / len(fichas) if fichas else 1
+    movs_por_venda = itens_medio * (1 + args.prob_combo * (comps_medio - 1))
+    comandas_dia = args.comandas_dia
+    if args.movs:
+        comandas_dia = max(1, math.ceil(args.movs / args.dias / movs_por_venda) - args.balcao_dia)
+
+    saldo = {pid: Decimal(0) for pid in simples}
+    rollup_prod: dict[tuple, list[Decimal]] = {}
+    rollup_vend: dict[tuple, list] = {}
+
+    def mov(pid, tipo, qtd, quando, detalhe, id_comanda=None, id_item=None):
+        g.add(ME, {"id": g.novo_id(ME), "id_comanda": id_comanda, "id_item_comanda": id_item, "id_produto": pid,
+                   "tipo": tipo, "quantidade": qtd, "data_hora": quando, "detalhe": detalhe})
+        saldo[pid] += qtd if tipo != TipoMov.BAIXA else -qtd
+
+    def baixar(pid, qtd, quando, detalhe, id_comanda=None, id_item=None, tipo=TipoMov.BAIXA):
+        for comp, q in fichas.get(pid) or [(pid, Decimal(1))]:
+            mov(comp, tipo, q * qtd, quando, detalhe, id_comanda, id_item)
+
+    def repor(quando):
+        # Reposicao: cada produto volta a ter ao menos o consumo de uma semana.
+        alvo = Decimal(max(50, comandas_dia * 2))
+        for pid in simples:
+            if saldo[pid] < alvo:
+                mov(pid, TipoMov.ENTRADA, alvo * 2 - saldo[pid], quando, "Entrada de estoque")
+
+    def somar_rollup(dia, vendedor, canal, linhas):
+        total = Decimal(0)
+        for pid, qtd, valor in linhas:
+            acc = rollup_prod.setdefault((dia, pid, vendedor, canal), [Decimal(0), Decimal(0)])
+            acc[0] += qtd
+            acc[1] += valor
+            total += valor
+        acc = rollup_vend.setdefault((dia, vendedor, canal), [0, Decimal(0)])
+        acc[0] += 1
+        acc[1] += total
+
+    t0 = time.perf_counter()
+    for d in range(args.dias):
+        dia = inicio + timedelta(days=d)
+        if d % 7 == 0:
+            repor(datetime.combine(dia, datetime.min.time(), BR_TZ) + timedelta(hours=14))
+
+        abertura = datetime.combine(dia, datetime.min.time(), BR_TZ) + timedelta(hours=17)
+        id_caixa = g.novo_id(CX)
+        saldo_inicial = _dinheiro(200)
+        caixa_movs = [(CaixaMovTipo.ABERTURA, saldo_inicial, "Abertura de caixa", None, abertura)]
+
+        for _ in range(max(0, int(rnd.gauss(comandas_dia, comandas_dia * 0.15)))):
+            id_comanda = g.novo_id(C)
+            vendedor = rnd.choice(vendedores)
+            criada = _horario(rnd, dia)
+            fechada = criada + timedelta(minutes=rnd.randint(30, 180))
+            cancelada = rnd.random() < args.prob_cancelar
+            comanda = {"id": id_comanda, "id_vendedor": vendedor, "mesa": str(rnd.randint(1, 40)), "observacao": None,
+                       "status": ComandaStatus.CANCELADA if cancelada else ComandaStatus.FINALIZADA,
+                       "valor_total": 0, "criada_em": criada, "atualizada_em": fechada}
+            g.add(C, comanda)
+            linhas, total = [], Decimal(0)
+            for _ in range(rnd.randint(1, args.itens_max)):
+                pid = rnd.choice(combos) if combos and rnd.random() < args.prob_combo else rnd.choice(simples)
+                qtd = Decimal(rnd.randint(1, 3))
+                id_item = g.novo_id(IC)
+                quando = criada + timedelta(minutes=rnd.randint(0, 90))
+                valor = precos[pid] * qtd
+                g.add(IC, {"id": id_item, "id_comanda": id_comanda, "id_produto": pid, "quantidade": qtd,
+                           "preco_unitario": precos[pid], "total_item": valor, "criado_em": quando})
+                baixar(pid, qtd, quando, "Venda produto simples" if pid not in fichas else "Venda combo", id_comanda, id_item)
+                if cancelada:
+                    baixar(pid, qtd, quando + timedelta(minutes=5), "Estorno por remocao de item", id_comanda, id_item, TipoMov.ESTORNO)
+                else:
+                    linhas.append((pid, qtd, valor))
+                    total += valor
+            if not cancelada:
+                comanda["valor_total"] = total
+                # Mesmo criterio do rollup da finalizacao: dia do atualizada_em.
+                somar_rollup(fechada.date(), vendedor, CANAL_COMANDA, linhas)
+                caixa_movs.append((CaixaMovTipo.VENDA, total, f"Comanda #{id_comanda}", None, fechada))
+            g.talvez_gravar()
+
+        for _ in range(max(0, int(rnd.gauss(args.balcao_dia, args.balcao_dia * 0.2)))):
+            vendedor = rnd.choice(vendedores)
+            quando = _horario(rnd, dia)
+            linhas = []
+            for _ in range(rnd.randint(1, 3)):
+                pid = rnd.choice(combos) if combos and rnd.random() < args.prob_combo else rnd.choice(simples)
+                qtd = Decimal(rnd.randint(1, 2))
+                baixar(pid, qtd, quando, "Venda balcao")
+                linhas.append((pid, qtd, precos[pid] * qtd))
+            somar_rollup(quando.date(), vendedor, CANAL_BALCAO, linhas)
+            pagamento = rnd.choice((PagamentoTipo.DINHEIRO, PagamentoTipo.CARTAO))
+            caixa_movs.append((CaixaMovTipo.VENDA, sum(v for _, _, v in linhas), "Venda balcao", pagamento, quando))
+            g.talvez_gravar()
+
+        vendas = sum(v for tipo, v, *_ in caixa_movs if tipo == CaixaMovTipo.VENDA)
+        dinheiro = sum(v for tipo, v, _, pag, _ in caixa_movs if tipo == CaixaMovTipo.VENDA and pag == PagamentoTipo.DINHEIRO)
+        sangria = _dinheiro(dinheiro * Decimal("0.5"))
+        fechamento = abertura + timedelta(hours=11)
+        if sangria:
+            caixa_movs.append((CaixaMovTipo.SANGRIA, sangria, "Sangria", None, fechamento - timedelta(hours=1)))
+        caixa_movs.append((CaixaMovTipo.FECHAMENTO, vendas, "Fechamento de caixa", None, fechamento))
+        g.add(CX, {"id": id_caixa, "status": CaixaStatus.FECHADO, "saldo_inicial": saldo_inicial,
+                   "saldo_final": saldo_inicial + vendas - sangria, "observacao": None,
+                   "aberto_em": abertura, "fechado_em": fechamento})
+        for tipo, valor, descricao, pagamento, quando in caixa_movs:
+            g.add(CM, {"id": g.novo_id(CM), "id_caixa": id_caixa, "tipo": tipo, "valor": valor, "descricao": descricao,
+                       "pagamento_tipo": pagamento, "valor_recebido": None, "troco": None, "criado_em": quando})
+
+        for _ in range(args.logs_dia):
+            g.add(LG, {"id": g.novo_id(LG), "usuario": f"Vendedor {rnd.choice(vendedores)}", "acao": rnd.choice(ACOES_LOG),
+                       "detalhe": f"comanda={rnd.randint(1, 10**6)}", "ip": f"10.0.0.{rnd.randint(2, 254)}",
+                       "data_hora": _horario(rnd, dia)})
+
+        g.talvez_gravar()
+        if (d + 1) % 30 == 0:
+            print(f"  {d + 1}/{args.dias} dias, {g.proximo_id['mov_estoque'] - 1} movimentos, {time.perf_counter() - t0:.0f}s", flush=True)
+
+    g.gravar()
+    g.ajustar_sequences()
+    rollups = (
+        (VendaDiaProduto.__table__, ("dia", "id_produto", "id_vendedor", "canal"), ("quantidade", "total"), rollup_prod),
+        (VendaDiaVendedor.__table__, ("dia", "id_vendedor", "canal"), ("qtd_vendas", "total"), rollup_vend),
+    )
+    db = WriterSessionLocal()
+    try:
+        for tabela, chaves, valores, acc in rollups:
+            if args.forcar:
+                # Pode haver rollup dos mesmos dias: soma em vez de inserir.
+                for k, v in acc.items():
+                    upsert_somando(db, tabela, dict(zip(chaves, k)), dict(zip(valores, v)))
+                continue
+            linhas = [{**dict(zip(chaves, k)), **dict(zip(valores, v))} for k, v in acc.items()]
+            for i in range(0, len(linhas), args.lote):
+                db.execute(insert(tabela), linhas[i:i + args.lote])
+        for pid, s in saldo.items():
+            db.execute(P.update().where(P.c.id == pid).values(estoque_atual=P.c.estoque_atual + s))
+        rebuild_saldos(db)
+        db.commit()
+        garantir_caixa_totais(db)
+    finally:
+        db.close()
+
+    return {"segundos": round(time.perf_counter() - t0, 1), "comandas_por_dia": comandas_dia, "linhas": g.total}
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.gerar_dados", description="Gera historico sintetico grande no DATABASE_URL.")
+    parser.add_argument("--produtos", type=int, default=500)
+    parser.add_argument("--combos", type=int, default=50)
+    parser.add_argument("--vendedores", type=int, default=15)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--comandas-dia", type=int, default=300)
+    parser.add_argument("--movs", type=int, default=None, help="movimentos de estoque desejados (recalcula --comandas-dia)")
+    parser.add_argument("--balcao-dia", type=int, default=100)
+    parser.add_argument("--itens-max", type=int, default=6)
+    parser.add_argument("--prob-combo", type=float, default=0.15)
+    parser.add_argument("--prob-cancelar", type=float, default=0.03)
+    parser.add_argument("--logs-dia", type=int, default=500)
+    parser.add_argument("--lote", type=int, default=10000, help="linhas por INSERT em lote")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--forcar", action="store_true", help="acrescenta mesmo com comandas no banco")
+    args = parser.parse_args(argv)
+
+    r = gerar(args)
+    print(f"gerado em {r['segundos']}s ({r['comandas_por_dia']} comandas/dia):")
+    for tabela, n in sorted(r["linhas"].items()):
+        print(f"  {tabela}: {n}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
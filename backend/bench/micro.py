@@ -0,0 +1,167 @@
+import argparse
+import json
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from sqlalchemy import case, func, select
+
+from app.core.query_budget import medir_queries
+from app.core.user_cache import UsuarioAtual
+from app.db.session import SessionLocal, WriterSessionLocal
+from app.models import models  # noqa: F401 (register models)
+from app.models.models import (
+    Comanda, ComandaStatus, MovEstoque, Produto, ProdutoComponente, ProdutoTipo, Role, SaldoEstoque, User, now_br
+)
+from app.routes.comandas import resumo_dia
+from app.services.comanda_service import add_item_comanda, vender_balcao
+from app.services.estoque_service import TIPOS_ENTRADA, saldo_atual, saldos_do_ledger
+from app.services.produto_service import calcular_disponibilidade_combo, produto_to_display, produtos_to_display
+from app.services.vendas_service import resumo_periodo
+
+from bench.comum import ambiente, comparar, imprimir_tabela, resumir, salvar_json
+
+# Micro-benchmarks das funcoes de servico, em processo, contra o DATABASE_URL configurado
+# (de preferencia um banco gerado por bench.gerar_dados). Escritas rodam numa transacao
+# desfeita a cada repeticao, entao o banco nao muda.
+#
+#   DATABASE_URL=sqlite:///./grande.db python -m bench.micro --saida micro.json
+
+
+def _escolher(db) -> dict:
+    # Alvos deterministicos: o produto simples com mais movimentos, o combo com mais
+    # componentes e um vendedor.
+    simples = db.execute(
+        select(SaldoEstoque.id_produto)
+        .join(Produto, Produto.id == SaldoEstoque.id_produto)
+        .where(Produto.tipo == ProdutoTipo.SIMPLES, Produto.ativo == True, SaldoEstoque.saldo > 10)
+        .order_by(SaldoEstoque.qtd_movs.desc()).limit(1)
+    ).scalar()
+    combo = db.execute(
+        select(ProdutoComponente.id_produto_combo)
+        .join(Produto, Produto.id == ProdutoComponente.id_produto_combo)
+        .where(Produto.ativo == True)
+        .group_by(ProdutoComponente.id_produto_combo)
+        .order_by(func.count().desc(), ProdutoComponente.id_produto_combo).limit(1)
+    ).scalar()
+    vendedor = db.execute(select(User.id).where(User.ativo == True).order_by(User.id).limit(1)).scalar()
+    if simples is None or vendedor is None:
+        raise SystemExit("banco sem produtos com estoque ou sem usuarios; rode bench.gerar_dados antes")
+    return {"simples": simples, "combo": combo, "vendedor": vendedor}
+
+def _saldo_ledger_produto(db, id_produto: int) -> Decimal:
+    # O saldo como era calculado antes de saldos_estoque: soma do ledger do produto.
+    return db.execute(
+        select(func.coalesce(func.sum(case(
+            (MovEstoque.tipo.in_(TIPOS_ENTRADA), MovEstoque.quantidade),
+            else_=-MovEstoque.quantidade
+        )), 0)).where(MovEstoque.id_produto == id_produto)
+    ).scalar()
+
+def _em_transacao_desfeita(fn):
+    def rodar():
+        db = WriterSessionLocal()
+        try:
+            fn(db)
+        finally:
+            db.rollback()
+            db.close()
+    return rodar
+
+def _nova_comanda(db, id_vendedor: int) -> int:
+    c = Comanda(id_vendedor=id_vendedor, status=ComandaStatus.ABERTA, valor_total=0)
+    db.add(c)
+    db.flush()
+    return c.id
+
+def benchmarks(db, alvo: dict) -> list[tuple[str, object]]:
+    produto = lambda pid: db.get(Produto, pid)
+    admin = UsuarioAtual(id=alvo["vendedor"], nome="bench", username="bench", role=Role.ADMIN, ativo=True)
+    ontem = now_br().date() - timedelta(days=1)
+    ativos = lambda: db.execute(select(Produto).where(Produto.ativo == True)).scalars().all()
+
+    lista = [
+        ("saldo.ledger_produto", lambda: _saldo_ledger_produto(db, alvo["simples"])),
+        ("saldo.ledger_todos", lambda: saldos_do_ledger(db)),
+        ("saldo.materializado", lambda: saldo_atual(db, alvo["simples"], Decimal(0))),
+        ("produto_to_display.simples", lambda: produto_to_display(db, produto(alvo["simples"]))),
+        ("produtos_to_display.catalogo", lambda: produtos_to_display(db, ativos())),
+        ("add_item_comanda.simples", _em_transacao_desfeita(
+            lambda w: add_item_comanda(w, _nova_comanda(w, alvo["vendedor"]), alvo["simples"], Decimal(1))
+        )),
+        ("vender_balcao.simples", _em_transacao_desfeita(
+            lambda w: vender_balcao(w, alvo["simples"], Decimal(1), alvo["vendedor"])
+        )),
+        ("resumo_dia", lambda: resumo_dia(db=db, user=admin)),
+        ("resumo_periodo.ontem", lambda: resumo_periodo(db, ontem, ontem)),
+        ("resumo_periodo.30d", lambda: resumo_periodo(db, ontem - timedelta(days=29), ontem)),
+        ("resumo_periodo.365d", lambda: resumo_periodo(db, ontem - timedelta(days=364), ontem)),
+    ]
+    if alvo["combo"]:
+        lista += [
+            ("produto_to_display.combo", lambda: produto_to_display(db, produto(alvo["combo"]))),
+            ("calcular_disponibilidade_combo", lambda: calcular_disponibilidade_combo(db, alvo["combo"])),
+            ("add_item_comanda.combo", _em_transacao_desfeita(
+                lambda w: add_item_comanda(w, _nova_comanda(w, alvo["vendedor"]), alvo["combo"], Decimal(1))
+            )),
+        ]
+    return lista
+
+def medir(fn, repeticoes: int, aquecimento: int, limite_s: float) -> dict:
+    for _ in range(aquecimento):
+        fn()
+    amostras, queries = [], 0
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        with medir_queries() as m:
+            t = time.perf_counter()
+            fn()
+            amostras.append(time.perf_counter() - t)
+        queries = max(queries, m.queries)
+        if time.perf_counter() - inicio > limite_s:
+            break  # funcoes lentas (ledger inteiro) param antes de todas as repeticoes
+    return {**resumir(amostras), "queries": queries}
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.micro", description="Micro-benchmarks das funcoes de servico.")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    parser.add_argument("--aquecimento", type=int, default=5)
+    parser.add_argument("--limite-s", type=float, default=20, help="tempo maximo por benchmark")
+    parser.add_argument("--filtro", default=None, help="so benchmarks cujo nome contem o texto")
+    parser.add_argument("--saida", default=None, help="grava o resultado em JSON")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execucao anterior")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        alvo = _escolher(db)
+        volumes = {
+            "produtos": db.execute(select(func.count()).select_from(Produto)).scalar(),
+            "mov_estoque": db.execute(select(func.count()).select_from(MovEstoque)).scalar(),
+            "comandas": db.execute(select(func.count()).select_from(Comanda)).scalar(),
+        }
+        resultados = {}
+        for nome, fn in benchmarks(db, alvo):
+            if args.filtro and args.filtro not in nome:
+                continue
+            resultados[nome] = medir(fn, args.repeticoes, args.aquecimento, args.limite_s)
+            db.rollback()  # nao acumula identity map/snapshot entre benchmarks
+    finally:
+        db.close()
+
+    print("volumes:", ", ".join(f"{k}={v}" for k, v in volumes.items()), "| alvos:", alvo)
+    imprimir_tabela(resultados)
+    resultado = {"ambiente": ambiente(), "volumes": volumes, "alvos": alvo, "operacoes": resultados}
+    if args.saida:
+        salvar_json(args.saida, resultado)
+    if args.comparar:
+        with open(args.comparar) as f:
+            linhas = comparar(resultado, json.load(f), campos=("p50_ms", "p95_ms", "p99_ms"))
+        print("comparacao com", args.comparar)
+        for linha in linhas:
+            print(" ", linha)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import httpx
+
+from bench.comum import (
+    Latencias, ambiente, comparar, imprimir_tabela, ler_metricas, resumir, salvar_json, somar_metrica
+)
+
+# Simula uma noite de bar contra a API rodando (SQLite ou Postgres, o que o servidor usar):
+# garcons abrem comandas, lancam itens (inclusive combos e lotes), removem itens,
+# cancelam/finalizam; caixas vendem no balcao em lote; todos consultam o catalogo.
+# No fim confere o estoque: nenhum saldo negativo e saldo == inicial - consumo visto
+# pelos clientes (sem venda a mais).
+#
+#   python -m bench.noite --url http://127.0.0.1:8000 --garcons 20 --caixas 3 --duracao 60
+
+SENHA_BENCH = "bench-senha-123"
+
+
+class Api:
+    def __init__(self, url: str, lat: Latencias, timeout: float):
+        self.cliente = httpx.Client(base_url=url, timeout=timeout)
+        self.lat = lat
+        self.incertos = 0  # requests sem resposta: nao da para saber se gravaram
+
+    def login(self, username: str, password: str):
+        r = self.req("auth.login", "POST", "/auth/login", json={"username": username, "password": password})
+        if r is None or r.status_code != 200:
+            raise SystemExit(f"login falhou para {username}: {r.status_code if r is not None else 'sem resposta'} {r.text if r is not None else ''}")
+        self.cliente.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+        return r.json()
+
+    def req(self, operacao: str, method: str, path: str, **kwargs) -> httpx.Response | None:
+        inicio = time.perf_counter()
+        try:
+            r = self.cliente.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.lat.registrar(operacao, time.perf_counter() - inicio, "erro")
+            if method != "GET":
+                self.incertos += 1
+            return None
+        duracao = time.perf_counter() - inicio
+        if r.status_code < 400:
+            status = "ok"
+        elif r.status_code in (400, 409):
+            status = "rejeitada"
+        else:
+            status = f"http_{r.status_code}"
+            if method != "GET" and r.status_code >= 500:
+                self.incertos += 1
+        self.lat.registrar(operacao, duracao, status)
+        return r
+
+    def fechar(self):
+        self.cliente.close()
+
+
+class Estoque:
+    # Consumo liquido por produto SIMPLES, somado a partir das respostas de sucesso.
+    def __init__(self, fichas: dict[int, list[tuple[int, Decimal]]]):
+        self.fichas = fichas
+        self._lock = threading.Lock()
+        self.consumo: dict[int, Decimal] = {}
+
+    def aplicar(self, id_produto: int, qtd, sinal: int = 1):
+        qtd = Decimal(str(qtd))
+        partes = self.fichas.get(id_produto) or [(id_produto, Decimal(1))]
+        with self._lock:
+            for pid, q in partes:
+                self.consumo[pid] = self.consumo.get(pid, Decimal(0)) + sinal * q * qtd
+
+
+class Cenario:
+    def __init__(self, args, simples: list[int], combos: list[int], estoque: Estoque, fim: float):
+        self.args = args
+        self.simples = simples
+        self.combos = combos
+        self.estoque = estoque
+        self.fim = fim
+        self.contagem_lock = threading.Lock()
+        self.contagem = {"comandas_finalizadas": 0, "comandas_canceladas": 0, "vendas_balcao": 0}
+
+    def contar(self, chave: str):
+        with self.contagem_lock:
+            self.contagem[chave] += 1
+
+    def produto(self, rnd: random.Random) -> int:
+        if self.combos and rnd.random() < self.args.prob_combo:
+            return rnd.choice(self.combos)
+        return rnd.choice(self.simples)
+
+    def pausa(self, rnd: random.Random):
+        if self.args.pausa_ms:
+            time.sleep(rnd.uniform(0, 2 * self.args.pausa_ms) / 1000)
+
+
+def _catalogo(api: Api, etag: dict):
+    headers = {"If-None-Match": etag["v"]} if etag.get("v") else {}
+    r = api.req("produtos.listar", "GET", "/produtos", headers=headers)
+    if r is not None and r.status_code == 200:
+        etag["v"] = r.headers.get("etag")
+
+def garcom(api: Api, cen: Cenario, rnd: random.Random):
+    etag = {}
+    n = 0
+    while time.monotonic() < cen.fim:
+        n += 1
+        r = api.req("comandas.abrir", "POST", "/comandas/", json={"mesa": f"B{n}"})
+        if r is None or r.status_code != 200:
+            cen.pausa(rnd)
+            continue
+        id_comanda = r.json()["id"]
+
+        for _ in range(rnd.randint(1, cen.args.itens_max)):
+            if rnd.random() < cen.args.prob_lote:
+                itens = [{"id_produto": cen.produto(rnd), "quantidade": rnd.randint(1, 2)} for _ in range(rnd.randint(2, 3))]
+                r = api.req("comandas.itens_lote", "POST", f"/comandas/{id_comanda}/itens/lote", json={"itens": itens})
+                if r is not None and r.status_code == 200:
+                    for it in itens:
+                        cen.estoque.aplicar(it["id_produto"], it["quantidade"])
+            else:
+                pid, qtd = cen.produto(rnd), rnd.randint(1, 2)
+                r = api.req("comandas.item", "POST", f"/comandas/{id_comanda}/itens", json={"id_produto": pid, "quantidade": qtd})
+                if r is not None and r.status_code == 200:
+                    cen.estoque.aplicar(pid, qtd)
+            if rnd.random() < cen.args.prob_catalogo:
+                _catalogo(api, etag)
+            cen.pausa(rnd)
+
+        sorteio = rnd.random()
+        if sorteio < cen.args.prob_remover + cen.args.prob_cancelar:
+            r = api.req("comandas.listar_itens", "GET", f"/comandas/{id_comanda}/itens")
+            itens = r.json() if r is not None and r.status_code == 200 else []
+            if sorteio < cen.args.prob_cancelar:
+                r = api.req("comandas.cancelar", "POST", f"/comandas/{id_comanda}/cancelar")
+                if r is not None and r.status_code == 200:
+                    for it in itens:
+                        cen.estoque.aplicar(it["id_produto"], it["quantidade"], -1)
+                    cen.contar("comandas_canceladas")
+                continue
+            if itens:
+                it = rnd.choice(itens)
+                r = api.req("comandas.remover_item", "DELETE", f"/comandas/itens/{it['id']}")
+                if r is not None and r.status_code == 200:
+                    cen.estoque.aplicar(it["id_produto"], it["quantidade"], -1)
+
+        r = api.req("comandas.finalizar", "POST", f"/comandas/{id_comanda}/finalizar")
+        if r is not None and r.status_code == 200:
+            cen.contar("comandas_finalizadas")
+        cen.pausa(rnd)
+
+def caixa(api: Api, cen: Cenario, rnd: random.Random):
+    etag = {}
+    while time.monotonic() < cen.fim:
+        itens = [{"id_produto": cen.produto(rnd), "quantidade": rnd.randint(1, 3)} for _ in range(rnd.randint(1, 3))]
+        r = api.req("caixa.venda_balcao_lote", "POST", "/caixa/venda-balcao-lote", json={"itens": itens, "pagamento_tipo": "CARTAO"})
+        if r is not None and r.status_code == 200:
+            for it in itens:
+                cen.estoque.aplicar(it["id_produto"], it["quantidade"])
+            cen.contar("vendas_balcao")
+        if rnd.random() < cen.args.prob_catalogo:
+            _catalogo(api, etag)
+        cen.pausa(rnd)
+
+
+def _ok(r: httpx.Response | None, contexto: str) -> dict | list:
+    if r is None or r.status_code >= 400:
+        raise SystemExit(f"{contexto}: {r.status_code if r is not None else 'sem resposta'} {r.text if r is not None else ''}")
+    return r.json()
+
+def _garantir_usuario(admin: Api, username: str, role: str):
+    r = admin.req("setup", "POST", "/admin/vendedores", json={"nome": username, "username": username, "password": SENHA_BENCH, "role": role})
+    if r is not None and r.status_code == 400:
+        # Sobra de uma execucao anterior: reativa e redefine a senha.
+        existente = next(u for u in _ok(admin.req("setup", "GET", "/admin/vendedores"), "listar usuarios") if u["username"] == username)
+        _ok(admin.req("setup", "PUT", f"/admin/vendedores/{existente['id']}", json={"password": SENHA_BENCH, "role": role, "ativo": True}), "atualizar usuario")
+    else:
+        _ok(r, f"criar usuario {username}")
+
+def preparar(admin: Api, args, rnd: random.Random) -> tuple[list[int], list[int], dict, dict[int, Decimal]]:
+    tag = time.strftime("%H%M%S")
+    simples = []
+    for i in range(args.produtos):
+        p = _ok(admin.req("setup", "POST", "/produtos", json={
+            "nome": f"Bench {tag} #{i}", "preco": rnd.randint(5, 30), "estoque_atual": 0, "tipo": "SIMPLES"
+        }), "criar produto")
+        _ok(admin.req("setup", "POST", f"/produtos/{p['id']}/entrada", json={
+            "quantidade": args.estoque, "data_entrada": time.strftime("%Y-%m-%d"), "validade": "2099-12-31"
+        }), "entrada de estoque")
+        simples.append(p["id"])
+
+    combos, fichas = [], {}
+    for i in range(args.combos):
+        p = _ok(admin.req("setup", "POST", "/produtos", json={"nome": f"Bench {tag} combo #{i}", "preco": rnd.randint(20, 60), "tipo": "COMBO"}), "criar combo")
+        comps = [(pid, Decimal(rnd.randint(1, 2))) for pid in rnd.sample(simples, min(2, len(simples)))]
+        _ok(admin.req("setup", "POST", f"/produtos/{p['id']}/componentes", json=[
+            {"id_produto_componente": pid, "quantidade": int(q)} for pid, q in comps
+        ]), "componentes do combo")
+        combos.append(p["id"])
+        fichas[p["id"]] = comps
+
+    for i in range(args.garcons):
+        _garantir_usuario(admin, f"bench_garcom_{i}", "VENDEDOR")
+    for i in range(args.caixas):
+        _garantir_usuario(admin, f"bench_caixa_{i}", "CAIXA")
+    if admin.req("setup", "GET", "/caixa/atual").json() is None:
+        _ok(admin.req("setup", "POST", "/caixa/abrir", json={"saldo_inicial": 0, "observacao": "bench"}), "abrir caixa")
+
+    iniciais = _saldos(admin, simples)
+    return simples, combos, fichas, iniciais
+
+def _saldos(admin: Api, ids: list[int]) -> dict[int, Decimal]:
+    catalogo = _ok(admin.req("setup", "GET", "/produtos"), "catalogo")
+    return {p["id"]: Decimal(str(p["saldo_atual"])) for p in catalogo if p["id"] in set(ids)}
+
+def _metricas(admin: Api, token: str | None) -> dict[str, float] | None:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        r = admin.cliente.get("/metrics", headers=headers)
+    except httpx.HTTPError:
+        return None
+    return ler_metricas(r.text) if r.status_code == 200 else None
+
+def _delta_metricas(antes: dict | None, depois: dict | None) -> dict | None:
+    if antes is None or depois is None:
+        return None
+    d = lambda nome, contem="": round(somar_metrica(depois, nome, contem) - somar_metrica(antes, nome, contem), 6)
+    return {
+        "lock_espera_s": d("db_lock_wait_seconds_sum"),
+        "lock_esperas": d("db_lock_wait_seconds_count"),
+        "pool_espera_s": d("db_pool_checkout_wait_seconds_total"),
+        "pool_timeouts": d("db_pool_checkout_timeouts_total"),
+        "http_5xx": d("http_requests_total", 'status="5'),
+        "queries": d("db_queries_total"),
+        "db_tempo_s": d("db_time_per_request_seconds_sum"),
+    }
+
+def verificar_estoque(iniciais: dict[int, Decimal], finais: dict[int, Decimal], estoque: Estoque) -> dict:
+    negativos, divergentes = [], []
+    for pid, inicial in iniciais.items():
+        final = finais.get(pid)
+        if final is None:
+            continue
+        if final < 0:
+            negativos.append({"id_produto": pid, "saldo": str(final)})
+        esperado = inicial - estoque.consumo.get(pid, Decimal(0))
+        if final != esperado:
+            divergentes.append({"id_produto": pid, "saldo": str(final), "esperado": str(esperado)})
+    return {"negativos": negativos, "divergentes": divergentes}
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.noite", description="Teste de carga: uma noite de bar contra a API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--admin", default="admin")
+    parser.add_argument("--senha", default="admin123")
+    parser.add_argument("--garcons", type=int, default=10)
+    parser.add_argument("--caixas", type=int, default=2)
+    parser.add_argument("--duracao", type=float, default=30, help="segundos de carga")
+    parser.add_argument("--produtos", type=int, default=20)
+    parser.add_argument("--combos", type=int, default=4)
+    parser.add_argument("--estoque", type=int, default=500, help="entrada inicial por produto (baixo = disputa por estoque)")
+    parser.add_argument("--itens-max", type=int, default=5)
+    parser.add_argument("--prob-combo", type=float, default=0.2)
+    parser.add_argument("--prob-lote", type=float, default=0.3)
+    parser.add_argument("--prob-remover", type=float, default=0.2)
+    parser.add_argument("--prob-cancelar", type=float, default=0.05)
+    parser.add_argument("--prob-catalogo", type=float, default=0.2)
+    parser.add_argument("--pausa-ms", type=float, default=0, help="pausa media entre acoes (0 = carga maxima)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--metrics-token", default=None)
+    parser.add_argument("--saida", default=None, help="grava o resultado em JSON")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execucao anterior")
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    lat_setup = Latencias()
+    admin = Api(args.url, lat_setup, args.timeout)
+    admin.login(args.admin, args.senha)
+    simples, combos, fichas, iniciais = preparar(admin, args, rnd)
+    estoque = Estoque(fichas)
+
+    lat = Latencias()
+    atores = []
+    for tipo, qtd in (("garcom", args.garcons), ("caixa", args.caixas)):
+        for i in range(qtd):
+            api = Api(args.url, lat, args.timeout)
+            api.login(f"bench_{tipo}_{i}", SENHA_BENCH)
+            atores.append((tipo, api, random.Random(rnd.random())))
+
+    metricas_antes = _metricas(admin, args.metrics_token)
+    inicio = time.monotonic()
+    cen = Cenario(args, simples, combos, estoque, inicio + args.duracao)
+    threads = [
+        threading.Thread(target=garcom if tipo == "garcom" else caixa, args=(api, cen, r), name=f"{tipo}-{i}", daemon=True)
+        for i, (tipo, api, r) in enumerate(atores)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.monotonic() - inicio
+    metricas_depois = _metricas(admin, args.metrics_token)
+
+    checagem = verificar_estoque(iniciais, _saldos(admin, simples), estoque)
+    incertos = sum(api.incertos for _, api, _ in atores)
+    operacoes = lat.resumo(duracao)
+    total = sum(r["n"] for r in operacoes.values())
+    resultado = {
+        "ambiente": ambiente(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("senha", "metrics_token")},
+        "duracao_s": round(duracao, 3),
+        "requests": total,
+        "requests_por_s": round(total / duracao, 2),
+        "transacoes": dict(cen.contagem),
+        "operacoes": operacoes,
+        "login": resumir(lat_setup.amostras("auth.login") + lat.amostras("auth.login")),
+        "servidor": _delta_metricas(metricas_antes, metricas_depois),
+        "estoque": {**checagem, "incertos": incertos},
+    }
+
+    print(f"{len(atores)} usuarios ({args.garcons} garcons, {args.caixas} caixas), {duracao:.1f}s, "
+          f"{resultado['requests']} requests ({resultado['requests_por_s']}/s)")
+    print("transacoes:", ", ".join(f"{k}={v}" for k, v in cen.contagem.items()))
+    imprimir_tabela(operacoes)
+    if resultado["servidor"]:
+        print("servidor:", json.dumps(resultado["servidor"]))
+    else:
+        print("servidor: /metrics indisponivel (use --metrics-token se METRICS_TOKEN estiver definido)")
+
+    falhou = bool(checagem["negativos"])
+    print(f"estoque: {len(checagem['negativos'])} saldos negativos, {len(checagem['divergentes'])} divergencias")
+    if checagem["divergentes"]:
+        if incertos:
+            print(f"  ({incertos} escritas sem resposta: divergencia pode ser delas)")
+        else:
+            falhou = True
+        for d in checagem["divergentes"][:10]:
+            print(f"  produto={d['id_produto']} saldo={d['saldo']} esperado={d['esperado']}")
+
+    if args.saida:
+        salvar_json(args.saida, resultado)
+    if args.comparar:
+        with open(args.comparar) as f:
+            linhas = comparar(resultado, json.load(f))
+        print("comparacao com", args.comparar)
+        for linha in linhas:
+            print(" ", linha)
+
+    admin.fechar()
+    for _, api, _ in atores:
+        api.fechar()
+    return 1 if falhou else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import os
+
+# Perfil multi-processo: gunicorn com workers uvicorn e o app importado uma vez no master
+# (preload), antes do fork. Caches em memoria sao por worker; as invalidacoes passam pela
+# outbox de eventos (ver app/services/eventos.py), entao mutacoes num worker valem em todos.
+#
+#   gunicorn -c gunicorn.conf.py app.main:app
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Recicla workers aos poucos (0 desliga); o jitter evita que todos reiniciem juntos.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+# IPs cujos X-Forwarded-For/-Proto valem (o worker uvicorn ja le proxy headers). Atras do
+# Traefik no compose o backend so e alcancado pelo proxy, entao la vale "*"; sem proxy,
+# deixe o padrao para ninguem forjar o IP do cliente (throttle de login usa esse IP).
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1,::1")
+
+def post_fork(server, worker):
+    # Conexoes que o master tenha aberto no preload nao podem ser usadas por dois
+    # processos; o filho descarta as referencias sem fechar as do pai.
+    from app.db.session import engine
+    engine.dispose(close=False)
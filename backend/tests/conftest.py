@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+# Antes de importar o app: banco SQLite temporario, esquema criado no boot e orcamento de
+# queries em modo raise (estouro vira OrcamentoExcedido no TestClient).
+_dir = tempfile.mkdtemp(prefix="bar_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_dir}/test.db"
+os.environ["AUTO_MIGRATE"] = "true"
+os.environ["QUERY_BUDGET_MODE"] = "raise"
+os.environ["BCRYPT_ROUNDS"] = "4"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+@pytest.fixture(scope="session")
+def auth(client):
+    r = client.post("/auth/login", json={"username": settings.SEED_ADMIN_USERNAME, "password": settings.SEED_ADMIN_PASSWORD})
+    assert r.status_code == 200, r.text
+    return {"Authorization": "Bearer " + r.json()["access_token"]}
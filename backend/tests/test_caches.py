@@ -0,0 +1,53 @@
+from sqlalchemy import select
+
+from app.db.session import SessionLocal
+from app.models.models import Produto
+from app.services import bom_cache, catalogo_cache
+
+
+def _criar_produto(client, auth, nome):
+    r = client.post("/produtos", json={"nome": nome, "preco": 5, "estoque_atual": 0, "tipo": "SIMPLES"}, headers=auth)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def test_catalogo_lido_antes_da_invalidacao_nao_fica_no_cache(client, auth):
+    antiga = SessionLocal()
+    try:
+        antiga.execute(select(Produto.id)).all()  # abre a transacao (e o snapshot) antes
+        novo = _criar_produto(client, auth, "Tonica")
+        corpo, _ = catalogo_cache.obter_catalogo(antiga, lambda: b"[]")
+    finally:
+        antiga.close()
+    assert corpo == b"[]"
+    assert catalogo_cache._cache is None
+
+    r = client.get("/produtos", headers=auth)
+    assert novo["id"] in {p["id"] for p in r.json()}
+    # Agora em cache: o build nao roda de novo.
+    db = SessionLocal()
+    try:
+        corpo, etag = catalogo_cache.obter_catalogo(db, lambda: b"nao deveria montar")
+    finally:
+        db.close()
+    assert corpo == r.content and etag == r.headers["etag"]
+
+def test_ficha_lida_antes_da_invalidacao_nao_fica_no_cache(client, auth):
+    cerveja = _criar_produto(client, auth, "Chope")
+    combo = client.post("/produtos", json={"nome": "Balde", "preco": 40, "tipo": "COMBO"}, headers=auth).json()
+    antiga = SessionLocal()
+    try:
+        antiga.execute(select(Produto.id)).all()
+        r = client.post(f"/produtos/{combo['id']}/componentes", json=[
+            {"id_produto_componente": cerveja["id"], "quantidade": 5},
+        ], headers=auth)
+        assert r.status_code == 200, r.text
+        assert combo["id"] not in bom_cache.boms(antiga)  # snapshot antigo
+        assert bom_cache._cache is None
+    finally:
+        antiga.close()
+
+    db = SessionLocal()
+    try:
+        assert bom_cache.componentes_combo(db, combo["id"]) == ((cerveja["id"], 5),)
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from app.db.session import SessionLocal
+from app.services.caixa_service import _totais_do_ledger, totais_caixa
+
+# caixa_totais e somado a cada movimento; precisa bater com o recalculo a partir de
+# caixa_movimentos, com o caixa aberto e depois do fechamento.
+
+
+def _post(client, auth, url, json=None, status=200):
+    r = client.post(url, json=json, headers=auth)
+    assert r.status_code == status, r.text
+    return r.json()
+
+def _conferir(id_caixa: int):
+    with SessionLocal() as db:
+        correntes = {c: Decimal(v) for c, v in totais_caixa(db, id_caixa).items()}
+        assert correntes == _totais_do_ledger(db, id_caixa)
+    return correntes
+
+def test_totais_iguais_aos_movimentos(client, auth):
+    if client.get("/caixa/atual", headers=auth).json():
+        _post(client, auth, "/caixa/fechar", {"saldo_final": 0})
+    caixa = _post(client, auth, "/caixa/abrir", {"saldo_inicial": 150})
+
+    agua = _post(client, auth, "/produtos", {"nome": "Agua com gas", "preco": 6, "estoque_atual": 0, "tipo": "SIMPLES"})["id"]
+    _post(client, auth, f"/produtos/{agua}/entrada", {"quantidade": 50, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+
+    _post(client, auth, "/caixa/movimentos", {"tipo": "REFORCO", "valor": 40})
+    _post(client, auth, "/caixa/movimentos", {"tipo": "SANGRIA", "valor": 25.5})
+    _post(client, auth, "/caixa/movimentos", {"tipo": "AJUSTE", "valor": 1.25})
+    _post(client, auth, "/caixa/movimentos", {"tipo": "VENDA", "valor": 12})
+    _post(client, auth, "/caixa/venda-balcao", {"id_produto": agua, "quantidade": 2})
+    _post(client, auth, "/caixa/venda-balcao-lote", {
+        "itens": [{"id_produto": agua, "quantidade": 3}], "pagamento_tipo": "DINHEIRO", "valor_recebido": 20,
+    })
+    _post(client, auth, "/caixa/venda-balcao-lote", {"itens": [{"id_produto": agua, "quantidade": 1}], "pagamento_tipo": "CARTAO"})
+    mesa = _post(client, auth, "/comandas/", {"mesa": "caixa"})["id"]
+    _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": agua, "quantidade": 4})
+    _post(client, auth, f"/comandas/{mesa}/finalizar")
+
+    t = _conferir(caixa["id"])
+    assert t["vendas"] == Decimal(12 + 12 + 18 + 6 + 24)
+    assert t["vendas_dinheiro"] == Decimal(18) and t["vendas_cartao"] == Decimal(6)
+    assert t["qtd_vendas"] == 5
+
+    _post(client, auth, "/caixa/fechar", {"saldo_final": 200})
+    fechado = _conferir(caixa["id"])
+    assert fechado["qtd_movs"] == t["qtd_movs"] + 1
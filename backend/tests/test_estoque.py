@@ -0,0 +1,69 @@
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.db.session import SessionLocal
+from app.models.models import ItemComanda
+from app.services.estoque_service import saldos_do_ledger, verificar_saldos
+
+# saldos_estoque e materializado: depois de qualquer sequencia de entradas, saidas, vendas,
+# estornos e cancelamentos, precisa bater com a soma do ledger (mov_estoque).
+
+
+def _post(client, auth, url, json=None, status=200):
+    r = client.post(url, json=json, headers=auth)
+    assert r.status_code == status, r.text
+    return r.json()
+
+def _produto(client, auth, nome, estoque_atual=0, tipo="SIMPLES"):
+    return _post(client, auth, "/produtos", {"nome": nome, "preco": 4, "estoque_atual": estoque_atual, "tipo": tipo})["id"]
+
+def test_saldo_igual_a_soma_do_ledger(client, auth):
+    gin = _produto(client, auth, "Gin", estoque_atual=10)  # sem movimentos: vale o estoque_atual
+    vodka = _produto(client, auth, "Vodka")
+    energetico = _produto(client, auth, "Energetico")
+    combo = _produto(client, auth, "Vodka com energetico", tipo="COMBO")
+    _post(client, auth, f"/produtos/{combo}/componentes", [
+        {"id_produto_componente": vodka, "quantidade": 1},
+        {"id_produto_componente": energetico, "quantidade": 2},
+    ])
+    _post(client, auth, f"/produtos/{vodka}/entrada", {"quantidade": 20, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+    _post(client, auth, f"/produtos/{energetico}/entrada", {"quantidade": 30, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+    _post(client, auth, f"/produtos/{energetico}/saida", {"quantidade": 3, "data_saida": "2026-01-02"})
+    _post(client, auth, f"/produtos/{energetico}/saida", {"quantidade": 500, "data_saida": "2026-01-02"}, status=400)
+
+    mesa = _post(client, auth, "/comandas/", {"mesa": "saldo"})["id"]
+    _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": gin, "quantidade": 2})  # primeira baixa
+    _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": vodka, "quantidade": 2})
+    _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": combo, "quantidade": 3})
+    _post(client, auth, f"/comandas/{mesa}/itens/lote", {"itens": [
+        {"id_produto": energetico, "quantidade": 1},
+        {"id_produto": combo, "quantidade": 1},
+        {"id_produto": energetico, "quantidade": 2},
+    ]})
+    _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": combo, "quantidade": 50}, status=400)
+    with SessionLocal() as db:
+        item_combo = db.execute(
+            select(ItemComanda.id).where(ItemComanda.id_comanda == mesa, ItemComanda.id_produto == combo)
+        ).scalars().first()
+    assert client.delete(f"/comandas/itens/{item_combo}", headers=auth).status_code == 200
+    _post(client, auth, f"/comandas/{mesa}/finalizar")
+
+    cancelada = _post(client, auth, "/comandas/", {"mesa": "cancelada"})["id"]
+    _post(client, auth, f"/comandas/{cancelada}/itens", {"id_produto": combo, "quantidade": 2})
+    _post(client, auth, f"/comandas/{cancelada}/cancelar")
+    _post(client, auth, f"/comandas/{cancelada}/cancelar", status=400)
+
+    with SessionLocal() as db:
+        assert verificar_saldos(db) == []
+        ledger = saldos_do_ledger(db)
+    # Conta feita a mao (o combo removido devolve 3 vodkas e 6 energeticos; o cancelamento
+    # devolve tudo). A primeira baixa do gin parte de zero, nao do estoque_atual.
+    assert ledger[energetico][0] == Decimal(30 - 3 - 6 - 1 - 2 - 2 + 6)
+    assert ledger[vodka][0] == Decimal(20 - 2 - 3 - 1 + 3)
+    assert ledger[gin][0] == Decimal(-2)
+
+    saldos = {p["id"]: Decimal(p["saldo_atual"]) for p in client.get("/produtos", headers=auth).json()}
+    assert saldos[energetico] == ledger[energetico][0]
+    assert saldos[vodka] == ledger[vodka][0]
+    assert saldos[gin] == ledger[gin][0]
@@ -0,0 +1,48 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.db.session import WriterSessionLocal
+from app.models.models import Evento
+from app.services.eventos import PERM_CAIXA, PERM_INTERNO, PERM_VENDEDOR, Assinatura, hub, publicar
+
+
+def _assinatura(role: str, user_id: int) -> Assinatura:
+    return Assinatura(asyncio.new_event_loop(), role, user_id)
+
+def _tipos(sub: Assinatura, replay) -> list[str]:
+    tipos = []
+    for id_evento, eventos in replay:
+        msg = sub.filtrar(id_evento, eventos)
+        if msg:
+            tipos += [ev["tipo"] for ev in msg["eventos"]]
+    return tipos
+
+def test_outbox_filtra_por_papel_e_vendedor(client):
+    with WriterSessionLocal() as db:
+        desde = db.execute(select(func.max(Evento.id))).scalar() or 0
+        publicar(db, "teste.saldo", {"x": 1}, perm=PERM_CAIXA)
+        publicar(db, "teste.comanda_7", {"x": 2}, id_vendedor=7)
+        publicar(db, "teste.comanda_8", {"x": 3}, perm=PERM_VENDEDOR, id_vendedor=8)
+        publicar(db, "teste.cache", {"x": 4}, perm=PERM_INTERNO)
+        publicar(db, "teste.saldo", {"x": 5}, perm=PERM_CAIXA, chave="saldo")
+        publicar(db, "teste.saldo", {"x": 6}, perm=PERM_CAIXA, chave="saldo")  # colapsa no ultimo
+        db.commit()
+        ate = db.execute(select(func.max(Evento.id))).scalar()
+    # Uma transacao, uma linha na outbox.
+    assert ate == desde + 1
+    replay = hub.replay(desde, ate)
+
+    assert _tipos(_assinatura("ADMIN", 1), replay) == ["teste.saldo", "teste.comanda_7", "teste.comanda_8", "teste.saldo"]
+    assert _tipos(_assinatura("VENDEDOR", 7), replay) == ["teste.saldo", "teste.comanda_7", "teste.saldo"]
+    assert _tipos(_assinatura("CAIXA", 9), replay) == ["teste.saldo", "teste.saldo"]
+    dados = [ev["dados"] for _, eventos in replay for ev in eventos if ev["tipo"] == "teste.saldo"]
+    assert dados == [{"x": 1}, {"x": 6}]
+
+def test_rollback_descarta_eventos(client):
+    with WriterSessionLocal() as db:
+        desde = db.execute(select(func.max(Evento.id))).scalar() or 0
+        publicar(db, "teste.descartado", {}, perm=PERM_CAIXA)
+        db.rollback()
+        db.commit()
+        assert (db.execute(select(func.max(Evento.id))).scalar() or 0) == desde
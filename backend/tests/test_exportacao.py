@@ -0,0 +1,30 @@
+import gzip
+
+from sqlalchemy import select
+
+from app.db.session import engine
+from app.models.models import Produto
+from app.services import exportacao
+
+
+def test_exportar_itens_comanda_em_gzip(client, auth):
+    r = client.get("/exportar/itens-comanda?formato=ndjson&gzip=true&desde=2020-01-01T00:00:00", headers=auth)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "application/gzip"
+    assert 'itens_comanda.ndjson.gz' in r.headers["content-disposition"]
+    gzip.decompress(r.content)  # gzip valido, mesmo sem linhas
+
+def test_stream_fechado_no_meio_devolve_a_conexao(client, auth, monkeypatch):
+    for nome in ("Exp1", "Exp2", "Exp3"):
+        r = client.post("/produtos", json={"nome": nome, "preco": 1, "estoque_atual": 0, "tipo": "SIMPLES"}, headers=auth)
+        assert r.status_code == 200, r.text
+    monkeypatch.setattr(exportacao, "LINHAS_POR_BLOCO", 1)
+    em_uso = engine.pool.checkedout()
+
+    rows = exportacao.linhas_do_banco(select(Produto.id, Produto.nome).order_by(Produto.id))
+    corpo = exportacao.gzip_stream(exportacao.csv_stream(["id", "nome"], rows))
+    while engine.pool.checkedout() == em_uso:
+        next(corpo)  # ate o cursor abrir
+    # Cliente desconectou: o servidor so fecha o gerador de fora.
+    corpo.close()
+    assert engine.pool.checkedout() == em_uso
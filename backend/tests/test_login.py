@@ -0,0 +1,43 @@
+from passlib.hash import bcrypt
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.db.session import WriterSessionLocal
+from app.models.models import User
+from app.routes.auth import throttle_ip, throttle_usuario
+
+
+def _criar_usuario(client, auth, username, password="segredo1"):
+    r = client.post("/admin/vendedores", json={"nome": username, "username": username, "password": password}, headers=auth)
+    assert r.status_code == 200, r.text
+    return r.json()["id"]
+
+def _login(client, username, password):
+    return client.post("/auth/login", json={"username": username, "password": password})
+
+def test_bloqueio_por_usuario_e_ip(client, auth):
+    _criar_usuario(client, auth, "garcom_throttle")
+    try:
+        for _ in range(settings.LOGIN_MAX_FALHAS):
+            assert _login(client, "garcom_throttle", "errada").status_code == 401
+        r = _login(client, "garcom_throttle", "segredo1")
+        assert r.status_code == 429 and int(r.headers["retry-after"]) > 0
+        # O bloqueio vale para este IP; o dono da conta, de outro lugar, continua entrando.
+        assert throttle_usuario.retry_after("garcom_throttle|10.0.0.99") == 0
+    finally:
+        throttle_usuario.sucesso("garcom_throttle|testclient")
+        throttle_ip.sucesso("testclient")
+    assert _login(client, "garcom_throttle", "segredo1").status_code == 200
+
+def test_hash_com_outro_custo_e_refeito_no_login(client, auth):
+    id_user = _criar_usuario(client, auth, "garcom_rehash")
+    antigo = bcrypt.using(rounds=settings.BCRYPT_ROUNDS + 1).hash("segredo1")
+    with WriterSessionLocal() as db:
+        db.execute(update(User).where(User.id == id_user).values(password_hash=antigo))
+        db.commit()
+
+    assert _login(client, "garcom_rehash", "segredo1").status_code == 200
+    with WriterSessionLocal() as db:
+        novo = db.execute(select(User.password_hash).where(User.id == id_user)).scalar_one()
+    assert novo != antigo and novo.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+    assert _login(client, "garcom_rehash", "segredo1").status_code == 200
@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from app.db import migrations
+from app.db.migrations import EsquemaDesatualizado, migrar, pendentes, verificar_versao
+
+
+@pytest.fixture
+def banco(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migracoes.db")
+    yield engine
+    engine.dispose()
+
+def test_banco_vazio_vai_ate_a_ultima_versao(banco):
+    with pytest.raises(EsquemaDesatualizado):
+        verificar_versao(banco)
+    aplicadas = migrar(banco)
+    assert [m["versao"] for m in aplicadas] == [v for v, _, _ in migrations.MIGRACOES]
+    assert verificar_versao(banco) == migrations.VERSAO
+    assert pendentes(banco) == []
+    assert migrar(banco) == []  # idempotente
+
+def test_banco_na_versao_4_recebe_o_indice_de_itens(banco, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRACOES", migrations.MIGRACOES[:4])
+    migrar(banco)
+    with banco.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_itens_comanda_criado_em")
+    monkeypatch.undo()
+
+    with pytest.raises(EsquemaDesatualizado, match="versao 4"):
+        verificar_versao(banco)
+    assert [v for v, _ in pendentes(banco)] == [5]
+    assert [m["versao"] for m in migrar(banco)] == [5]
+    indices = {i["name"] for i in inspect(banco).get_indexes("itens_comanda")}
+    assert "ix_itens_comanda_criado_em" in indices
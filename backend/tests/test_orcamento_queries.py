@@ -0,0 +1,126 @@
+import pytest
+from sqlalchemy import select
+
+from app.core.query_budget import OrcamentoExcedido
+from app.models.models import ItemComanda, SaldoEstoque
+from app.routes import produtos as produtos_routes
+from app.services import comanda_service
+
+# As rotas quentes rodam com QUERY_BUDGET_MODE=raise (ver conftest.py): passar do orcamento
+# declarado em @orcamento_queries ou repetir a mesma statement (N+1) derruba o teste.
+
+
+def _post(client, auth, url, json=None, status=200):
+    r = client.post(url, json=json, headers=auth)
+    assert r.status_code == status, r.text
+    return r.json()
+
+def _get(client, auth, url, status=200, headers=None):
+    r = client.get(url, headers={**auth, **(headers or {})})
+    assert r.status_code == status, r.text
+    return r
+
+@pytest.fixture(scope="module")
+def catalogo(client, auth):
+    produtos = {}
+    for nome in ("Cerveja", "Refri", "Agua", "Limao", "Gelo"):
+        p = _post(client, auth, "/produtos", {"nome": nome, "preco": 10, "estoque_atual": 0, "tipo": "SIMPLES"})
+        _post(client, auth, f"/produtos/{p['id']}/entrada", {"quantidade": 500, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+        produtos[nome] = p["id"]
+    combo = _post(client, auth, "/produtos", {"nome": "Combo", "preco": 25, "tipo": "COMBO"})
+    _post(client, auth, f"/produtos/{combo['id']}/componentes", [
+        {"id_produto_componente": produtos["Cerveja"], "quantidade": 2},
+        {"id_produto_componente": produtos["Limao"], "quantidade": 1},
+        {"id_produto_componente": produtos["Gelo"], "quantidade": 1},
+    ])
+    produtos["Combo"] = combo["id"]
+    _post(client, auth, "/caixa/abrir", {"saldo_inicial": 100})
+    return produtos
+
+def test_catalogo(client, auth, catalogo):
+    r = _get(client, auth, "/produtos")
+    assert set(catalogo.values()) <= {p["id"] for p in r.json()}
+    _get(client, auth, "/produtos", status=304, headers={"If-None-Match": r.headers["etag"]})
+
+def test_fluxo_da_comanda(client, auth, catalogo):
+    comandas = [_post(client, auth, "/comandas/", {"mesa": str(m)}) for m in range(1, 8)]
+    com = comandas[0]
+    _post(client, auth, f"/comandas/{com['id']}/itens", {"id_produto": catalogo["Cerveja"], "quantidade": 2})
+    _post(client, auth, f"/comandas/{com['id']}/itens", {"id_produto": catalogo["Combo"], "quantidade": 1})
+    _post(client, auth, f"/comandas/{com['id']}/itens/lote", {"itens": [
+        {"id_produto": catalogo[nome], "quantidade": 1} for nome in ("Refri", "Agua", "Gelo", "Combo", "Cerveja")
+    ]})
+    # Varias comandas abertas e varios itens: a listagem nao pode fazer uma query por linha.
+    assert len(_get(client, auth, "/comandas/abertas").json()) == len(comandas)
+    itens = _get(client, auth, f"/comandas/{com['id']}/itens").json()
+    assert len(itens) == 7
+
+    # Remover o combo estorna cada componente (pior caso da rota).
+    combo = next(i for i in itens if i["id_produto"] == catalogo["Combo"])
+    r = client.delete(f"/comandas/itens/{combo['id']}", headers=auth)
+    assert r.status_code == 200, r.text
+    _post(client, auth, f"/comandas/{com['id']}/finalizar")
+    _get(client, auth, "/comandas/resumo-dia")
+
+def test_venda_balcao(client, auth, catalogo):
+    _post(client, auth, "/caixa/venda-balcao", {"id_produto": catalogo["Agua"], "quantidade": 2})
+    _post(client, auth, "/caixa/venda-balcao-lote", {
+        "itens": [{"id_produto": catalogo[nome], "quantidade": 1} for nome in ("Cerveja", "Refri", "Combo", "Limao")],
+        "pagamento_tipo": "DINHEIRO",
+        "valor_recebido": 100,
+    })
+
+def test_n_mais_um_estoura_o_orcamento(client, auth, catalogo, monkeypatch):
+    # Regressao simulada: o catalogo volta a buscar o saldo produto a produto.
+    original = produtos_routes.produtos_to_display
+
+    def por_linha(db, produtos):
+        for p in produtos:
+            db.get(SaldoEstoque, p.id)
+        return original(db, produtos)
+
+    monkeypatch.setattr(produtos_routes, "produtos_to_display", por_linha)
+    _post(client, auth, "/produtos", {"nome": "Suco", "preco": 8, "estoque_atual": 0, "tipo": "SIMPLES"})  # invalida o cache
+    with pytest.raises(OrcamentoExcedido, match="saldos_estoque"):
+        client.get("/produtos", headers=auth)
+
+def _lote_comanda(client, auth, itens):
+    com = _post(client, auth, "/comandas/", {"mesa": "lote"})
+    return client.post(f"/comandas/{com['id']}/itens/lote", json={"itens": itens}, headers=auth)
+
+def _lote_balcao(client, auth, itens):
+    return client.post("/caixa/venda-balcao-lote", json={"itens": itens, "pagamento_tipo": "CARTAO"}, headers=auth)
+
+@pytest.mark.parametrize("vender", [_lote_comanda, _lote_balcao])
+def test_lote_acima_do_custo_por_produto(client, auth, catalogo, monkeypatch, vender):
+    # As rotas em lote podem uma statement de cada forma por produto; uma query extra por
+    # produto (aqui, reler o saldo depois da baixa) passa do maximo declarado.
+    original = comanda_service.baixar_saldo
+
+    def relendo(db, id_produto, *args):
+        res = original(db, id_produto, *args)
+        db.execute(select(SaldoEstoque.saldo).where(SaldoEstoque.id_produto == id_produto)).all()
+        return res
+
+    monkeypatch.setattr(comanda_service, "baixar_saldo", relendo)
+    itens = [{"id_produto": catalogo[nome], "quantidade": 1} for nome in ("Cerveja", "Refri", "Agua")]
+    with pytest.raises(OrcamentoExcedido, match=r"queries \(orcamento"):
+        vender(client, auth, itens)
+
+def test_finalizar_repete_mais_que_os_produtos(client, auth, catalogo, monkeypatch):
+    # Tres itens do mesmo produto: o rollup faz um upsert so, e ler os itens um a um
+    # repete a mesma statement mais vezes que os produtos da comanda.
+    com = _post(client, auth, "/comandas/", {"mesa": "n+1"})
+    for _ in range(3):
+        _post(client, auth, f"/comandas/{com['id']}/itens", {"id_produto": catalogo["Refri"], "quantidade": 1})
+    original = comanda_service.registrar_venda_comanda
+
+    def item_a_item(db, comanda, *args):
+        ids = db.execute(select(ItemComanda.id).where(ItemComanda.id_comanda == comanda.id)).scalars().all()
+        for id_item in ids:
+            db.execute(select(ItemComanda).where(ItemComanda.id == id_item)).all()
+        return original(db, comanda, *args)
+
+    monkeypatch.setattr(comanda_service, "registrar_venda_comanda", item_a_item)
+    with pytest.raises(OrcamentoExcedido, match="3x SELECT itens_comanda"):
+        client.post(f"/comandas/{com['id']}/finalizar", headers=auth)
@@ -0,0 +1,37 @@
+# Paginacao por cursor de /produtos/movimentos: percorrer as paginas devolve a listagem
+# completa, na mesma ordem, sem repetir nem pular movimentos (inclusive com data_hora empatada).
+
+
+def _post(client, auth, url, json=None):
+    r = client.post(url, json=json, headers=auth)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def test_movimentos_por_cursor(client, auth):
+    produto = _post(client, auth, "/produtos", {"nome": "Cachaca", "preco": 3, "estoque_atual": 0, "tipo": "SIMPLES"})["id"]
+    for q in range(1, 8):
+        _post(client, auth, f"/produtos/{produto}/entrada", {"quantidade": q, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+
+    r = client.get("/produtos/movimentos", params={"id_produto": produto, "limit": 1000}, headers=auth)
+    assert r.status_code == 200, r.text
+    assert "X-Next-Cursor" not in r.headers
+    completa = [m["id"] for m in r.json()]
+    assert len(completa) == 7
+
+    paginas, cursor = [], None
+    while True:
+        params = {"id_produto": produto, "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/produtos/movimentos", params=params, headers=auth)
+        assert r.status_code == 200, r.text
+        paginas.append([m["id"] for m in r.json()])
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [len(p) for p in paginas] == [3, 3, 1]
+    assert [i for p in paginas for i in p] == completa
+
+def test_cursor_invalido(client, auth):
+    r = client.get("/produtos/movimentos", params={"cursor": "lixo"}, headers=auth)
+    assert r.status_code == 400
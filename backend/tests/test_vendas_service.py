@@ -0,0 +1,66 @@
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import WriterSessionLocal
+from app.models.models import BR_TZ, VendaDiaProduto, VendaDiaVendedor
+from app.services.vendas_service import CANAL_COMANDA, dia_negocio, inicio_dia_negocio, rebuild_vendas_dia
+
+
+def test_dia_negocio_vira_no_corte(monkeypatch):
+    monkeypatch.setattr(settings, "DIA_NEGOCIO_CORTE_H", 6)
+    assert dia_negocio(datetime(2026, 3, 7, 2, 30, tzinfo=BR_TZ)) == date(2026, 3, 6)
+    assert dia_negocio(datetime(2026, 3, 7, 5, 59)) == date(2026, 3, 6)
+    assert dia_negocio(datetime(2026, 3, 7, 6, 0)) == date(2026, 3, 7)
+    assert inicio_dia_negocio(date(2026, 3, 6)) == datetime(2026, 3, 6, 6, 0, tzinfo=BR_TZ)
+
+def test_dia_negocio_sem_corte(monkeypatch):
+    monkeypatch.setattr(settings, "DIA_NEGOCIO_CORTE_H", 0)
+    assert dia_negocio(datetime(2026, 3, 7, 0, 1)) == date(2026, 3, 7)
+
+def _post(client, auth, url, json=None, status=200):
+    r = client.post(url, json=json, headers=auth)
+    assert r.status_code == status, r.text
+    return r.json()
+
+def _rollups(db):
+    produtos = db.execute(
+        select(VendaDiaProduto.dia, VendaDiaProduto.id_produto, VendaDiaProduto.id_vendedor, VendaDiaProduto.quantidade, VendaDiaProduto.total)
+        .where(VendaDiaProduto.canal == CANAL_COMANDA)
+    ).all()
+    vendedores = db.execute(
+        select(VendaDiaVendedor.dia, VendaDiaVendedor.id_vendedor, VendaDiaVendedor.qtd_vendas, VendaDiaVendedor.total)
+        .where(VendaDiaVendedor.canal == CANAL_COMANDA)
+    ).all()
+    return sorted(map(tuple, produtos)), sorted(map(tuple, vendedores))
+
+def test_rollups_iguais_ao_rebuild(client, auth):
+    # Os rollups somados a cada finalizacao tem que ser os mesmos que o rebuild recalcula
+    # das comandas finalizadas (item removido e comanda cancelada nao contam).
+    ids = []
+    for nome in ("Caipirinha", "Porcao"):
+        p = _post(client, auth, "/produtos", {"nome": nome, "preco": 18, "estoque_atual": 0, "tipo": "SIMPLES"})
+        _post(client, auth, f"/produtos/{p['id']}/entrada", {"quantidade": 40, "data_entrada": "2026-01-01", "validade": "2027-01-01"})
+        ids.append(p["id"])
+    for qtds in ((1, 2), (3, 0)):
+        mesa = _post(client, auth, "/comandas/", {"mesa": "rollup"})["id"]
+        _post(client, auth, f"/comandas/{mesa}/itens/lote", {"itens": [
+            {"id_produto": pid, "quantidade": q} for pid, q in zip(ids, qtds) if q
+        ]})
+        _post(client, auth, f"/comandas/{mesa}/itens", {"id_produto": ids[0], "quantidade": 1})
+        _post(client, auth, f"/comandas/{mesa}/finalizar")
+    cancelada = _post(client, auth, "/comandas/", {"mesa": "rollup"})["id"]
+    _post(client, auth, f"/comandas/{cancelada}/itens", {"id_produto": ids[1], "quantidade": 5})
+    _post(client, auth, f"/comandas/{cancelada}/cancelar")
+
+    db = WriterSessionLocal()
+    try:
+        incrementais = _rollups(db)
+        assert any(r[1] == ids[0] and r[3] == 6 for r in incrementais[0])
+        rebuild_vendas_dia(db)
+        db.flush()
+        assert _rollups(db) == incrementais
+    finally:
+        db.rollback()
+        db.close()